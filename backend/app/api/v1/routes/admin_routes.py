@@ -0,0 +1,235 @@
+# app/api/v1/routes/admin_routes.py
+from fastapi import APIRouter, Depends, Query, HTTPException
+from fastapi.responses import FileResponse, PlainTextResponse
+from datetime import datetime, timedelta
+from pymongo import DESCENDING
+from app.db.mongodb import get_database, get_analytics_database, pool_stats
+from app.core.auth import require_admin
+from app.services.analytics_views import refresh_all_views
+from app.services.rule_engine import rule_engine
+from app.services.login_audit import login_audit, login_enrichment
+from app.api.v1.routes.transaction_route import transaction_enrichment
+from app.utils.ip_utils import ip_reputation
+from app.core.dsa.entity_graph import entity_graph
+from app.services.anomaly_feed import anomaly_feed
+from app.core.cache import response_cache
+from app.core.rate_limit import rate_limiter
+from app.core.idempotency import idempotency
+from app.services.partitions import user_partitions
+from app.services.change_streams import change_streams
+from app.core.dsa.user_state_cache import user_state
+from app.core.profiling import request_profiler
+from app.core.tracing import trace_recorder
+from app.services.redis_warmup import start_warmup, warmup_status
+
+# every route is admin-only; the per-route dependency is what handlers receive
+router = APIRouter(prefix="/admin", tags=["Admin"], dependencies=[Depends(require_admin)])
+
+
+# ========== ANALYTICS (materialized views, see services/analytics_views.py) ==========
+
+@router.get("/analytics/anomalies-hourly")
+async def anomalies_hourly(
+    hours: int = Query(default=24, ge=1, le=24 * 90),
+    anomaly_type: str | None = None,
+    db=Depends(get_analytics_database),
+    current_user=Depends(require_admin)
+):
+    q = {"hour": {"$gte": datetime.utcnow() - timedelta(hours=hours)}}
+    if anomaly_type:
+        q["anomaly_type"] = anomaly_type
+    cursor = db.mv_anomalies_hourly.find(q, {"_id": 0}).sort("hour", DESCENDING)
+    return await cursor.to_list(length=None)
+
+
+@router.get("/analytics/risky-users")
+async def top_risky_users(
+    limit: int = Query(default=20, le=200),
+    sort_by: str = Query(default="score_sum", pattern="^(score_sum|anomaly_count)$"),
+    db=Depends(get_analytics_database),
+    current_user=Depends(require_admin)
+):
+    cursor = db.mv_risky_users.find().sort(sort_by, DESCENDING).limit(limit)
+    users = await cursor.to_list(length=limit)
+    return [{"user_id": u.pop("_id"), **u} for u in users]
+
+
+@router.get("/analytics/category-volume")
+async def category_volume(
+    days: int = Query(default=30, ge=1, le=365),
+    category: str | None = None,
+    db=Depends(get_analytics_database),
+    current_user=Depends(require_admin)
+):
+    q = {"day": {"$gte": datetime.utcnow() - timedelta(days=days)}}
+    if category:
+        q["category"] = category
+    cursor = db.mv_category_volume.find(q, {"_id": 0}).sort("day", DESCENDING)
+    return await cursor.to_list(length=None)
+
+
+@router.post("/analytics/refresh")
+async def refresh_analytics(db=Depends(get_database), current_user=Depends(require_admin)):
+    return {"refreshed": await refresh_all_views(db)}
+
+
+# ========== FRAUD RULES ==========
+
+@router.get("/rules/stats")
+async def rule_stats(current_user=Depends(require_admin)):
+    return rule_engine.stats()
+
+
+@router.post("/rules/reload")
+async def reload_rules(current_user=Depends(require_admin)):
+    reloaded = rule_engine.reload(force=True)
+    return {"reloaded": reloaded, "last_error": rule_engine.last_error, "rules": len(rule_engine.rules)}
+
+
+# ========== PIPELINES ==========
+
+@router.get("/pipelines/login-audit")
+async def login_audit_stats(current_user=Depends(require_admin)):
+    return login_audit.snapshot()
+
+
+@router.get("/pipelines/anomaly-feed")
+async def anomaly_feed_stats(current_user=Depends(require_admin)):
+    return anomaly_feed.snapshot()
+
+
+@router.get("/pipelines/change-streams")
+async def change_stream_stats(current_user=Depends(require_admin)):
+    return change_streams.snapshot()
+
+
+@router.get("/mongo/pools")
+async def mongo_pool_stats(current_user=Depends(require_admin)):
+    return pool_stats()
+
+
+@router.get("/rate-limit/stats")
+async def rate_limit_stats(current_user=Depends(require_admin)):
+    return rate_limiter.snapshot()
+
+
+@router.get("/pipelines/user-partitions")
+async def user_partition_stats(current_user=Depends(require_admin)):
+    return user_partitions.snapshot()
+
+
+@router.post("/pipelines/user-partitions/resize")
+async def resize_user_partitions(
+    partitions: int = Query(ge=1, le=1024),
+    current_user=Depends(require_admin)
+):
+    await user_partitions.resize(partitions)
+    return user_partitions.snapshot()
+
+
+@router.get("/cache/user-state")
+async def user_state_stats(current_user=Depends(require_admin)):
+    return user_state.snapshot()
+
+
+@router.get("/idempotency/stats")
+async def idempotency_stats(current_user=Depends(require_admin)):
+    return idempotency.stats
+
+
+@router.get("/cache/stats")
+async def cache_stats(current_user=Depends(require_admin)):
+    return response_cache.snapshot()
+
+
+@router.post("/redis/warmup")
+async def redis_warmup(
+    run_id: str = "default",
+    partitions: int = Query(default=8, ge=1, le=256),
+    workers: int = Query(default=4, ge=1, le=64),
+    restart: bool = False,
+    overwrite: bool = False,
+    db=Depends(get_analytics_database),
+    current_user=Depends(require_admin)
+):
+    # rebuild recent lists / last device / last IP in Redis from Mongo (resumes by run_id);
+    # scans whole collections and, with overwrite, replaces live keys: admin only, and logged
+    started = start_warmup(db, restart=restart, run_id=run_id, partitions=partitions,
+                           workers=workers, overwrite=overwrite)
+    if started:
+        print(f"🔥 Redis warmup {run_id} started by {current_user['id']} (overwrite={overwrite}, restart={restart})")
+    return {"started": started, **warmup_status()}
+
+
+@router.get("/redis/warmup")
+async def redis_warmup_progress(current_user=Depends(require_admin)):
+    return warmup_status()
+
+
+@router.get("/traces")
+async def list_traces(
+    min_ms: float = 0,
+    path: str | None = None,
+    limit: int = Query(default=100, le=1000),
+    current_user=Depends(require_admin)
+):
+    return {
+        "stats": trace_recorder.stats,
+        "slow_ms": trace_recorder.slow_ms,
+        "traces": trace_recorder.recent(min_ms=min_ms, path=path, limit=limit),
+    }
+
+
+@router.get("/traces/{request_id}")
+async def get_trace(request_id: str, current_user=Depends(require_admin)):
+    trace = trace_recorder.get(request_id)
+    if trace is None:
+        raise HTTPException(status_code=404, detail="Trace not found (it may have rotated out of the buffer)")
+    return trace.to_dict()
+
+
+@router.get("/profiles")
+async def list_profiles(
+    route: str | None = None,
+    limit: int = Query(default=100, le=1000),
+    current_user=Depends(require_admin)
+):
+    profiles = request_profiler.list()
+    if route:
+        profiles = [p for p in profiles if p["route"] == route]
+    return {"stats": request_profiler.stats, "mode": request_profiler.mode, "profiles": profiles[:limit]}
+
+
+@router.get("/profiles/{route}/{name}")
+async def get_profile(
+    route: str,
+    name: str,
+    raw: bool = False,
+    sort: str = Query(default="cumulative", pattern="^(cumulative|tottime|calls)$"),
+    current_user=Depends(require_admin)
+):
+    path = request_profiler.path_of(route, name)
+    if not path:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    # cProfile dumps are binary; render them as pstats text unless the raw file is asked for
+    if path.endswith(".prof") and not raw:
+        return PlainTextResponse(request_profiler.pstats_text(path, sort=sort))
+    return FileResponse(path, filename=name)
+
+
+@router.get("/pipelines/enrichment")
+async def enrichment_stats(current_user=Depends(require_admin)):
+    return {
+        "transaction": {"budget_ms": transaction_enrichment.budget_ms, "enrichers": transaction_enrichment.stats},
+        "login": {"budget_ms": login_enrichment.budget_ms, "enrichers": login_enrichment.stats},
+    }
+
+
+@router.get("/ip-reputation/stats")
+async def ip_reputation_stats(current_user=Depends(require_admin)):
+    return ip_reputation.stats()
+
+
+@router.get("/entity-graph/users/{user_id}")
+async def user_ring(user_id: str, current_user=Depends(require_admin)):
+    return entity_graph.component(user_id) or {"users": 0}
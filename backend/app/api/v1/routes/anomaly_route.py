@@ -1,8 +1,38 @@
-from fastapi import APIRouter
+from fastapi import APIRouter, Depends, Query, Request
+from fastapi.responses import StreamingResponse
 from app.db.models.anomaly_model import AnomalyModel
+from app.core.dsa.redis_dsa import publish_anomaly_event
+from app.core.auth import get_current_user
+from app.services.anomaly_feed import sse_events
+from app.core.tracing import span
 
 router = APIRouter(prefix="/anomalies", tags=["Anomalies"])
 
+
+@router.get("/stream")
+async def stream_anomalies(
+    request: Request,
+    types: str | None = Query(default=None, description="comma separated, e.g. transaction,login,score_update"),
+    current_user=Depends(get_current_user)
+):
+    """
+    Server-sent events: the caller's new anomalies and score updates as they happen.
+
+    There is no admin role, so the feed is always scoped to the authenticated
+    user. Auth is the usual bearer header, which the browser EventSource API
+    cannot send: dashboards read the stream with fetch() (or an EventSource
+    polyfill that supports headers) instead.
+    """
+    return StreamingResponse(
+        sse_events(
+            request,
+            user_id=current_user["id"],
+            types={t.strip() for t in types.split(",") if t.strip()} if types else None,
+        ),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
 async def handle_anomaly(data: dict, db):
     """
     data format:
@@ -11,6 +41,8 @@ async def handle_anomaly(data: dict, db):
         "event_type": "transaction" | "login",
         "event_data": {...}
     }
+    The caller persists the event itself (transactions / login_logs); this
+    only records anomalies in anomaly_logs and publishes them to the feed.
     """
 
     is_anomaly = data["is_anomaly"]
@@ -22,10 +54,20 @@ async def handle_anomaly(data: dict, db):
         anomaly_doc = AnomalyModel(
             user_id=event_data.get("user_id"),
             anomaly_type=event_type,
+            anomaly_score=event_data.get("risk_score"),
             details=event_data
         )
 
-        await db.anomaly_logs.insert_one(anomaly_doc.dict())
+        with span("mongo.insert_one", collection="anomaly_logs"):
+            inserted = await db.anomaly_logs.insert_one(anomaly_doc.dict())
+        publish_anomaly_event({
+            "event": "anomaly",
+            "anomaly_id": str(inserted.inserted_id),
+            "score": event_data.get("risk_score"),
+            "user_id": anomaly_doc.user_id,
+            "type": event_type,
+            "details": event_data.get("rule_reasons"),
+        })
 
         return {
             "status": "anomaly_detected",
@@ -33,14 +75,9 @@ async def handle_anomaly(data: dict, db):
         }
 
     # ---------- NORMAL BEHAVIOUR ----------
+    # the caller has already persisted the event itself; inserting it here again
+    # would double count every normal event downstream (views, rollups, replay, training)
     else:
-        # Insert normal event into respective collection
-        if event_type == "transaction":
-            await db.transactions.insert_one({**event_data, "is_anomaly": False})
-
-        elif event_type == "login":
-            await db.login_logs.insert_one({**event_data, "is_anomaly": False})
-
         return {
             "status": "normal",
             "message": f"Normal {event_type} saved successfully."
@@ -63,16 +63,17 @@
 
 
 # app/api/v1/routes/login_log_route.py
-from fastapi import APIRouter, Depends, Request, HTTPException
+from fastapi import APIRouter, Depends, Request, HTTPException, Query
 from app.schemas.login_log_schema import LoginLogCreate, LoginLogResponse
 from app.db.models.login_log_model import LoginLogModel
 from app.utils.ip_utils import get_client_ip
 from app.utils.geoip_utils import get_location_from_ip
 from app.core.auth import get_current_user
-from app.db.mongodb import get_database
+from app.db.mongodb import get_database, get_analytics_database
 from typing import List, Optional
 from datetime import datetime, timedelta
 from bson import ObjectId
+from app.core.cache import response_cache
 
 # Redis DSA imports
 from app.core.dsa.redis_dsa import (
@@ -90,67 +91,55 @@ async def get_my_login_logs(
     limit: int = Query(default=50, le=100),
     skip: int = Query(default=0, ge=0),
     current_user=Depends(get_current_user),
-    db=Depends(get_database)
+    db=Depends(get_analytics_database)
 ):
-
     user_id = current_user["id"]
-    email = current_user.get("email")
-
-    # --- IP + Location ---
-    ip_address = get_client_ip(request)
-    location = get_location_from_ip(ip_address)
-
-    # --- Redis: Sliding Window Login Attempts ---
-    attempts_in_last_minute = record_login_attempt(user_id)
 
-    # --- Redis: Quick Access ---
-    set_last_ip(user_id, ip_address)
-    set_last_device(user_id, data.device_id or "unknown-device")
+    async def load():
+        cursor = db.login_logs.find({"user_id": user_id}).sort("login_time", -1).skip(skip).limit(limit)
+        logs = await cursor.to_list(length=limit)
+        for log in logs:
+            log["id"] = str(log.pop("_id"))
+        return logs
 
-    # --- Find last login in Mongo ---
-    last_log = await db.login_logs.find_one(
-        {"user_id": user_id},
-        sort=[("_id", -1)]
+    # cached per user; the login audit pipeline bumps the user's version
+    return await response_cache.get_or_compute(
+        "login_logs:my_logs", user_id, {"limit": limit, "skip": skip}, load
     )
 
-    previous_login_time = last_log["login_time"] if last_log else None
-
-    # Total log count
-    login_attempts = await db.login_logs.count_documents({"user_id": user_id})
-
-    # --- Create Login Log Object ---
-    log = LoginLogModel(
-        user_id=user_id,
-        email=email,
-        device_id=data.device_id or "unknown-device",
-        ip_address=ip_address,
-        location=location,
-        login_attempts=login_attempts + 1,
-        previous_login_time=previous_login_time
-    )
 
-    # Insert into MongoDB
-    result = await db.login_logs.insert_one(log.model_dump())
-
-    # --- Write to Redis Recent Login Queue ---
-    push_recent_login(user_id, log.model_dump())
+@router.get("/stats")
+async def get_my_login_stats(
+    current_user=Depends(get_current_user),
+    db=Depends(get_analytics_database)
+):
+    user_id = current_user["id"]
 
-    return LoginLogResponse(
-        id=str(result.inserted_id),
-        **log.model_dump()
-    )
-    
-    return {
-        "total_logins": total_logins,
-        "failed_attempts_30d": failed_logins,
-        "unique_devices": len(devices),
-        "unique_locations": len(locations),
-        "last_login": {
-            "time": last_login["login_time"] if last_login else None,
-            "device": last_login.get("device_name") if last_login else None,
-            "location": last_login.get("location", {}).get("city") if last_login else None
-        } if last_login else None
-    }
+    async def load():
+        since = datetime.utcnow() - timedelta(days=30)
+        total_logins = await db.login_logs.count_documents({"user_id": user_id})
+        failed_logins = await db.login_logs.count_documents(
+            {"user_id": user_id, "status": "failed", "login_time": {"$gte": since}}
+        )
+        devices = await db.login_logs.distinct("device_id", {"user_id": user_id})
+        locations = await db.login_logs.distinct("location.city", {"user_id": user_id})
+        last_login = await db.login_logs.find_one(
+            {"user_id": user_id, "status": "success"}, sort=[("login_time", -1)]
+        )
+
+        return {
+            "total_logins": total_logins,
+            "failed_attempts_30d": failed_logins,
+            "unique_devices": len(devices),
+            "unique_locations": len(locations),
+            "last_login": {
+                "time": last_login["login_time"] if last_login else None,
+                "device": last_login.get("device_name") if last_login else None,
+                "location": (last_login.get("location") or {}).get("city") if last_login else None
+            } if last_login else None
+        }
+
+    return await response_cache.get_or_compute("login_logs:stats", user_id, None, load)
 
 
 # ========== ADMIN ENDPOINTS (Optional) ==========
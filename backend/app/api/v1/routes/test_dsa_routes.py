@@ -3,7 +3,7 @@ from fastapi import APIRouter, Depends
 from app.schemas.transaction_schema import TransactionCreate
 from app.schemas.login_log_schema import LoginLogCreate
 from app.schemas.anomaly_schema import AnomalyCreate
-from app.db.mongodb import get_database
+from app.db.mongodb import get_database, get_analytics_database
 from app.core.dsa.redis_dsa import (
     push_recent_txn, get_recent_txns,
     push_recent_login, get_recent_logins,
@@ -31,7 +31,7 @@ async def recent_transactions(user_id: str):
     return get_recent_txns(user_id)
 
 @router.get("/transactions/query")
-async def transactions_query(user_id: str | None = None, from_ts: str | None = None, to_ts: str | None = None, sort_by: str = "anomaly_score", limit: int = 100, db=Depends(get_database)):
+async def transactions_query(user_id: str | None = None, from_ts: str | None = None, to_ts: str | None = None, sort_by: str = "anomaly_score", limit: int = 100, db=Depends(get_analytics_database)):
     from_dt = datetime.fromisoformat(from_ts) if from_ts else None
     to_dt = datetime.fromisoformat(to_ts) if to_ts else None
     m = MongoDSA(db)
@@ -1,43 +1,103 @@
-from fastapi import APIRouter, Depends, Request
+from fastapi import APIRouter, Depends, Request, Query, Response, Header
 from datetime import datetime
-from app.db.mongodb import get_database
+from app.db.mongodb import get_database, get_analytics_database
 from app.schemas.transaction_schema import TransactionCreate
 from app.db.models.transaction_model import TransactionModel
-from app.utils.geoip_utils import get_location_from_ip
-from app.utils.ip_utils import get_client_ip
+from app.utils.ip_utils import get_client_ip, check_vpn_tor, get_geolocation
 from app.utils.device_utils import get_device_id
 from app.api.v1.routes.anomaly_route import handle_anomaly
-from app.core.dsa.redis_dsa import push_recent_txn
+from app.core.dsa.redis_dsa import (
+    push_recent_txn, amount_percentile, update_amount_sketch,
+    get_last_device, set_last_device, seen_filters_check
+)
+from app.core.dsa.entity_graph import entity_graph
+from app.core.dsa.user_state_cache import user_state
+from app.services.features import transaction_features
+from app.services.rule_engine import rule_engine
+from app.services.enrichment import Enricher, EnrichmentPipeline
+from app.core.config import settings
+from app.core.cache import response_cache, bump_user_version
+from app.core.idempotency import idempotency, request_fingerprint
+from app.services.partitions import user_partitions
+from app.core.tracing import span
 from app.core.auth import get_current_user  # <-- JWT token
 # or: from app.api.v1.routes.auth_route import get_current_user
 
 router = APIRouter(prefix="/transactions", tags=["Transactions"])
 
 
+async def _location(ctx):
+    return await get_geolocation(ctx["ip"])
+
+
+async def _last_txn_at(ctx):
+    async def load():
+        with span("mongo.find_one", collection="transactions"):
+            last = await ctx["db"].transactions.find_one(
+                {"user_id": ctx["user_id"]}, {"transaction_date": 1}, sort=[("_id", -1)]
+            )
+        prev = last.get("transaction_date") if last else None
+        return datetime.fromisoformat(prev) if isinstance(prev, str) else prev
+    return await user_state.aget(ctx["user_id"], "last_txn_at", load)
+
+
+transaction_enrichment = EnrichmentPipeline([
+    Enricher("location", _location, default=None, cache_key=lambda ctx: ctx["ip"]),
+    Enricher("last_txn_at", _last_txn_at, default=None),
+    Enricher("last_device", lambda ctx: get_last_device(ctx["user_id"]), default=None),
+    # how unusual is this amount for the user (before counting it)
+    Enricher("amount_percentile",
+             lambda ctx: amount_percentile(ctx["user_id"], ctx["amount"], ctx["category"]),
+             default=None),
+    Enricher("ip_reputation", lambda ctx: check_vpn_tor(ctx["ip"]),
+             default=None, cache_key=lambda ctx: ctx["ip"], inline=True),
+], budget_ms=settings.ENRICHMENT_BUDGET_MS)
+
+
 # -----------------------------------------------------------
 # CREATE TRANSACTION USING JWT TOKEN
 # -----------------------------------------------------------
 @router.post("")
 async def create_transaction(
     request: Request,
+    response: Response,
     data: TransactionCreate,
     db=Depends(get_database),
-    current_user=Depends(get_current_user)   # <-- TOKEN REQUIRED
+    current_user=Depends(get_current_user),   # <-- TOKEN REQUIRED
+    idempotency_key: str | None = Header(default=None, alias="Idempotency-Key"),
 ):
     user_id = current_user["id"]  # <- Extract from token
 
+    # gateway retries with the same key replay the first response instead of
+    # creating a duplicate transaction
+    result, replayed = await idempotency.run(
+        f"txn:{user_id}", idempotency_key, request_fingerprint(data.model_dump()),
+        # runs on the user's partition: one transaction per user at a time, in order
+        lambda: _partitioned_create(request, data, db, user_id),
+    )
+    if replayed:
+        response.headers["Idempotent-Replayed"] = "true"
+    return result
+
+
+async def _partitioned_create(request: Request, data: TransactionCreate, db, user_id: str):
+    # the span covers queueing behind the user's earlier transactions as well
+    with span("partition", partition=user_partitions.partition_for(user_id)):
+        return await user_partitions.call(user_id, lambda: _create_transaction(request, data, db, user_id))
+
+
+async def _create_transaction(request: Request, data: TransactionCreate, db, user_id: str):
     ip_address = get_client_ip(request)
     device_id = get_device_id(request)
-    location = get_location_from_ip(ip_address)
 
-    last_txn = await db.transactions.find_one(
-        {"user_id": user_id}, sort=[("_id", -1)]
-    )
-
-    previous_txn_date = None
-    if last_txn:
-        prev = last_txn.get("transaction_date")
-        previous_txn_date = datetime.fromisoformat(prev) if isinstance(prev, str) else prev
+    # independent lookups run concurrently under one latency budget
+    with span("enrichment"):
+        enriched = await transaction_enrichment.run({
+            "db": db, "user_id": user_id, "ip": ip_address,
+            "amount": data.amount, "category": data.category,
+        })
+    location = enriched.values["location"]
+    previous_txn_date = enriched.values["last_txn_at"]
 
     transaction_duration = (
         (datetime.utcnow() - previous_txn_date).total_seconds()
@@ -56,18 +116,52 @@ async def create_transaction(
         location=location,
         merchant_id=merchant_id,
         transaction_duration=transaction_duration,
-        previous_transaction_date=previous_txn_date
+        previous_transaction_date=previous_txn_date,
+        amount_percentile=enriched.values["amount_percentile"],
+        ip_reputation=enriched.values["ip_reputation"],
+        enrichment=enriched.summary()
     )
 
-    await db.transactions.insert_one(txn.model_dump())
+    # rule-based scoring
+    with span("scoring"):
+        with span("entity_graph.add_event"):
+            ring = entity_graph.add_event(user_id, device_id, ip_address)
+        with span("redis.seen_filters_check"):
+            seen = seen_filters_check(user_id, {
+                "device": device_id,
+                "ip": ip_address,
+                "country": (location or {}).get("country"),
+            })
+        with span("rules.evaluate"):
+            result = rule_engine.evaluate("transaction", transaction_features(
+                txn.model_dump(), last_device=enriched.values["last_device"], ring=ring, seen=seen
+            ))
+    if result.is_anomaly:
+        entity_graph.flag_user(user_id)
+    txn.is_anomaly = result.is_anomaly
+    txn.risk_score = result.score
+    txn.rule_reasons = result.reasons or None
+
+    with span("persistence"):
+        with span("mongo.insert_one", collection="transactions"):
+            await db.transactions.insert_one(txn.model_dump())
+        with span("redis.bump_user_version"):
+            bump_user_version(user_id)
+        user_state.put(user_id, "last_txn_at", txn.transaction_date)
 
-    push_recent_txn(user_id, txn.model_dump(mode="json"))
+        with span("redis.push_recent_txn"):
+            push_recent_txn(user_id, txn.model_dump(mode="json"))
+        with span("redis.update_amount_sketch"):
+            update_amount_sketch(user_id, data.amount, data.category)
+        with span("redis.set_last_device"):
+            set_last_device(user_id, device_id)
 
-    await handle_anomaly({
-        "is_anomaly": False,
-        "event_type": "transaction",
-        "event_data": txn.model_dump(mode="json")
-    }, db)
+        with span("handle_anomaly"):
+            await handle_anomaly({
+                "is_anomaly": result.is_anomaly,
+                "event_type": "transaction",
+                "event_data": txn.model_dump(mode="json")
+            }, db)
 
     return {"message": "Transaction added", "data": txn.model_dump(mode="json")}
 
@@ -78,15 +172,49 @@ async def create_transaction(
 @router.get("")
 async def get_user_transactions(
     request: Request,
-    db=Depends(get_database),
+    db=Depends(get_analytics_database),
     current_user=Depends(get_current_user),   # <-- TOKEN REQUIRED
-    from_dt: str | None = None,
-    to_dt: str | None = None,
-    sort_by: str = "transaction_date",
+    from_dt: datetime | None = None,   # validated by FastAPI: a bad value is a 422, not a 500
+    to_dt: datetime | None = None,
+    sort_by: str = Query(default="transaction_date", pattern="^(transaction_date|amount|risk_score)$"),
     desc: bool = True,
     min_amount: float | None = None,
     max_amount: float | None = None,
     category: str | None = None,
-    status: str | None = None,
+    status: str | None = Query(default=None, pattern="^(anomaly|normal)$"),
+    limit: int = Query(default=50, le=200),
+    skip: int = Query(default=0, ge=0),
 ):
     user_id = current_user["id"]  # <-- Extract from token
+
+    query = {"user_id": user_id}
+    if from_dt or to_dt:
+        query["transaction_date"] = {}
+        if from_dt:
+            query["transaction_date"]["$gte"] = from_dt
+        if to_dt:
+            query["transaction_date"]["$lte"] = to_dt
+    if min_amount is not None or max_amount is not None:
+        query["amount"] = {}
+        if min_amount is not None:
+            query["amount"]["$gte"] = min_amount
+        if max_amount is not None:
+            query["amount"]["$lte"] = max_amount
+    if category:
+        query["category"] = category
+    if status:
+        query["is_anomaly"] = status == "anomaly"
+
+    async def load():
+        cursor = db.transactions.find(query, {"_id": 0}).sort(sort_by, -1 if desc else 1).skip(skip).limit(limit)
+        items = await cursor.to_list(length=limit)
+        total = await db.transactions.count_documents(query)
+        return {"total": total, "count": len(items), "data": items}
+
+    # cached per user; create_transaction bumps the user's version
+    params = {
+        "from_dt": from_dt, "to_dt": to_dt, "sort_by": sort_by, "desc": desc,
+        "min_amount": min_amount, "max_amount": max_amount, "category": category,
+        "status": status, "limit": limit, "skip": skip,
+    }
+    return await response_cache.get_or_compute("transactions:list", user_id, params, load)
@@ -29,6 +29,7 @@
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
 from app.core.security import decode_access_token
+from app.core.config import settings
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/v1/auth/login")
 
@@ -54,3 +55,21 @@ def get_current_user(token: str = Depends(oauth2_scheme)):
         )
 
     return decoded
+
+
+# -----------------------------
+# ADMIN-ONLY ROUTES
+# -----------------------------
+def _csv(value: str) -> set[str]:
+    return {v.strip().lower() for v in value.split(",") if v.strip()}
+
+
+def require_admin(current_user=Depends(get_current_user)):
+    # allow-list from settings; user ids are hex ObjectIds, so lowercasing is safe
+    if (str(current_user["id"]).lower() not in _csv(settings.ADMIN_USER_IDS)
+            and str(current_user.get("email") or "").lower() not in _csv(settings.ADMIN_EMAILS)):
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Admin access required"
+        )
+    return current_user
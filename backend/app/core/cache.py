@@ -0,0 +1,192 @@
+# app/core/cache.py
+import json
+import time
+import asyncio
+import hashlib
+from collections import OrderedDict, defaultdict
+
+from app.core.config import settings
+from app.db.redis_client import rc
+
+"""
+Read-through cache for per-user query results.
+
+Every user has one data version counter in Redis ("cache:ver:<user_id>").
+Write paths call bump_user_version(user_id) after they persist something;
+cache keys embed the current version, so a bump invalidates every cached
+result of that user in O(1) (old entries just stop being addressed and
+expire on their TTL, no key scans or deletes).
+
+    L1: small in-process LRU (per worker), keyed by the versioned key
+    L2: Redis STRING with TTL, shared by all workers
+
+Stampede protection: concurrent misses for one key in a process share a
+single computation, and across processes a short SET NX lock lets one
+worker compute while the others wait briefly for its result.
+
+Reads may come from a secondary (db.mongodb analytics pool). For
+`fresh_window` seconds after a bump, results are only cached for that long,
+so a read that raced replication cannot pin a stale result for the full TTL.
+"""
+
+VERSION_KEY = "cache:ver:{user_id}"
+FRESH_KEY = "cache:fresh:{user_id}"  # set for a few seconds after a bump
+
+
+class _L1:
+    """LRU with per-entry expiry."""
+
+    def __init__(self, max_size: int, ttl: float):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._data: OrderedDict[str, tuple[float, object]] = OrderedDict()
+
+    def get(self, key: str):
+        item = self._data.get(key)
+        if item is None:
+            return None
+        expires, value = item
+        if expires < time.monotonic():
+            del self._data[key]
+            return None
+        self._data.move_to_end(key)
+        return value
+
+    def set(self, key: str, value):
+        self._data[key] = (time.monotonic() + self.ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.max_size:
+            self._data.popitem(last=False)
+
+
+class ResponseCache:
+    def __init__(self, prefix: str = "cache", ttl: int = 300, l1_size: int = 1024, l1_ttl: float = 30,
+                 lock_ttl: float = 5.0, lock_wait: float = 2.0, fresh_window: int = 2):
+        self.prefix = prefix
+        self.ttl = ttl
+        self.fresh_window = fresh_window
+        self.l1 = _L1(l1_size, l1_ttl)
+        self.lock_ttl = lock_ttl
+        self.lock_wait = lock_wait
+        self._inflight: dict[str, asyncio.Future] = {}
+        self.stats = defaultdict(lambda: {"l1_hits": 0, "l2_hits": 0, "misses": 0, "coalesced": 0, "errors": 0})
+
+    # ---- versions ----
+    def user_version(self, user_id: str) -> tuple[int, bool]:
+        """(version, recently bumped)"""
+        version, fresh = rc.mget(VERSION_KEY.format(user_id=user_id), FRESH_KEY.format(user_id=user_id))
+        return int(version or 0), fresh is not None
+
+    def bump_many(self, user_ids) -> None:
+        pipe = rc.pipeline(transaction=False)
+        for uid in set(user_ids):
+            pipe.incr(VERSION_KEY.format(user_id=uid))
+            if self.fresh_window:
+                pipe.set(FRESH_KEY.format(user_id=uid), 1, ex=self.fresh_window)
+        pipe.execute()
+
+    def bump(self, user_id: str):
+        self.bump_many([user_id])
+
+    def _key(self, namespace: str, user_id: str, version: int, params: dict | None) -> str:
+        digest = hashlib.blake2b(json.dumps(params or {}, sort_keys=True, default=str).encode(), digest_size=8).hexdigest()
+        return f"{self.prefix}:{namespace}:{user_id}:v{version}:{digest}"
+
+    # ---- read-through ----
+    async def get_or_compute(self, namespace: str, user_id: str, params: dict | None, compute, ttl: int | None = None):
+        """
+        Cached result of `await compute()` for this user/namespace/params.
+        The result must be JSON serializable (datetimes are stored as ISO strings).
+        """
+        stats = self.stats[namespace]
+        try:
+            version, fresh = self.user_version(user_id)
+            key = self._key(namespace, user_id, version, params)
+        except Exception:
+            # Redis down: serve straight from the source
+            stats["errors"] += 1
+            return await compute()
+
+        value = self.l1.get(key)
+        if value is not None:
+            stats["l1_hits"] += 1
+            return value
+
+        inflight = self._inflight.get(key)
+        if inflight is not None:
+            stats["coalesced"] += 1
+            return await asyncio.shield(inflight)
+
+        future = asyncio.get_event_loop().create_future()
+        self._inflight[key] = future
+        try:
+            ttl = self.fresh_window if fresh else (ttl or self.ttl)
+            value = await self._load(key, stats, compute, ttl, l1=not fresh)
+            future.set_result(value)
+            return value
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            future.exception()  # mark retrieved when nobody else is waiting
+            raise
+        finally:
+            del self._inflight[key]
+
+    async def _load(self, key: str, stats: dict, compute, ttl: int, l1: bool = True):
+        raw = rc.get(key)
+        if raw is not None:
+            stats["l2_hits"] += 1
+            value = json.loads(raw)
+            if l1:
+                self.l1.set(key, value)
+            return value
+
+        # cross-process: one worker recomputes, the rest wait for its result
+        lock = f"{key}:lock"
+        owner = rc.set(lock, "1", nx=True, px=int(self.lock_ttl * 1000))
+        if not owner:
+            deadline = time.monotonic() + self.lock_wait
+            while time.monotonic() < deadline:
+                await asyncio.sleep(0.05)
+                raw = rc.get(key)
+                if raw is not None:
+                    stats["coalesced"] += 1
+                    value = json.loads(raw)
+                    if l1:
+                        self.l1.set(key, value)
+                    return value
+
+        stats["misses"] += 1
+        try:
+            value = json.loads(json.dumps(await compute(), default=str))
+            rc.set(key, json.dumps(value), ex=ttl)
+        finally:
+            if owner:
+                rc.delete(lock)
+        if l1:
+            self.l1.set(key, value)
+        return value
+
+    def snapshot(self) -> dict:
+        out = {}
+        for namespace, s in self.stats.items():
+            lookups = s["l1_hits"] + s["l2_hits"] + s["misses"] + s["coalesced"]
+            hits = lookups - s["misses"]
+            out[namespace] = {**s, "hit_rate": round(hits / lookups, 4) if lookups else None}
+        return out
+
+
+response_cache = ResponseCache(
+    ttl=settings.CACHE_TTL,
+    l1_size=settings.CACHE_L1_SIZE,
+    l1_ttl=settings.CACHE_L1_TTL,
+    fresh_window=settings.CACHE_FRESH_WINDOW,
+)
+
+
+def bump_user_version(user_id: str | None):
+    """Call after any write that changes what a user's cached reads return."""
+    if user_id:
+        response_cache.bump(user_id)
@@ -4,10 +4,134 @@ from pydantic_settings import BaseSettings
 
 class Settings(BaseSettings):
     PROJECT_NAME: str = "Fraud Detection System"
+
+    # /admin/* access (there is no role on user documents); empty lists = nobody
+    ADMIN_USER_IDS: str = ""   # comma separated user ids
+    ADMIN_EMAILS: str = ""     # comma separated, case-insensitive
     
     # MongoDB Config
     MONGO_URI: str = "mongodb://localhost:27017"
     MONGO_DB_NAME: str = "fraud_detection"
+    MONGO_MAX_POOL_SIZE: int = 100
+    MONGO_MIN_POOL_SIZE: int = 10
+    MONGO_COMPRESSORS: str = "zstd,snappy,zlib"  # negotiated with the server in this order
+
+    # Analytics pool (list / stats / export reads)
+    MONGO_ANALYTICS_URI: str = ""                 # defaults to MONGO_URI
+    MONGO_ANALYTICS_MAX_POOL_SIZE: int = 20
+    MONGO_ANALYTICS_MIN_POOL_SIZE: int = 0
+    MONGO_ANALYTICS_READ_PREFERENCE: str = "secondaryPreferred"
+    MONGO_ANALYTICS_WAIT_QUEUE_TIMEOUT_MS: int = 5000  # fail analytics reads instead of queueing forever
+
+    # Redis sharding (db/redis_client.py, anomaly queue in core/dsa/redis_dsa.py)
+    REDIS_SHARD_URLS: str = ""        # comma separated extra nodes; shard i lives on node i % len(nodes)
+    ANOMALY_QUEUE_SHARDS: int = 8
+    ANOMALY_DECAY_HALF_LIFE: float = 24 * 3600   # seconds, 0 = rank by raw score
+    ANOMALY_QUEUE_MAX: int = 100000             # entries over all shards
+
+    # Per-user "seen device / IP / country" Bloom filters (core/dsa/redis_dsa.py)
+    SEEN_FILTER_CAPACITY: int = 200      # distinct values per user
+    SEEN_FILTER_FP_RATE: float = 0.01
+
+    # Event storage (login_logs / transactions)
+    EVENT_STORAGE_MODE: str = "standard"   # "standard" or "timeseries"
+    EVENT_RETENTION_DAYS: int = 0          # hot-data TTL, 0 = keep forever
+    MIGRATION_CHUNK_SIZE: int = 5000
+
+    # Cold tier for anomaly_logs (date-partitioned Parquet)
+    ANOMALY_ARCHIVE_DIR: str = "archive"
+    ANOMALY_HOT_DAYS: int = 30             # older anomalies get archived
+    ARCHIVE_CHUNK_SIZE: int = 10000
+
+    # Admin analytics materialized views
+    ANALYTICS_REFRESH_INTERVAL: int = 60   # seconds
+
+    # Declarative fraud rules (hot-reloaded)
+    RULES_PATH: str = "rules.json"
+    RULES_RELOAD_INTERVAL: float = 5.0     # seconds between mtime checks
+
+    # Login audit pipeline (off the login critical path)
+    LOGIN_AUDIT_QUEUE_SIZE: int = 10000
+    LOGIN_AUDIT_BATCH_SIZE: int = 100
+    LOGIN_AUDIT_FLUSH_INTERVAL: float = 0.5   # seconds
+    LOGIN_AUDIT_OVERFLOW: str = "drop_oldest"  # drop_newest, drop_oldest, block
+    LOGIN_AUDIT_DRAIN_TIMEOUT: float = 10.0
+
+    # Enrichment latency budgets (ms)
+    ENRICHMENT_BUDGET_MS: float = 300
+    LOGIN_ENRICHMENT_BUDGET_MS: float = 1000  # runs in the audit pipeline, not on login
+
+    # Local IP reputation lists (tor_exit.txt, vpn.txt, hosting.txt, known_bad.txt)
+    IP_REPUTATION_DIR: str = "data/ip_reputation"
+    IP_REPUTATION_RELOAD_INTERVAL: float = 60  # seconds between mtime checks
+
+    # Fraud-ring entity graph (users <-> devices <-> IPs)
+    ENTITY_GRAPH_SNAPSHOT_PATH: str = "data/entity_graph.pkl"
+    ENTITY_GRAPH_SNAPSHOT_INTERVAL: int = 300  # seconds
+    ENTITY_GRAPH_RING_THRESHOLD: int = 5       # shared users before ring risk saturates
+    ENTITY_GRAPH_CATCHUP_OVERLAP: float = 30.0  # seconds re-read before the snapshot, on top of LOGIN_AUDIT_FLUSH_INTERVAL
+
+    # Live anomaly feed (SSE)
+    ANOMALY_FEED_CLIENT_QUEUE: int = 100   # events buffered per client before dropping oldest
+    ANOMALY_FEED_HEARTBEAT: float = 15.0   # seconds
+
+    # Per-user read cache (core/cache.py)
+    CACHE_TTL: int = 300          # seconds in Redis
+    CACHE_L1_SIZE: int = 1024     # entries per process
+    CACHE_L1_TTL: float = 30      # seconds in process
+    CACHE_FRESH_WINDOW: int = 2   # seconds after a write where results are cached only briefly (replica lag)
+
+    # Rate limiting (core/rate_limit.py, token buckets in Redis)
+    RATE_LIMIT_ENABLED: bool = True
+    RATE_LIMIT_LOGIN_BURST: int = 10           # per IP
+    RATE_LIMIT_LOGIN_PER_MIN: float = 10
+    RATE_LIMIT_LOGIN_GLOBAL_BURST: int = 500   # all IPs together
+    RATE_LIMIT_LOGIN_GLOBAL_PER_SEC: float = 200
+    RATE_LIMIT_SIGNUP_BURST: int = 5           # per IP
+    RATE_LIMIT_SIGNUP_PER_HOUR: float = 5
+    RATE_LIMIT_API_BURST: int = 100            # per IP and per user
+    RATE_LIMIT_API_PER_SEC: float = 20
+    RATE_LIMIT_TRUSTED_PROXIES: str = ""       # comma separated IPs/CIDRs whose X-Forwarded-For is honoured
+
+    # Idempotency-Key handling (core/idempotency.py)
+    IDEMPOTENCY_TTL: int = 86400       # seconds a completed response is replayed
+    IDEMPOTENCY_LOCK_TTL: int = 30     # claim expiry if the first request dies (renewed while it runs)
+    IDEMPOTENCY_WAIT: float = 10.0     # how long duplicates wait for an in-flight request
+
+    # User-partitioned ordered processing (services/partitions.py)
+    USER_PARTITIONS: int = 16
+    USER_PARTITION_QUEUE_SIZE: int = 1000
+
+    # In-process hot user state (core/dsa/user_state_cache.py)
+    USER_STATE_CACHE_MAX_BYTES: int = 64 * 1024 * 1024
+    USER_STATE_CACHE_TTL: float = 10.0   # seconds; bounds staleness from other processes
+
+    # Change-stream consumers for derived data (services/change_streams.py, needs a replica set)
+    CHANGE_STREAMS_ENABLED: bool = False
+    CHANGE_STREAM_BATCH_SIZE: int = 500
+    CHANGE_STREAM_FLUSH_INTERVAL: float = 1.0   # seconds a partial batch waits
+    CHANGE_STREAM_MAX_AWAIT_MS: int = 1000
+    CHANGE_STREAM_LEASE_TTL: int = 30           # seconds; only the lease holder consumes, one per deployment
+
+    # Request tracing (core/tracing.py)
+    TRACING_ENABLED: bool = True
+    TRACE_BUFFER_SIZE: int = 500          # recent traces kept in memory
+    TRACE_SLOW_MS: float = 500            # traces at least this slow are also exported
+    TRACE_EXPORT_PATH: str = "data/traces/slow.jsonl"  # empty disables the JSONL export
+
+    # On-demand request profiling (core/profiling.py); the middleware is not mounted unless enabled
+    PROFILING_ENABLED: bool = False
+    PROFILING_MODE: str = "sample"        # "sample" (folded stacks) or "cprofile"
+    PROFILING_SAMPLE_RATE: float = 0.0    # fraction of requests profiled without a signed header
+    PROFILING_SECRET: str = ""            # HMAC key for X-Profile; empty disables header triggering
+    PROFILING_SIGNATURE_TTL: int = 300    # seconds a signed header stays valid
+    PROFILING_INTERVAL_MS: float = 5      # stack sampling interval
+    PROFILING_DIR: str = "data/profiles"
+    PROFILING_MAX_FILES: int = 500
+
+    # Offline model training (services/training.py)
+    MODEL_DIR: str = "models"
+    TRAINING_CHUNK_SIZE: int = 10000
 
     class Config:
         env_file = ".env"
@@ -0,0 +1,248 @@
+# app/core/dsa/entity_graph.py
+import os
+import pickle
+import asyncio
+import argparse
+import ipaddress
+from array import array
+from datetime import datetime, timedelta
+from app.core.config import settings
+
+"""
+Incremental fraud-ring detection.
+
+Users, devices and IPs are nodes; every login / transaction links its user to
+the device and IP it used. Connected components are tracked with union-find
+(union by size + path halving) over flat int arrays, and each root keeps
+running counters (users, devices, IPs, flagged users), so "how big / risky is
+this user's ring" is near-constant time after every event.
+
+State is per process; it is snapshotted to disk periodically and on startup
+reloaded (into a fresh graph off the event loop, then swapped in on the loop),
+then caught up from login_logs and transactions newer than the snapshot
+(minus an overlap: login events are stamped when queued and inserted by the
+audit pipeline later, so one stamped just before the snapshot can land after it).
+Loopback/private IPs and placeholder device ids are ignored, otherwise every
+user behind the same NAT or with an unknown device would be linked.
+
+    python -m app.core.dsa.entity_graph   # full rebuild from login_logs + transactions
+"""
+
+IGNORED_DEVICES = {None, "", "unknown", "unknown-device"}
+
+USER, DEVICE, IP = 0, 1, 2
+_PREFIX = {USER: "u:", DEVICE: "d:", IP: "i:"}
+
+
+def _linkable_ip(ip: str | None) -> bool:
+    if not ip:
+        return False
+    try:
+        return ipaddress.ip_address(ip).is_global
+    except ValueError:
+        return False
+
+
+class EntityGraph:
+    def __init__(self, ring_threshold: int = 5):
+        self.ring_threshold = ring_threshold  # users sharing entities before risk saturates
+        self._index: dict[str, int] = {}
+        self.parent = array("i")
+        self.size = array("i")      # nodes in component (valid at root)
+        self.counts = [array("i"), array("i"), array("i")]  # users / devices / ips per root
+        self.flagged = array("i")   # flagged users per root
+        self.is_flagged = array("B")
+        self.updated_at: datetime | None = None
+
+    def __len__(self):
+        return len(self.parent)
+
+    # ---- union-find ----
+    def _node(self, kind: int, value: str) -> int:
+        key = _PREFIX[kind] + value
+        idx = self._index.get(key)
+        if idx is None:
+            idx = len(self.parent)
+            self._index[key] = idx
+            self.parent.append(idx)
+            self.size.append(1)
+            for k, c in enumerate(self.counts):
+                c.append(1 if k == kind else 0)
+            self.flagged.append(0)
+            self.is_flagged.append(0)
+        return idx
+
+    def find(self, x: int) -> int:
+        parent = self.parent
+        while parent[x] != x:
+            parent[x] = parent[parent[x]]  # path halving
+            x = parent[x]
+        return x
+
+    def union(self, a: int, b: int) -> int:
+        ra, rb = self.find(a), self.find(b)
+        if ra == rb:
+            return ra
+        if self.size[ra] < self.size[rb]:
+            ra, rb = rb, ra
+        self.parent[rb] = ra
+        self.size[ra] += self.size[rb]
+        for c in self.counts:
+            c[ra] += c[rb]
+        self.flagged[ra] += self.flagged[rb]
+        return ra
+
+    # ---- events ----
+    def add_event(self, user_id: str, device_id: str | None = None, ip: str | None = None,
+                  is_anomaly: bool = False) -> dict:
+        u = self._node(USER, user_id)
+        if device_id not in IGNORED_DEVICES:
+            self.union(u, self._node(DEVICE, device_id))
+        if _linkable_ip(ip):
+            self.union(u, self._node(IP, ip))
+        if is_anomaly:
+            self.flag_user(user_id)
+        self.updated_at = datetime.utcnow()
+        return self._info(self.find(u))
+
+    def flag_user(self, user_id: str):
+        u = self._node(USER, user_id)
+        if not self.is_flagged[u]:
+            self.is_flagged[u] = 1
+            self.flagged[self.find(u)] += 1
+
+    def component(self, user_id: str) -> dict | None:
+        u = self._index.get(_PREFIX[USER] + user_id)
+        return self._info(self.find(u)) if u is not None else None
+
+    def _info(self, root: int) -> dict:
+        users = self.counts[USER][root]
+        flagged = self.flagged[root]
+        # shared entities grow the risk, confirmed anomalies in the ring add to it
+        share = min(1.0, (users - 1) / self.ring_threshold)
+        risk = round(100 * min(1.0, 0.7 * share + 0.3 * flagged / users)) if users else 0
+        return {
+            "users": users,
+            "devices": self.counts[DEVICE][root],
+            "ips": self.counts[IP][root],
+            "flagged_users": flagged,
+            "risk": risk,
+        }
+
+    # ---- persistence ----
+    def state(self) -> dict:
+        # consistent copy (cheap C-level copies), safe to pickle off the event loop
+        return {
+            "index": dict(self._index),
+            "arrays": [a.tobytes() for a in (self.parent, self.size, *self.counts, self.flagged, self.is_flagged)],
+            "updated_at": self.updated_at,
+            "ring_threshold": self.ring_threshold,
+        }
+
+    def snapshot(self, path: str):
+        write_snapshot(path, self.state())
+
+    @classmethod
+    def from_snapshot(cls, path: str, ring_threshold: int = 5) -> "EntityGraph":
+        # builds a new graph, so it can run in a worker thread while the live one keeps serving
+        with open(path, "rb") as fh:
+            state = pickle.load(fh)
+        graph = cls(ring_threshold)
+        graph._index = state["index"]
+        targets = (graph.parent, graph.size, *graph.counts, graph.flagged, graph.is_flagged)
+        for a, raw in zip(targets, state["arrays"]):
+            a.frombytes(raw)
+        graph.updated_at = state["updated_at"]
+        return graph
+
+    def adopt(self, other: "EntityGraph"):
+        """Take over another graph's state in one step; call on the event loop (no awaits in between)."""
+        self._index, self.parent, self.size = other._index, other.parent, other.size
+        self.counts, self.flagged, self.is_flagged = other.counts, other.flagged, other.is_flagged
+        self.updated_at = other.updated_at
+
+    # ---- bulk build ----
+    async def build_from_history(self, db, since: datetime | None = None, batch_size: int = 5000) -> int:
+        """Stream login_logs and transactions (optionally only newer than `since`) into the graph."""
+        sources = (
+            # collection, filter, time field, ip field
+            ("login_logs", {"user_id": {"$ne": None}, "status": "success"}, "login_time", "ip_address"),
+            ("transactions", {"user_id": {"$ne": None}}, "transaction_date", "ip"),
+        )
+        n = 0
+        for collection, q, time_field, ip_field in sources:
+            if since:
+                q = {**q, time_field: {"$gt": since}}
+            cursor = db[collection].find(
+                q, {"user_id": 1, "device_id": 1, ip_field: 1, "is_anomaly": 1}
+            ).batch_size(batch_size)
+            async for doc in cursor:
+                self.add_event(doc["user_id"], doc.get("device_id"), doc.get(ip_field), doc.get("is_anomaly", False))
+                n += 1
+        return n
+
+
+def write_snapshot(path: str, state: dict):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp = f"{path}.tmp"
+    with open(tmp, "wb") as fh:
+        pickle.dump(state, fh, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp, path)  # readers never see a half-written snapshot
+
+
+entity_graph = EntityGraph(settings.ENTITY_GRAPH_RING_THRESHOLD)
+
+
+def catchup_since(updated_at: datetime | None) -> datetime | None:
+    """Start of the catch-up window: the snapshot time minus the audit flush interval plus slack."""
+    if updated_at is None:
+        return None
+    return updated_at - timedelta(
+        seconds=settings.LOGIN_AUDIT_FLUSH_INTERVAL + settings.ENTITY_GRAPH_CATCHUP_OVERLAP
+    )
+
+
+async def init_entity_graph(db, path: str | None = None, interval: int | None = None):
+    """
+    Run in background at startup: restore the last snapshot (or build from
+    scratch), catch up from newer login_logs / transactions, then snapshot
+    periodically. Replaying an event the live graph already saw is harmless
+    (unions and flags are idempotent).
+    """
+    path = path or settings.ENTITY_GRAPH_SNAPSHOT_PATH
+    interval = interval or settings.ENTITY_GRAPH_SNAPSHOT_INTERVAL
+
+    since = None
+    if os.path.exists(path):
+        loaded = await asyncio.to_thread(EntityGraph.from_snapshot, path, entity_graph.ring_threshold)
+        since = catchup_since(loaded.updated_at)
+        # events handled since startup are newer than the snapshot, so the catch-up below re-adds them
+        entity_graph.adopt(loaded)
+    n = await entity_graph.build_from_history(db, since=since)
+    print(f"📌 Entity graph ready: {len(entity_graph)} nodes ({n} events replayed)")
+
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await asyncio.to_thread(write_snapshot, path, entity_graph.state())
+        except Exception as e:
+            print(f"Entity graph snapshot error: {e}")
+
+
+async def main():
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    parser = argparse.ArgumentParser(description="Build the entity-link graph from login_logs and transactions")
+    parser.add_argument("--path", default=settings.ENTITY_GRAPH_SNAPSHOT_PATH)
+    args = parser.parse_args()
+
+    client = AsyncIOMotorClient(settings.MONGO_URI)
+    graph = EntityGraph(settings.ENTITY_GRAPH_RING_THRESHOLD)
+    n = await graph.build_from_history(client[settings.MONGO_DB_NAME])
+    graph.snapshot(args.path)
+    print(f"✅ {n} events, {len(graph)} nodes -> {args.path}")
+    client.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -2,13 +2,58 @@
 from datetime import datetime, timedelta
 from pymongo import DESCENDING
 
+# time field of each append-only event collection
+EVENT_TIME_FIELDS = {
+    "login_logs": "login_time",
+    "transactions": "transaction_date",
+}
+
+# secondary indexes, created by MongoDSA.ensure_indexes
+COLLECTION_INDEXES = {
+    "transactions": [[("user_id", 1), ("transaction_date", -1)], [("anomaly_score", -1)]],
+    "login_logs": [[("user_id", 1), ("login_time", -1)]],
+    "anomaly_logs": [
+        [("user_id", 1), ("detected_at", -1)],
+        [("anomaly_score", -1)],
+        [("detected_at", 1)],  # range queries + archival scans
+    ],
+}
+
+STORAGE_STANDARD = "standard"
+STORAGE_TIMESERIES = "timeseries"
+
+
+def timeseries_options(collection: str) -> dict:
+    return {
+        "timeField": EVENT_TIME_FIELDS[collection],
+        "metaField": "user_id",
+        "granularity": "seconds",
+    }
+
+
+def coerce_event_time(collection: str, doc: dict) -> dict:
+    """
+    Time-series collections reject documents whose timeField is not a BSON date.
+    Some write paths dump models with mode="json", so parse ISO strings back.
+    """
+    field = EVENT_TIME_FIELDS.get(collection)
+    value = doc.get(field) if field else None
+    if isinstance(value, str):
+        doc[field] = datetime.fromisoformat(value)
+    return doc
+
+
 class MongoDSA:
-    def __init__(self, db):
+    def __init__(self, db, archive_reader=None):
         """
         db is Motor database object (async)
         e.g. db = await get_database()
+        archive_reader: optional async (from_dt, to_dt, limit) -> docs for the cold
+        tier, e.g. anomaly_archiver.fetch_archived_anomalies; without it only
+        Mongo is queried
         """
         self.db = db
+        self.archive_reader = archive_reader
 
     # generic date-range transaction query, sorted by field (anomaly_score, amount, timestamp)
     async def get_transactions_by_date_range(
@@ -32,6 +77,7 @@ class MongoDSA:
         return await cursor.to_list(length=limit)
 
     # anomalies: get anomalies in a date range sorted by anomaly_score desc
+    # (hot Mongo results merged with the archive reader's results, if one is set)
     async def get_anomalies_by_date_range(self, from_dt: datetime | None = None, to_dt: datetime | None = None, limit: int = 100):
         q = {}
         if from_dt or to_dt:
@@ -42,12 +88,83 @@ class MongoDSA:
                 q["detected_at"]["$lte"] = to_dt
 
         cursor = self.db.anomaly_logs.find(q).sort("anomaly_score", DESCENDING).limit(limit)
-        return await cursor.to_list(length=limit)
+        hot = await cursor.to_list(length=limit)
+
+        if self.archive_reader is None:
+            return hot
+        cold = await self.archive_reader(from_dt, to_dt, limit)
+        if not cold:
+            return hot
+
+        hot_ids = {d["_id"] for d in hot}
+        merged = hot + [d for d in cold if d["_id"] not in hot_ids]
+        merged.sort(key=lambda d: d.get("anomaly_score") or 0.0, reverse=True)
+        return merged[:limit]
+
+    async def is_timeseries(self, collection: str) -> bool:
+        cursor = await self.db.list_collections(filter={"name": collection})
+        infos = await cursor.to_list(length=1)
+        return bool(infos) and infos[0].get("type") == "timeseries"
+
+    # create event collections in the selected storage mode (run at startup)
+    async def ensure_event_storage(self, storage_mode: str = STORAGE_STANDARD, retention_days: int = 0,
+                                   collections: list[str] | None = None):
+        """
+        standard:   plain collections, optional TTL index on the time field
+        timeseries: time-series collections bucketed by user_id, retention via expireAfterSeconds
+        Existing plain collections are left alone in timeseries mode; move them
+        with app/services/timeseries_migration.py.
+        collections limits the work to those event collections (default: all).
+        """
+        expire = retention_days * 86400 if retention_days else None
+        existing = set(await self.db.list_collection_names())
+
+        for name, time_field in EVENT_TIME_FIELDS.items():
+            if collections is not None and name not in collections:
+                continue
+            if storage_mode == STORAGE_TIMESERIES:
+                if name not in existing:
+                    opts = {"timeseries": timeseries_options(name)}
+                    if expire:
+                        opts["expireAfterSeconds"] = expire
+                    await self.db.create_collection(name, **opts)
+                elif await self.is_timeseries(name):
+                    await self.db.command(
+                        "collMod", name, expireAfterSeconds=expire if expire else "off"
+                    )
+                else:
+                    print(f"⚠️ {name} is a plain collection, run timeseries_migration to convert it")
+            else:
+                await self.sync_ttl_index(name, time_field, expire)
+
+    async def sync_ttl_index(self, collection: str, time_field: str, expire: int | None):
+        """
+        Keep the standard-mode TTL index in line with EVENT_RETENTION_DAYS:
+        create it, change its expiry in place with collMod (create_index with
+        a different expireAfterSeconds conflicts), or drop it when retention is 0.
+        """
+        index_name = f"{time_field}_ttl"
+        current = (await self.db[collection].index_information()).get(index_name)
+        if not expire:
+            if current:
+                await self.db[collection].drop_index(index_name)
+        elif current is None:
+            await self.db[collection].create_index(
+                [(time_field, 1)], expireAfterSeconds=expire, name=index_name
+            )
+        elif current.get("expireAfterSeconds") != expire:
+            await self.db.command(
+                "collMod", collection, index={"name": index_name, "expireAfterSeconds": expire}
+            )
 
     # create helpful indexes (run at startup)
-    async def ensure_indexes(self):
-        await self.db.transactions.create_index([("user_id", 1), ("transaction_date", -1)])
-        await self.db.transactions.create_index([("anomaly_score", -1)])
-        await self.db.login_logs.create_index([("user_id", 1), ("login_time", -1)])
-        await self.db.anomaly_logs.create_index([("user_id", 1), ("detected_at", -1)])
-        await self.db.anomaly_logs.create_index([("anomaly_score", -1)])
+    async def ensure_indexes(self, storage_mode: str = STORAGE_STANDARD, retention_days: int = 0,
+                             collections: list[str] | None = None):
+        """Storage and indexes for collections (default: every collection in COLLECTION_INDEXES)."""
+        await self.ensure_event_storage(storage_mode, retention_days, collections=collections)
+
+        for name, indexes in COLLECTION_INDEXES.items():
+            if collections is not None and name not in collections:
+                continue
+            for keys in indexes:
+                await self.db[name].create_index(keys)
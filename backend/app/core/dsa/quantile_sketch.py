@@ -0,0 +1,121 @@
+# app/core/dsa/quantile_sketch.py
+import math
+
+"""
+Mergeable streaming quantile sketch for transaction amounts.
+
+Log-bucketed histogram (DDSketch style): a value v lands in bucket
+ceil(log(v) / log(gamma)), so every quantile comes back with a bounded
+relative error `alpha`. Buckets are plain counters, which means:
+
+- two sketches merge by adding their counters (per-user -> population)
+- Redis can keep one as a HASH updated with HINCRBY (atomic, no read-modify-write)
+- the number of buckets depends on the value range, not the history length,
+  so percentile lookups are constant time per user
+"""
+
+DEFAULT_ALPHA = 0.02          # 2% relative accuracy
+MIN_VALUE = 0.01              # amounts below this share the zero bucket
+ZERO_BUCKET = "z"
+COUNT_FIELD = "n"
+
+
+class AmountSketch:
+    def __init__(self, alpha: float = DEFAULT_ALPHA, buckets: dict | None = None):
+        self.alpha = alpha
+        self.gamma = (1 + alpha) / (1 - alpha)
+        self._log_gamma = math.log(self.gamma)
+        self.buckets: dict[str, int] = dict(buckets or {})
+
+    # ---- bucketing ----
+    def bucket_for(self, value: float) -> str:
+        if value is None or value < MIN_VALUE:
+            return ZERO_BUCKET
+        return str(math.ceil(math.log(value) / self._log_gamma))
+
+    def bucket_value(self, bucket: str) -> float:
+        """Representative value of a bucket (midpoint in log space)."""
+        if bucket == ZERO_BUCKET:
+            return 0.0
+        i = int(bucket)
+        return 2 * self.gamma ** i / (self.gamma + 1)
+
+    @staticmethod
+    def _order(bucket: str) -> float:
+        return -math.inf if bucket == ZERO_BUCKET else int(bucket)
+
+    # ---- updates ----
+    def add(self, value: float, count: int = 1):
+        b = self.bucket_for(value)
+        self.buckets[b] = self.buckets.get(b, 0) + count
+
+    def merge(self, other: "AmountSketch"):
+        if other.alpha != self.alpha:
+            raise ValueError("Cannot merge sketches with different accuracy")
+        for b, c in other.buckets.items():
+            self.buckets[b] = self.buckets.get(b, 0) + c
+        return self
+
+    @property
+    def count(self) -> int:
+        return sum(self.buckets.values())
+
+    # ---- queries ----
+    def percentile(self, value: float) -> float | None:
+        """
+        Percentile rank (0-100) of `value` against everything seen so far.
+        Values sharing the bucket count as half below (mid-rank).
+        """
+        total = self.count
+        if not total:
+            return None
+        target = self._order(self.bucket_for(value))
+        below = equal = 0
+        for b, c in self.buckets.items():
+            o = self._order(b)
+            if o < target:
+                below += c
+            elif o == target:
+                equal += c
+        return 100.0 * (below + 0.5 * equal) / total
+
+    def quantile(self, q: float) -> float | None:
+        """Approximate value at quantile q (0-1)."""
+        total = self.count
+        if not total:
+            return None
+        rank = q * (total - 1)
+        seen = 0
+        for b in sorted(self.buckets, key=self._order):
+            seen += self.buckets[b]
+            if seen > rank:
+                return self.bucket_value(b)
+        return self.bucket_value(max(self.buckets, key=self._order))
+
+    # ---- (de)serialization to a Redis HASH ----
+    def to_hash(self) -> dict:
+        return {**self.buckets, COUNT_FIELD: self.count}
+
+    @classmethod
+    def from_hash(cls, data: dict | None, alpha: float = DEFAULT_ALPHA):
+        buckets = {
+            b: int(c) for b, c in (data or {}).items() if b != COUNT_FIELD
+        }
+        return cls(alpha=alpha, buckets=buckets)
+
+
+def blended_percentile(user: AmountSketch, population: AmountSketch, value: float, min_count: int = 20):
+    """
+    Percentile of `value` for a user; users with fewer than `min_count`
+    observations are blended with the population sketch by history size.
+    """
+    user_n = user.count
+    user_p = user.percentile(value)
+    pop_p = population.percentile(value)
+
+    if user_p is None:
+        return pop_p
+    if pop_p is None or user_n >= min_count:
+        return user_p
+    w = user_n / min_count
+    return w * user_p + (1 - w) * pop_p
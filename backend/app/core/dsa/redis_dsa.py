@@ -1,38 +1,57 @@
 # app/core/dsa/redis_dsa.py
 import json
 import time
+import heapq
+import math
+import hashlib
 from datetime import datetime
-from app.db.redis_client import rc
+from app.core.config import settings
+from app.db.redis_client import rc, shard_for, node_for_shard
+from app.core.dsa.quantile_sketch import AmountSketch, blended_percentile
+from app.core.dsa.user_state_cache import user_state
 
 """
 Redis DSA primitives used by routes/services:
 
 - Recent queue (LIST) for last N transactions/logins
 - Sliding window (LIST + TTL) for login attempts per minute
-- Priority queue (ZSET) for anomaly scores
-- Simple hash (HSET) to store last_device / last_ip
+- Priority queue (sharded ZSETs + per-entry payload keys) for anomaly scores,
+  time-decayed (forward decay) and bounded in size
+- Pub/sub channel for the live anomaly feed
+- Simple hash (HSET) to store last_device / last_ip (read through the in-process user_state L1)
+- Quantile sketch (HASH of bucket counters) for per-user amount percentiles
+- Bloom filters (bitmap) for per-user "seen device / IP / country" checks
 """
 
-# RECENT QUEUE keys (per-user)
-def push_recent_txn(user_id: str, txn: dict, limit: int = 10):
-    key = f"user:{user_id}:recent_txn"
+# RECENT QUEUE keys (per-user), newest first
+RECENT_LIMIT = 10
+RECENT_TTL = 60 * 60 * 24 * 7  # keep 7 days by default
+
+def _recent_txn_key(user_id: str):
+    return f"user:{user_id}:recent_txn"
+
+def _recent_login_key(user_id: str):
+    return f"user:{user_id}:recent_logins"
+
+def push_recent_txn(user_id: str, txn: dict, limit: int = RECENT_LIMIT):
+    key = _recent_txn_key(user_id)
     rc.lpush(key, json.dumps(txn))
     rc.ltrim(key, 0, limit - 1)
-    rc.expire(key, 60 * 60 * 24 * 7)  # keep 7 days by default
+    rc.expire(key, RECENT_TTL)
 
 def get_recent_txns(user_id: str):
-    key = f"user:{user_id}:recent_txn"
+    key = _recent_txn_key(user_id)
     raw = rc.lrange(key, 0, -1)
     return [json.loads(r) for r in raw]
 
-def push_recent_login(user_id: str, log: dict, limit: int = 10):
-    key = f"user:{user_id}:recent_logins"
+def push_recent_login(user_id: str, log: dict, limit: int = RECENT_LIMIT):
+    key = _recent_login_key(user_id)
     rc.lpush(key, json.dumps(log))
     rc.ltrim(key, 0, limit - 1)
-    rc.expire(key, 60 * 60 * 24 * 7)
+    rc.expire(key, RECENT_TTL)
 
 def get_recent_logins(user_id: str):
-    key = f"user:{user_id}:recent_logins"
+    key = _recent_login_key(user_id)
     raw = rc.lrange(key, 0, -1)
     return [json.loads(r) for r in raw]
 
@@ -51,38 +70,395 @@ def count_login_attempts(user_id: str):
     return rc.llen(key)  # attempts within window (TTL applied)
 
 
-# PRIORITY QUEUE FOR ANOMALIES (ZSET)
+# PRIORITY QUEUE FOR ANOMALIES (sharded ZSETs)
+# Shard i: ZSET "anomalies:{i}:queue" + HASH "anomalies:{i}:meta" (id -> raw score)
+# + one STRING per entry "anomalies:{i}:payload:<id>" with its own TTL. The {i}
+# hash tag keeps a shard's keys on one cluster slot; shards are spread over
+# REDIS_SHARD_URLS nodes (see redis_client.py).
+#
+# Ordering is time-decayed with forward decay in log space: an entry scored s at
+# time t is stored with priority ln(s) + lambda * (t - LANDMARK), lambda = ln 2 / half-life.
+# Its decayed score now is s * 2^(-(now - t) / half-life), whose log is
+# priority - lambda * (now - LANDMARK): the same shift for every entry, so ZSET
+# order is always decayed-score order with no periodic rescoring, and logs keep
+# the numbers small. Each shard keeps at most ANOMALY_QUEUE_MAX / shards
+# entries; the lowest priorities are evicted on insert.
+ANOMALY_QUEUE_SHARDS = settings.ANOMALY_QUEUE_SHARDS
+ANOMALY_DECAY_HALF_LIFE = settings.ANOMALY_DECAY_HALF_LIFE
+ANOMALY_QUEUE_MAX = settings.ANOMALY_QUEUE_MAX
+DECAY_LANDMARK = 1704067200.0  # 2024-01-01 UTC, fixed so priorities stay comparable
+MIN_DECAY_SCORE = 1e-9         # ln(0) guard
+
+def _queue_key(shard: int):
+    return f"anomalies:{{{shard}}}:queue"
+
+def _meta_key(shard: int):
+    return f"anomalies:{{{shard}}}:meta"
+
+def _payload_key(shard: int, anomaly_id: str):
+    return f"anomalies:{{{shard}}}:payload:{anomaly_id}"
+
+def anomaly_priority(score: float, ts: float | None = None) -> float:
+    if ANOMALY_DECAY_HALF_LIFE <= 0:
+        return float(score)
+    ts = time.time() if ts is None else ts
+    rate = math.log(2) / ANOMALY_DECAY_HALF_LIFE
+    return math.log(max(float(score), MIN_DECAY_SCORE)) + rate * (ts - DECAY_LANDMARK)
+
+def _anomaly_shard(anomaly_id: str, payload: dict | None = None):
+    # hash by user when known so one user's anomalies stay together
+    key = (payload or {}).get("user_id") or anomaly_id
+    return shard_for(str(key), ANOMALY_QUEUE_SHARDS)
+
 def push_anomaly_score(anomaly_id: str, score: float, payload: dict, payload_ttl: int = 3600):
-    # store score in sorted set and payload in hash
-    rc.zadd("anomalies:queue", {anomaly_id: score})
-    rc.hset("anomalies:payloads", anomaly_id, json.dumps(payload))
-    rc.expire("anomalies:payloads", payload_ttl)
+    shard = _anomaly_shard(anomaly_id, payload)
+    node = node_for_shard(shard)
+    # MULTI so no reader sees the priority without its meta entry (see reencode_legacy_priorities)
+    pipe = node.pipeline(transaction=True)
+    pipe.zadd(_queue_key(shard), {anomaly_id: anomaly_priority(score)})
+    pipe.hset(_meta_key(shard), anomaly_id, score)
+    pipe.set(_payload_key(shard, anomaly_id), json.dumps(payload), ex=payload_ttl)
+    pipe.zcard(_queue_key(shard))
+    added, _, _, size = pipe.execute()
+    cap = max(1, ANOMALY_QUEUE_MAX // ANOMALY_QUEUE_SHARDS)
+    if size > cap:
+        _evict_lowest(node, shard, size - cap)
+    publish_anomaly_event({
+        "event": "anomaly" if added else "score_update",
+        "anomaly_id": anomaly_id,
+        "score": score,
+        "user_id": payload.get("user_id"),
+        "type": payload.get("type"),
+        "details": payload.get("details"),
+    })
+
+# LIVE FEED: anomaly events fanned out to dashboards (services/anomaly_feed.py)
+ANOMALY_FEED_CHANNEL = "anomalies:feed"
+
+def publish_anomaly_event(event: dict):
+    # fire-and-forget; PUBLISH with no subscribers is a no-op for Redis
+    event.setdefault("ts", time.time())
+    rc.publish(ANOMALY_FEED_CHANNEL, json.dumps(event, default=str))
+
+def _evict_lowest(node, shard: int, count: int):
+    # ZPOPMIN is atomic, so concurrent inserts never evict the same entry twice
+    evicted = [aid for aid, _ in node.zpopmin(_queue_key(shard), count)]
+    if not evicted:
+        return
+    pipe = node.pipeline(transaction=False)
+    pipe.hdel(_meta_key(shard), *evicted)
+    pipe.delete(*(_payload_key(shard, aid) for aid in evicted))
+    pipe.execute()
+
+# pre-sharding layout: one ZSET (id -> raw score) + one HASH of payloads sharing a TTL
+LEGACY_QUEUE_KEY = "anomalies:queue"
+LEGACY_PAYLOADS_KEY = "anomalies:payloads"
+
+def migrate_legacy_anomaly_queue(batch_size: int = 500) -> int:
+    """
+    One-time move of the old unsharded queue into the shards (run at startup;
+    a no-op once the legacy keys are gone). Entries already in a shard keep
+    their newer state; legacy entries are ranked as if scored now.
+    """
+    payload_ttl = rc.ttl(LEGACY_PAYLOADS_KEY)
+    payload_ttl = payload_ttl if payload_ttl > 0 else 3600
+    moved = 0
+    while True:
+        items = rc.zrevrange(LEGACY_QUEUE_KEY, 0, batch_size - 1, withscores=True)
+        if not items:
+            break
+        ids = [aid for aid, _ in items]
+        payloads = rc.hmget(LEGACY_PAYLOADS_KEY, ids)
+        touched = set()
+        for (aid, score), raw in zip(items, payloads):
+            payload = json.loads(raw) if raw else {}
+            shard = _anomaly_shard(aid, payload)
+            pipe = node_for_shard(shard).pipeline(transaction=True)
+            pipe.zadd(_queue_key(shard), {aid: anomaly_priority(score)}, nx=True)
+            pipe.hsetnx(_meta_key(shard), aid, score)
+            if raw:
+                pipe.set(_payload_key(shard, aid), raw, ex=payload_ttl, nx=True)
+            pipe.execute()
+            touched.add(shard)
+        pipe = rc.pipeline(transaction=False)
+        pipe.zrem(LEGACY_QUEUE_KEY, *ids)
+        pipe.hdel(LEGACY_PAYLOADS_KEY, *ids)
+        pipe.execute()
+        moved += len(ids)
+        cap = max(1, ANOMALY_QUEUE_MAX // ANOMALY_QUEUE_SHARDS)
+        for shard in touched:
+            node = node_for_shard(shard)
+            size = node.zcard(_queue_key(shard))
+            if size > cap:
+                _evict_lowest(node, shard, size - cap)
+    if moved:
+        rc.delete(LEGACY_PAYLOADS_KEY)  # payloads whose queue entry was already gone
+        print(f"📦 Moved {moved} anomalies from the legacy queue into {ANOMALY_QUEUE_SHARDS} shards")
+    return moved
+
+def reencode_legacy_priorities(batch_size: int = 500) -> int:
+    """
+    One-time upgrade of shard entries queued before forward decay (raw score
+    in the ZSET, no meta field): re-rank them with anomaly_priority(score) as
+    if scored now, so they are not ranked below, and evicted before, every
+    decayed entry. Run at startup; each shard is marked once done.
+    """
+    total = 0
+    for shard in range(ANOMALY_QUEUE_SHARDS):
+        node = node_for_shard(shard)
+        qkey, mkey, done_key = _queue_key(shard), _meta_key(shard), f"anomalies:{{{shard}}}:reencoded"
+        if node.exists(done_key):
+            continue
+        ids = [aid for aid, _ in node.zscan_iter(qkey, count=batch_size)]
+        for i in range(0, len(ids), batch_size):
+            chunk = ids[i:i + batch_size]
+
+            def upgrade(pipe):
+                # WATCHed read, then MULTI: a concurrent push or pop makes redis-py retry the chunk
+                raw = pipe.zmscore(qkey, chunk)
+                meta = pipe.hmget(mkey, chunk)
+                legacy = [(aid, s) for aid, s, m in zip(chunk, raw, meta) if s is not None and m is None]
+                pipe.multi()
+                for aid, score in legacy:
+                    pipe.zadd(qkey, {aid: anomaly_priority(score)}, xx=True)
+                    pipe.hset(mkey, aid, score)
+                return len(legacy)
+
+            total += node.transaction(upgrade, qkey, mkey, value_from_callable=True)
+        node.set(done_key, 1)
+    if total:
+        print(f"📦 Re-encoded {total} legacy anomaly queue entries with decayed priorities")
+    return total
+
+def _top_per_shard(limit: int):
+    # (priority, shard, id) candidates: the global top-N is within each shard's top-N
+    candidates = []
+    for shard in range(ANOMALY_QUEUE_SHARDS):
+        items = node_for_shard(shard).zrevrange(_queue_key(shard), 0, limit - 1, withscores=True)
+        candidates.extend((float(score), shard, aid) for aid, score in items)
+    return heapq.nlargest(limit, candidates)
+
+def _raw_scores(top) -> list:
+    # raw scores from the shards' meta hashes; an entry without one (not yet re-encoded) falls back to its ZSET score
+    by_shard = {}
+    for _, shard, aid in top:
+        by_shard.setdefault(shard, []).append(aid)
+    raw = {}
+    for shard, ids in by_shard.items():
+        for aid, value in zip(ids, node_for_shard(shard).hmget(_meta_key(shard), ids)):
+            raw[aid] = float(value) if value is not None else None
+    return [raw[aid] if raw[aid] is not None else priority for priority, _, aid in top]
 
 def peek_top_anomalies(limit: int = 10):
-    # return list of (id, score)
-    return rc.zrevrange("anomalies:queue", 0, limit - 1, withscores=True)
+    # return list of (id, score), highest decayed priority first
+    top = _top_per_shard(limit)
+    return [(aid, score) for (_, _, aid), score in zip(top, _raw_scores(top))]
 
 def pop_top_anomalies(limit: int = 10):
-    items = rc.zrevrange("anomalies:queue", 0, limit - 1, withscores=True)
+    top = _top_per_shard(limit)
+    by_shard = {}
+    for priority, shard, aid in top:
+        by_shard.setdefault(shard, []).append((aid, priority))
+
     results = []
-    for aid, score in items:
-        payload_raw = rc.hget("anomalies:payloads", aid)
-        payload = json.loads(payload_raw) if payload_raw else None
-        results.append((aid, float(score), payload))
-        # remove
-        rc.zrem("anomalies:queue", aid)
-        rc.hdel("anomalies:payloads", aid)
-    return results
+    for shard, items in by_shard.items():
+        node = node_for_shard(shard)
+        # claim first: only the consumer whose ZREM succeeds owns the entry
+        pipe = node.pipeline(transaction=False)
+        for aid, _ in items:
+            pipe.zrem(_queue_key(shard), aid)
+        claimed = [item for item, removed in zip(items, pipe.execute()) if removed]
+        if not claimed:
+            continue
+
+        pipe = node.pipeline(transaction=False)
+        for aid, _ in claimed:
+            pipe.getdel(_payload_key(shard, aid))
+            pipe.hget(_meta_key(shard), aid)
+            pipe.hdel(_meta_key(shard), aid)
+        replies = pipe.execute()
+        for i, (aid, priority) in enumerate(claimed):
+            payload_raw, raw_score = replies[3 * i], replies[3 * i + 1]
+            payload = json.loads(payload_raw) if payload_raw else None
+            score = float(raw_score) if raw_score is not None else priority
+            results.append((priority, aid, score, payload))
+
+    # (id, raw score, payload), highest decayed priority first
+    results.sort(key=lambda r: r[0], reverse=True)
+    return [r[1:] for r in results]
 
 # last device/ip quick access
 def set_last_device(user_id: str, device_id: str):
     rc.hset("user:last_device", user_id, device_id)
+    user_state.put(user_id, "last_device", device_id)
 
 def get_last_device(user_id: str):
-    return rc.hget("user:last_device", user_id)
+    return user_state.get(user_id, "last_device", lambda: rc.hget("user:last_device", user_id))
 
 def set_last_ip(user_id: str, ip: str):
     rc.hset("user:last_ip", user_id, ip)
+    user_state.put(user_id, "last_ip", ip)
 
 def get_last_ip(user_id: str):
-    return rc.hget("user:last_ip", user_id)
+    return user_state.get(user_id, "last_ip", lambda: rc.hget("user:last_ip", user_id))
+
+def warm_user_state(users: list[dict], overwrite: bool = False) -> dict:
+    """
+    Bulk rebuild (services/redis_warmup.py), two pipelined round trips.
+    users: [{"user_id", "recent_txn": [newest first], "recent_logins": [...],
+             "last_device", "last_ip"}], list items already JSON-serializable.
+    Without overwrite, keys written by live traffic since the flush are kept.
+    """
+    pipe = rc.pipeline(transaction=False)
+    if not overwrite:
+        for u in users:
+            pipe.exists(_recent_txn_key(u["user_id"]))
+            pipe.exists(_recent_login_key(u["user_id"]))
+    exists = pipe.execute() if not overwrite else [0] * (2 * len(users))
+
+    written = {"recent_txn": 0, "recent_logins": 0, "last_device": 0, "last_ip": 0}
+    pipe = rc.pipeline(transaction=False)
+    for i, u in enumerate(users):
+        uid = u["user_id"]
+        for field, key, live in (("recent_txn", _recent_txn_key(uid), exists[2 * i]),
+                                 ("recent_logins", _recent_login_key(uid), exists[2 * i + 1])):
+            items = u.get(field)
+            if not items or live:
+                continue
+            if overwrite:
+                pipe.delete(key)
+            pipe.rpush(key, *(json.dumps(item) for item in items[:RECENT_LIMIT]))
+            pipe.expire(key, RECENT_TTL)
+            written[field] += 1
+        for field, key in (("last_device", "user:last_device"), ("last_ip", "user:last_ip")):
+            if u.get(field) is not None:
+                (pipe.hset if overwrite else pipe.hsetnx)(key, uid, u[field])
+                written[field] += 1
+    pipe.execute()
+    return written
+
+
+# AMOUNT QUANTILE SKETCHES (HASH of log-bucket counters, see quantile_sketch.py)
+SKETCH_TTL = 60 * 60 * 24 * 180  # drop sketches of users inactive for 6 months
+
+def _sketch_keys(user_id: str | None, category: str | None):
+    keys = ["sketch:amount:pop"]
+    if category:
+        keys.append(f"sketch:amount:pop:cat:{category}")
+    if user_id:
+        keys.append(f"sketch:amount:user:{user_id}")
+        if category:
+            keys.append(f"sketch:amount:user:{user_id}:cat:{category}")
+    return keys
+
+def update_amount_sketch(user_id: str, amount: float, category: str | None = None):
+    # one round trip: bump the bucket in user, user+category and population sketches
+    bucket = AmountSketch().bucket_for(amount)
+    pipe = rc.pipeline(transaction=False)
+    for key in _sketch_keys(user_id, category):
+        pipe.hincrby(key, bucket, 1)
+        pipe.hincrby(key, "n", 1)
+        if ":user:" in key:
+            pipe.expire(key, SKETCH_TTL)
+    pipe.execute()
+
+def get_amount_sketch(key: str) -> AmountSketch:
+    return AmountSketch.from_hash(rc.hgetall(key))
+
+def amount_percentile(user_id: str, amount: float, category: str | None = None, min_count: int = 20):
+    """
+    Percentile (0-100) of `amount` for this user (per category when given).
+    Users with fewer than `min_count` transactions are blended with the
+    population sketch, weighted by how much history they have.
+    """
+    pop_key = f"sketch:amount:pop:cat:{category}" if category else "sketch:amount:pop"
+    user_key = f"sketch:amount:user:{user_id}:cat:{category}" if category else f"sketch:amount:user:{user_id}"
+
+    pipe = rc.pipeline(transaction=False)
+    pipe.hgetall(user_key)
+    pipe.hgetall(pop_key)
+    user_raw, pop_raw = pipe.execute()
+
+    return blended_percentile(
+        AmountSketch.from_hash(user_raw), AmountSketch.from_hash(pop_raw), amount, min_count
+    )
+
+def merge_amount_sketches(dest_key: str, src_keys: list[str]):
+    # rebuild a population sketch from per-user sketches (e.g. after a flush)
+    merged = AmountSketch()
+    for key in src_keys:
+        merged.merge(get_amount_sketch(key))
+    pipe = rc.pipeline()
+    pipe.delete(dest_key)
+    if merged.buckets:
+        pipe.hset(dest_key, mapping=merged.to_hash())
+    pipe.execute()
+    return merged
+
+
+# SEEN FILTERS: per-user Bloom filter on a Redis bitmap ("user:<id>:seen:<kind>")
+# answers "has this user used this device / IP / country before" in one round trip
+SEEN_FILTER_CAPACITY = settings.SEEN_FILTER_CAPACITY
+SEEN_FILTER_FP_RATE = settings.SEEN_FILTER_FP_RATE
+SEEN_FILTER_TTL = 60 * 60 * 24 * 180
+
+def _bloom_params(capacity: int, fp_rate: float):
+    m = math.ceil(-capacity * math.log(fp_rate) / math.log(2) ** 2)
+    k = max(1, round(m / capacity * math.log(2)))
+    return m, k
+
+SEEN_FILTER_BITS, SEEN_FILTER_HASHES = _bloom_params(SEEN_FILTER_CAPACITY, SEEN_FILTER_FP_RATE)
+
+def _bloom_positions(value: str):
+    # double hashing (Kirsch-Mitzenmacher) from one 128-bit digest
+    digest = hashlib.blake2b(value.encode(), digest_size=16).digest()
+    h1 = int.from_bytes(digest[:8], "little")
+    h2 = int.from_bytes(digest[8:], "little") | 1
+    return [(h1 + i * h2) % SEEN_FILTER_BITS for i in range(SEEN_FILTER_HASHES)]
+
+def seen_filters_check(user_id: str, values: dict, add: bool = True):
+    """
+    values: {"device": ..., "ip": ..., "country": ...} (None values are skipped)
+    Returns {kind: True (seen before) / False (new) / None (no history yet)}.
+    With add=True the values are recorded in the same round trip
+    (SETBIT returns the previous bit, so check-and-add is one command per bit).
+    """
+    kinds = [(kind, str(v)) for kind, v in values.items() if v is not None]
+    if not kinds:
+        return {kind: None for kind in values}
+
+    pipe = rc.pipeline(transaction=False)
+    for kind, value in kinds:
+        key = f"user:{user_id}:seen:{kind}"
+        pipe.exists(key)
+        for pos in _bloom_positions(value):
+            if add:
+                pipe.setbit(key, pos, 1)
+            else:
+                pipe.getbit(key, pos)
+        if add:
+            pipe.expire(key, SEEN_FILTER_TTL)
+    replies = pipe.execute()
+
+    result = {kind: None for kind in values}
+    step = 1 + SEEN_FILTER_HASHES + (1 if add else 0)
+    for i, (kind, _) in enumerate(kinds):
+        chunk = replies[i * step:(i + 1) * step]
+        existed, bits = chunk[0], chunk[1:1 + SEEN_FILTER_HASHES]
+        result[kind] = all(bits) if existed else None
+    return result
+
+def seen_filters_add_many(entries: list):
+    # bulk load: entries of (user_id, kind, value), one pipelined round trip
+    pipe = rc.pipeline(transaction=False)
+    keys = set()
+    for user_id, kind, value in entries:
+        if value is None:
+            continue
+        key = f"user:{user_id}:seen:{kind}"
+        keys.add(key)
+        for pos in _bloom_positions(str(value)):
+            pipe.setbit(key, pos, 1)
+    for key in keys:
+        pipe.expire(key, SEEN_FILTER_TTL)
+    pipe.execute()
@@ -0,0 +1,180 @@
+# app/core/dsa/user_state_cache.py
+import sys
+import time
+import threading
+from collections import OrderedDict
+
+from app.core.config import settings
+
+"""
+In-process L1 for hot per-user context (last device / IP, last transaction
+and login times, login count), in front of the redis_dsa accessors and the
+Mongo lookups done during enrichment.
+
+- one __slots__ record per user (no per-instance dict), fields start as
+  MISSING and are loaded lazily, one at a time
+- LRU eviction against a byte budget (USER_STATE_CACHE_MAX_BYTES), so the
+  footprint is bounded no matter how many users are active; sizes are
+  estimated with sys.getsizeof per record plus a fixed OrderedDict overhead
+- records expire USER_STATE_CACHE_TTL seconds after they are created, which
+  bounds staleness from writes in other processes; writes in this process go
+  through put(), so local readers never see stale values
+- peek / put / invalidate hold a lock: besides the event loop, lookups run
+  in worker threads (asyncio.to_thread in the enrichment pipeline); loaders
+  run outside it
+- every record has a generation, bumped by put() and invalidate(); get() /
+  aget() note it before calling the loader and only store the loaded value if
+  it is unchanged, so a read racing a write never overwrites the newer value
+"""
+
+FIELDS = ("last_device", "last_ip", "last_txn_at", "last_login_at", "login_count")
+MISSING = object()
+ENTRY_OVERHEAD = 140  # OrderedDict node + key/value references (measured with tracemalloc)
+
+
+class UserState:
+    __slots__ = ("expires", "size", "gen") + FIELDS
+
+    def __init__(self, expires: float):
+        self.expires = expires
+        self.size = 0
+        self.gen = 0
+        for f in FIELDS:
+            setattr(self, f, MISSING)
+
+
+def _sizeof(user_id: str, rec: UserState) -> int:
+    size = ENTRY_OVERHEAD + sys.getsizeof(user_id) + sys.getsizeof(rec)
+    for f in FIELDS:
+        v = getattr(rec, f)
+        if v is not MISSING and v is not None:
+            size += sys.getsizeof(v)
+    return size
+
+
+class UserStateCache:
+    def __init__(self, max_bytes: int = 64 * 1024 * 1024, ttl: float = 10.0):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.bytes = 0
+        self.evictions = 0
+        self._data: OrderedDict[str, UserState] = OrderedDict()
+        self.stats = {f: {"hits": 0, "misses": 0} for f in FIELDS}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._data)
+
+    # ---- records ----
+    def _record(self, user_id: str, create: bool) -> UserState | None:
+        rec = self._data.get(user_id)
+        if rec is not None and rec.expires < time.monotonic():
+            self._drop(user_id)
+            rec = None
+        if rec is None and create:
+            rec = UserState(time.monotonic() + self.ttl)
+            rec.size = _sizeof(user_id, rec)
+            self._data[user_id] = rec
+            self.bytes += rec.size
+        elif rec is not None:
+            self._data.move_to_end(user_id)
+        return rec
+
+    def _drop(self, user_id: str):
+        rec = self._data.pop(user_id, None)
+        if rec is not None:
+            self.bytes -= rec.size
+
+    def _evict(self):
+        while self.bytes > self.max_bytes and self._data:
+            _, rec = self._data.popitem(last=False)
+            self.bytes -= rec.size
+            self.evictions += 1
+
+    # ---- fields ----
+    def _set(self, user_id: str, rec: UserState, field: str, value):
+        setattr(rec, field, value)
+        size = _sizeof(user_id, rec)
+        self.bytes += size - rec.size
+        rec.size = size
+        self._evict()
+
+    def _peek(self, user_id: str, field: str) -> tuple:
+        """(value or MISSING, generation to hand back to _fill)."""
+        with self._lock:
+            rec = self._record(user_id, create=False)
+            value = getattr(rec, field) if rec is not None else MISSING
+            self.stats[field]["hits" if value is not MISSING else "misses"] += 1
+            return value, rec.gen if rec is not None else 0
+
+    def _fill(self, user_id: str, field: str, value, gen: int):
+        # store a loaded value unless a put() / invalidate() happened since _peek
+        if not user_id:
+            return value
+        with self._lock:
+            rec = self._record(user_id, create=True)
+            if rec.gen != gen:
+                current = getattr(rec, field)
+                return value if current is MISSING else current
+            self._set(user_id, rec, field, value)
+        return value
+
+    def peek(self, user_id: str, field: str):
+        return self._peek(user_id, field)[0]
+
+    def put(self, user_id: str, field: str, value):
+        if not user_id:
+            return
+        with self._lock:
+            rec = self._record(user_id, create=True)
+            rec.gen += 1
+            self._set(user_id, rec, field, value)
+
+    def get(self, user_id: str, field: str, loader):
+        value, gen = self._peek(user_id, field)
+        if value is MISSING:
+            value = self._fill(user_id, field, loader(), gen)
+        return value
+
+    async def aget(self, user_id: str, field: str, loader):
+        value, gen = self._peek(user_id, field)
+        if value is MISSING:
+            value = self._fill(user_id, field, await loader(), gen)
+        return value
+
+    def invalidate(self, user_id: str):
+        # keep an empty record with a bumped generation, so loads already in flight are not stored
+        with self._lock:
+            rec = self._record(user_id, create=True)
+            rec.gen += 1
+            for f in FIELDS:
+                setattr(rec, f, MISSING)
+            size = _sizeof(user_id, rec)
+            self.bytes += size - rec.size
+            rec.size = size
+            self._evict()
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            entries, used = len(self._data), self.bytes
+        hits = sum(s["hits"] for s in self.stats.values())
+        lookups = hits + sum(s["misses"] for s in self.stats.values())
+        return {
+            "entries": entries,
+            "bytes": used,
+            "max_bytes": self.max_bytes,
+            "bytes_per_entry": round(used / entries, 1) if entries else None,
+            "evictions": self.evictions,
+            "ttl": self.ttl,
+            "hit_rate": round(hits / lookups, 4) if lookups else None,
+            "fields": {
+                f: {**s, "hit_rate": round(s["hits"] / (s["hits"] + s["misses"]), 4) if s["hits"] + s["misses"] else None}
+                for f, s in self.stats.items()
+            },
+        }
+
+
+user_state = UserStateCache(
+    max_bytes=settings.USER_STATE_CACHE_MAX_BYTES,
+    ttl=settings.USER_STATE_CACHE_TTL,
+)
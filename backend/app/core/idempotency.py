@@ -0,0 +1,135 @@
+# app/core/idempotency.py
+import json
+import time
+import asyncio
+import uuid
+import hashlib
+from fastapi import HTTPException, status
+from redis.exceptions import ResponseError
+
+from app.core.config import settings
+from app.db.redis_client import rc
+
+"""
+Idempotency-Key support for non-idempotent POSTs (e.g. create transaction).
+
+    idem:<scope>:<key> -> {"state": "pending" | "done", "fp": <request hash>, "response": ...}
+
+The first request claims the key with SET NX GET (one round trip that either
+claims it or returns the current entry; NX together with GET needs Redis 7.0,
+older servers fall back to SET NX + GET). The owner runs the handler and
+stores the response for IDEMPOTENCY_TTL; a failure deletes the claim so
+the client can retry. The claim expires after IDEMPOTENCY_LOCK_TTL if the
+owner dies, and is renewed every third of that while the handler runs, so a
+request queued behind a busy partition or slow enrichment keeps it. A
+duplicate:
+
+- done     -> gets the stored response (one Redis read, no handler work)
+- pending  -> polls until the owner finishes (up to IDEMPOTENCY_WAIT), else 409
+- a different request body under the same key -> 422
+"""
+
+PENDING = "pending"
+DONE = "done"
+
+
+def request_fingerprint(payload) -> str:
+    raw = json.dumps(payload, sort_keys=True, default=str).encode()
+    return hashlib.blake2b(raw, digest_size=16).hexdigest()
+
+
+class IdempotencyStore:
+    def __init__(self, ttl: int = 86400, lock_ttl: int = 30, wait: float = 10.0, poll_interval: float = 0.05):
+        self.ttl = ttl                  # how long completed responses are replayed
+        self.lock_ttl = lock_ttl        # claim expiry if the owner dies mid-request
+        self.wait = wait
+        self.poll_interval = poll_interval
+        self._nx_get = True             # flips off on Redis < 7.0
+        self.stats = {"claimed": 0, "replayed": 0, "waited": 0, "conflicts": 0, "failed": 0}
+
+    @staticmethod
+    def _key(scope: str, key: str) -> str:
+        return f"idem:{scope}:{key}"
+
+    def _claim(self, redis_key: str, claim: str):
+        """None if we own the key now, else the existing entry."""
+        if self._nx_get:
+            try:
+                prev = rc.set(redis_key, claim, nx=True, ex=self.lock_ttl, get=True)
+                return json.loads(prev) if prev else None
+            except ResponseError:
+                self._nx_get = False  # "syntax error": NX and GET together need Redis 7.0
+        while True:
+            if rc.set(redis_key, claim, nx=True, ex=self.lock_ttl):
+                return None
+            prev = rc.get(redis_key)
+            if prev:
+                return json.loads(prev)
+            # expired / deleted between the two calls: try to claim again
+
+    async def _keep_claim(self, redis_key: str, claim: str):
+        # extend our pending claim while the handler runs; stop once it is no longer ours
+        while True:
+            await asyncio.sleep(self.lock_ttl / 3)
+            if rc.get(redis_key) != claim:
+                return
+            rc.expire(redis_key, self.lock_ttl)
+
+    async def run(self, scope: str, key: str | None, fingerprint: str, handler):
+        """
+        Run `await handler()` at most once per (scope, key) and return
+        (response, replayed). The response must be JSON serializable.
+        """
+        if not key:
+            return await handler(), False
+        if len(key) > 255:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Idempotency-Key too long")
+
+        redis_key = self._key(scope, key)
+        claim = json.dumps({"state": PENDING, "fp": fingerprint, "owner": uuid.uuid4().hex})
+        deadline = time.monotonic() + self.wait
+        waited = False
+        while True:
+            entry = self._claim(redis_key, claim)
+            if entry is None:
+                break
+            if entry.get("fp") != fingerprint:
+                self.stats["conflicts"] += 1
+                raise HTTPException(
+                    status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                    detail="Idempotency-Key was already used with a different request",
+                )
+            if entry["state"] == DONE:
+                self.stats["replayed"] += 1
+                return entry["response"], True
+
+            # someone else is running it: wait for their result (or for the claim to vanish)
+            if not waited:
+                self.stats["waited"] += 1
+                waited = True
+            if time.monotonic() >= deadline:
+                raise HTTPException(
+                    status_code=status.HTTP_409_CONFLICT,
+                    detail="A request with this Idempotency-Key is still in progress",
+                )
+            await asyncio.sleep(self.poll_interval)
+
+        self.stats["claimed"] += 1
+        keeper = asyncio.create_task(self._keep_claim(redis_key, claim))
+        try:
+            response = json.loads(json.dumps(await handler(), default=str))
+        except BaseException:
+            self.stats["failed"] += 1
+            rc.delete(redis_key)
+            raise
+        finally:
+            keeper.cancel()
+        rc.set(redis_key, json.dumps({"state": DONE, "fp": fingerprint, "response": response}), ex=self.ttl)
+        return response, False
+
+
+idempotency = IdempotencyStore(
+    ttl=settings.IDEMPOTENCY_TTL,
+    lock_ttl=settings.IDEMPOTENCY_LOCK_TTL,
+    wait=settings.IDEMPOTENCY_WAIT,
+)
@@ -0,0 +1,248 @@
+# app/core/profiling.py
+import io
+import os
+import re
+import sys
+import time
+import hmac
+import marshal
+import random
+import pstats
+import hashlib
+import cProfile
+import threading
+from collections import Counter
+from datetime import datetime
+
+from app.core.config import settings
+
+"""
+On-demand per-request profiling.
+
+ProfilingMiddleware is only mounted when PROFILING_ENABLED is set, so a
+disabled deployment pays nothing. When mounted, a request is profiled if
+
+- it carries a valid signed header
+      X-Profile: <unix_ts>:<hex hmac_sha256(PROFILING_SECRET, "<unix_ts>:<METHOD>:<path>")>
+  (valid for PROFILING_SIGNATURE_TTL seconds; header triggering is off while
+  PROFILING_SECRET is empty), or
+- it is picked by PROFILING_SAMPLE_RATE.
+
+Modes:
+- "sample": a background thread samples the event-loop thread's stack every
+  PROFILING_INTERVAL_MS and writes collapsed stacks (.folded, loadable by
+  flamegraph.pl / speedscope)
+- "cprofile": deterministic cProfile, written as a pstats dump (.prof)
+
+Both observe the whole event-loop thread, so work from concurrent requests
+can show up in a profile. Only one request is profiled at a time.
+
+Profiles are stored as <PROFILING_DIR>/<route>/<timestamp>_<method>_<status>_<ms>ms.<ext>
+and served under /admin/profiles (admin only: stacks and timings cover every
+concurrent request).
+"""
+
+MODES = {"sample": ".folded", "cprofile": ".prof"}
+HEADER = b"x-profile"
+
+
+def sign(method: str, path: str, ts: int | None = None, secret: str | None = None) -> str:
+    """Header value that triggers profiling of METHOD path (for ops tooling)."""
+    ts = int(ts or time.time())
+    mac = hmac.new((secret or settings.PROFILING_SECRET).encode(), f"{ts}:{method.upper()}:{path}".encode(), hashlib.sha256)
+    return f"{ts}:{mac.hexdigest()}"
+
+
+def _route_slug(path: str) -> str:
+    return re.sub(r"[^A-Za-z0-9_.-]+", "_", path.strip("/")) or "root"
+
+
+class StackSampler:
+    """Samples one thread's Python stack at a fixed interval into folded stacks."""
+
+    def __init__(self, thread_id: int, interval: float = 0.005):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.counts: Counter = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="profile-sampler", daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                name = getattr(code, "co_qualname", code.co_name)
+                stack.append(f"{name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+                frame = frame.f_back
+            if stack:
+                self.counts[";".join(reversed(stack))] += 1
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self) -> str:
+        self._stop.set()
+        self._thread.join()
+        return "".join(f"{stack} {n}\n" for stack, n in self.counts.most_common())
+
+
+class RequestProfiler:
+    def __init__(self, directory: str, mode: str = "sample", sample_rate: float = 0.0,
+                 secret: str = "", signature_ttl: int = 300, interval_ms: float = 5, max_files: int = 500):
+        if mode not in MODES:
+            raise ValueError(f"mode must be one of {sorted(MODES)}")
+        self.directory = directory
+        self.mode = mode
+        self.sample_rate = sample_rate
+        self.secret = secret
+        self.signature_ttl = signature_ttl
+        self.interval = interval_ms / 1000
+        self.max_files = max_files
+        self._busy = threading.Lock()
+        self.stats = {"profiled": 0, "skipped_busy": 0, "bad_signature": 0}
+
+    # ---- triggering ----
+    def _signed(self, scope) -> bool:
+        value = next((v for k, v in scope["headers"] if k == HEADER), None)
+        if value is None or not self.secret:
+            return False
+        try:
+            ts, mac = value.split(b":", 1)
+            fresh = abs(time.time() - int(ts)) <= self.signature_ttl
+        except ValueError:
+            fresh = False
+        # compare bytes: compare_digest raises TypeError on non-ASCII str
+        if fresh and hmac.compare_digest(mac, sign(scope["method"], scope["path"], int(ts), self.secret).split(":", 1)[1].encode()):
+            return True
+        self.stats["bad_signature"] += 1
+        return False
+
+    def wanted(self, scope) -> bool:
+        return self._signed(scope) or (self.sample_rate > 0 and random.random() < self.sample_rate)
+
+    # ---- storage ----
+    def _write(self, route: str, method: str, status: int, elapsed_ms: float, data: bytes) -> str:
+        folder = os.path.join(self.directory, _route_slug(route))
+        os.makedirs(folder, exist_ok=True)
+        stamp = datetime.utcnow().strftime("%Y%m%dT%H%M%S%f")
+        path = os.path.join(folder, f"{stamp}_{method}_{status}_{int(elapsed_ms)}ms{MODES[self.mode]}")
+        with open(path, "wb") as fh:
+            fh.write(data)
+        self._prune()
+        return path
+
+    def _prune(self):
+        files = self.list()
+        for entry in files[self.max_files:]:
+            try:
+                os.remove(os.path.join(self.directory, entry["route"], entry["name"]))
+            except OSError:
+                pass
+
+    def list(self) -> list[dict]:
+        """Stored profiles, newest first."""
+        out = []
+        if not os.path.isdir(self.directory):
+            return out
+        for route in os.listdir(self.directory):
+            folder = os.path.join(self.directory, route)
+            if not os.path.isdir(folder):
+                continue
+            for name in os.listdir(folder):
+                try:
+                    stamp, method, status, ms = os.path.splitext(name)[0].split("_")[:4]
+                except ValueError:
+                    continue  # not ours
+                out.append({
+                    "route": route, "name": name, "created_at": stamp, "method": method,
+                    "status": int(status), "elapsed_ms": int(ms.rstrip("ms")),
+                    "bytes": os.path.getsize(os.path.join(folder, name)),
+                })
+        out.sort(key=lambda e: e["created_at"], reverse=True)
+        return out
+
+    def path_of(self, route: str, name: str) -> str | None:
+        # both parts come from list(); refuse anything that could escape the directory
+        for part in (route, name):
+            if part in ("", ".", "..") or os.path.basename(part) != part:
+                return None
+        root = os.path.realpath(self.directory)
+        path = os.path.realpath(os.path.join(root, route, name))
+        if os.path.commonpath([root, path]) != root:
+            return None
+        return path if os.path.isfile(path) else None
+
+    @staticmethod
+    def pstats_text(path: str, limit: int = 50, sort: str = "cumulative") -> str:
+        out = io.StringIO()
+        pstats.Stats(path, stream=out).sort_stats(sort).print_stats(limit)
+        return out.getvalue()
+
+    # ---- profiling ----
+    async def profile(self, app, scope, receive, send):
+        if not self._busy.acquire(blocking=False):
+            self.stats["skipped_busy"] += 1
+            return await app(scope, receive, send)
+
+        status = {"code": 0}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+
+        sampler = profiler = None
+        start = time.perf_counter()
+        try:
+            if self.mode == "sample":
+                sampler = StackSampler(threading.get_ident(), self.interval)
+                sampler.start()
+            else:
+                profiler = cProfile.Profile()
+                profiler.enable()
+            await app(scope, receive, send_wrapper)
+        finally:
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            if sampler:
+                data = sampler.stop().encode()
+            else:
+                profiler.disable()
+                data = _dump_stats(profiler)
+            route = getattr(scope.get("route"), "path", None) or scope["path"]
+            try:
+                self._write(route, scope["method"], status["code"], elapsed_ms, data)
+                self.stats["profiled"] += 1
+            finally:
+                self._busy.release()
+
+
+def _dump_stats(profiler: cProfile.Profile) -> bytes:
+    # same format as Profile.dump_stats(), so pstats.Stats(path) can read it
+    profiler.create_stats()
+    return marshal.dumps(profiler.stats)
+
+
+request_profiler = RequestProfiler(
+    settings.PROFILING_DIR,
+    mode=settings.PROFILING_MODE,
+    sample_rate=settings.PROFILING_SAMPLE_RATE,
+    secret=settings.PROFILING_SECRET,
+    signature_ttl=settings.PROFILING_SIGNATURE_TTL,
+    interval_ms=settings.PROFILING_INTERVAL_MS,
+    max_files=settings.PROFILING_MAX_FILES,
+)
+
+
+class ProfilingMiddleware:
+    """ASGI middleware; only add it when PROFILING_ENABLED (see main.py)."""
+
+    def __init__(self, app, profiler: RequestProfiler | None = None):
+        self.app = app
+        self.profiler = profiler or request_profiler
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http" and self.profiler.wanted(scope):
+            return await self.profiler.profile(self.app, scope, receive, send)
+        return await self.app(scope, receive, send)
@@ -0,0 +1,232 @@
+# app/core/rate_limit.py
+import json
+import math
+import ipaddress
+from collections import defaultdict
+import jwt
+import redis.asyncio as aioredis
+from starlette.requests import Request
+
+from app.core.config import settings
+from app.core.security import SECRET_KEY, ALGORITHM
+from app.db.redis_client import REDIS_URL
+
+"""
+Token-bucket rate limiting as a plain ASGI middleware.
+
+Each request is checked against every policy whose path/method matches. A
+policy is a token bucket (burst = capacity, rate = tokens refilled per
+second) keyed by client IP, authenticated user (JWT "id", verified but never
+looked up in Mongo) or just the route. All buckets for one request are
+checked and consumed by one Lua script, so the decision is atomic and costs
+a single Redis round trip; it runs before routing, body parsing or any
+handler/DB work.
+
+Per-IP buckets key on the socket peer address. X-Forwarded-For is only
+honoured when the peer is in RATE_LIMIT_TRUSTED_PROXIES (then the rightmost
+address not belonging to a trusted proxy is used), since clients can put
+anything in that header.
+
+Denied requests get 429 with Retry-After. If Redis is unreachable the
+limiter fails open (and counts the error).
+"""
+
+# KEYS: bucket keys; ARGV: capacity, refill per ms, cost for each key in order.
+# Returns {allowed (0/1), retry_after_ms or remaining tokens}.
+TOKEN_BUCKET_LUA = """
+local t = redis.call('TIME')
+local now = tonumber(t[1]) * 1000 + math.floor(tonumber(t[2]) / 1000)
+local levels = {}
+local wait = 0
+for i = 1, #KEYS do
+  local cap = tonumber(ARGV[i * 3 - 2])
+  local rate = tonumber(ARGV[i * 3 - 1])
+  local cost = tonumber(ARGV[i * 3])
+  local b = redis.call('HMGET', KEYS[i], 'tokens', 'ts')
+  local tokens = tonumber(b[1]) or cap
+  local ts = tonumber(b[2]) or now
+  tokens = math.min(cap, tokens + math.max(0, now - ts) * rate)
+  levels[i] = tokens
+  if tokens < cost then
+    wait = math.max(wait, (cost - tokens) / rate)
+  end
+end
+if wait > 0 then
+  return {0, math.ceil(wait)}
+end
+local remaining = nil
+for i = 1, #KEYS do
+  local cap = tonumber(ARGV[i * 3 - 2])
+  local rate = tonumber(ARGV[i * 3 - 1])
+  local left = levels[i] - tonumber(ARGV[i * 3])
+  redis.call('HSET', KEYS[i], 'tokens', tostring(left), 'ts', now)
+  redis.call('PEXPIRE', KEYS[i], math.ceil(cap / rate) + 1000)
+  if remaining == nil or left < remaining then remaining = left end
+end
+return {1, math.floor(remaining or 0)}
+"""
+
+
+class Policy:
+    __slots__ = ("name", "path", "methods", "key", "burst", "rate", "cost")
+
+    def __init__(self, name: str, path: str, burst: int, rate: float, key: str = "ip",
+                 methods: list[str] | None = None, cost: int = 1):
+        if key not in ("ip", "user", "route"):
+            raise ValueError(f"policy {name}: key must be ip, user or route")
+        self.name = name
+        self.path = path            # prefix match
+        self.methods = {m.upper() for m in methods} if methods else None
+        self.key = key
+        self.burst = burst
+        self.rate = rate            # tokens per second
+        self.cost = cost
+
+    def matches(self, method: str, path: str) -> bool:
+        return path.startswith(self.path) and (self.methods is None or method in self.methods)
+
+
+def default_policies() -> list[Policy]:
+    return [
+        # credential stuffing: per IP, and per route as a global ceiling
+        Policy("login_ip", "/api/v1/auth/login", burst=settings.RATE_LIMIT_LOGIN_BURST,
+               rate=settings.RATE_LIMIT_LOGIN_PER_MIN / 60, methods=["POST"]),
+        Policy("login_route", "/api/v1/auth/login", burst=settings.RATE_LIMIT_LOGIN_GLOBAL_BURST,
+               rate=settings.RATE_LIMIT_LOGIN_GLOBAL_PER_SEC, key="route", methods=["POST"]),
+        Policy("signup_ip", "/api/v1/auth/signup", burst=settings.RATE_LIMIT_SIGNUP_BURST,
+               rate=settings.RATE_LIMIT_SIGNUP_PER_HOUR / 3600, methods=["POST"]),
+        Policy("api_ip", "/api", burst=settings.RATE_LIMIT_API_BURST, rate=settings.RATE_LIMIT_API_PER_SEC),
+        Policy("api_user", "/api", burst=settings.RATE_LIMIT_API_BURST, rate=settings.RATE_LIMIT_API_PER_SEC,
+               key="user"),
+    ]
+
+
+def _parse_networks(spec: str) -> list:
+    return [ipaddress.ip_network(s.strip(), strict=False) for s in spec.split(",") if s.strip()]
+
+
+TRUSTED_PROXIES = _parse_networks(settings.RATE_LIMIT_TRUSTED_PROXIES)
+
+
+def _trusted(addr: str, proxies: list) -> bool:
+    try:
+        ip = ipaddress.ip_address(addr)
+    except ValueError:
+        return False
+    return any(ip in net for net in proxies)
+
+
+def client_ip(request: Request, proxies: list = TRUSTED_PROXIES) -> str:
+    # unlike ip_utils.get_client_ip, never trusts headers a client can set directly
+    peer = request.client.host if request.client else "unknown"
+    if not proxies or not _trusted(peer, proxies):
+        return peer
+    hops = [h.strip() for h in request.headers.get("x-forwarded-for", "").split(",") if h.strip()]
+    for hop in reversed(hops):
+        if not _trusted(hop, proxies):
+            return hop
+    return hops[0] if hops else peer
+
+
+def _bearer_user(request: Request) -> str | None:
+    auth = request.headers.get("authorization", "")
+    if not auth.lower().startswith("bearer "):
+        return None
+    try:
+        return jwt.decode(auth[7:], SECRET_KEY, algorithms=[ALGORITHM]).get("id")
+    except jwt.InvalidTokenError:
+        return None
+
+
+class RateLimiter:
+    def __init__(self, policies: list[Policy], prefix: str = "rl"):
+        self.policies = policies
+        self.prefix = prefix
+        self._client = None
+        self._script = None
+        self.stats = defaultdict(lambda: {"allowed": 0, "limited": 0})
+        self.errors = 0
+
+    def _bucket_keys(self, request: Request, policies: list[Policy]):
+        keys, args, used = [], [], []
+        ip = user = None
+        for p in policies:
+            if p.key == "ip":
+                ip = ip or client_ip(request)
+                ident = ip
+            elif p.key == "user":
+                user = user or _bearer_user(request)
+                if not user:
+                    continue
+                ident = user
+            else:
+                ident = "*"
+            keys.append(f"{self.prefix}:{p.name}:{ident}")
+            args += [p.burst, p.rate / 1000, p.cost]
+            used.append(p)
+        return keys, args, used
+
+    async def check(self, request: Request) -> tuple[bool, int | None, list[Policy]]:
+        """(allowed, retry_after_seconds or remaining tokens, policies applied)"""
+        matching = [p for p in self.policies if p.matches(request.method, request.url.path)]
+        if not matching:
+            return True, None, []
+        keys, args, used = self._bucket_keys(request, matching)
+        if not keys:
+            return True, None, []
+
+        if self._script is None:
+            self._client = aioredis.from_url(REDIS_URL, decode_responses=True)
+            self._script = self._client.register_script(TOKEN_BUCKET_LUA)
+        try:
+            allowed, value = await self._script(keys=keys, args=args)
+        except Exception:
+            self.errors += 1
+            return True, None, used
+
+        for p in used:
+            self.stats[p.name]["allowed" if allowed else "limited"] += 1
+        if allowed:
+            return True, int(value), used
+        return False, max(1, math.ceil(int(value) / 1000)), used
+
+    def snapshot(self) -> dict:
+        return {
+            "errors": self.errors,
+            "policies": {
+                p.name: {"path": p.path, "key": p.key, "burst": p.burst, "rate_per_sec": p.rate, **self.stats[p.name]}
+                for p in self.policies
+            },
+        }
+
+
+rate_limiter = RateLimiter(default_policies())
+
+
+class RateLimitMiddleware:
+    """ASGI middleware: rejects over-limit requests before the app sees them."""
+
+    def __init__(self, app, limiter: RateLimiter | None = None, enabled: bool = True):
+        self.app = app
+        self.limiter = limiter or rate_limiter
+        self.enabled = enabled
+
+    async def __call__(self, scope, receive, send):
+        if not self.enabled or scope["type"] != "http" or scope["method"] == "OPTIONS":
+            return await self.app(scope, receive, send)
+
+        allowed, value, used = await self.limiter.check(Request(scope))
+        if allowed:
+            return await self.app(scope, receive, send)
+
+        body = json.dumps({"detail": "Too many requests", "retry_after": value}).encode()
+        await send({
+            "type": "http.response.start",
+            "status": 429,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+                (b"retry-after", str(value).encode()),
+            ],
+        })
+        await send({"type": "http.response.body", "body": body})
@@ -0,0 +1,177 @@
+# app/core/tracing.py
+import os
+import re
+import json
+import time
+import uuid
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from app.core.config import settings
+
+"""
+In-process request tracing.
+
+TracingMiddleware opens a Trace per HTTP request (request id taken from
+X-Request-ID or generated, and echoed back in the response). Code on the
+request path marks stages with nested spans:
+
+    with span("enrichment"):
+        ...
+    with span("mongo.insert", collection="transactions"):
+        await db.transactions.insert_one(doc)
+
+Spans follow contextvars, so they nest across awaits, tasks started from the
+request (asyncio copies the context) and asyncio.to_thread. Outside a request
+span() is a no-op.
+
+Finished traces go into a ring buffer (TRACE_BUFFER_SIZE) viewable under
+/admin/traces (admin only: traces carry other users' paths and ids); traces
+slower than TRACE_SLOW_MS are also appended to TRACE_EXPORT_PATH as JSONL.
+No external collector is involved.
+"""
+
+_trace: ContextVar["Trace | None"] = ContextVar("trace", default=None)
+_parent: ContextVar[int | None] = ContextVar("trace_parent", default=None)
+
+_REQUEST_ID = re.compile(r"^[A-Za-z0-9._-]{1,64}$")
+
+
+class Trace:
+    __slots__ = ("request_id", "method", "path", "route", "status", "started_at", "start", "duration_ms", "spans")
+
+    def __init__(self, request_id: str, method: str = "", path: str = ""):
+        self.request_id = request_id
+        self.method = method
+        self.path = path
+        self.route = None
+        self.status = None
+        self.started_at = time.time()
+        self.start = time.perf_counter()
+        self.duration_ms = None
+        self.spans: list[dict] = []
+
+    def finish(self):
+        self.duration_ms = round((time.perf_counter() - self.start) * 1000, 3)
+
+    def stages(self) -> dict:
+        """Total time per span name (a stage called several times is summed)."""
+        out = {}
+        for s in self.spans:
+            if s["duration_ms"] is not None:
+                out[s["name"]] = round(out.get(s["name"], 0.0) + s["duration_ms"], 3)
+        return out
+
+    def summary(self) -> dict:
+        return {
+            "request_id": self.request_id, "method": self.method, "path": self.path,
+            "route": self.route, "status": self.status, "started_at": self.started_at,
+            "duration_ms": self.duration_ms, "spans": len(self.spans),
+        }
+
+    def to_dict(self) -> dict:
+        return {**self.summary(), "stages": self.stages(), "spans": self.spans}
+
+
+@contextmanager
+def span(name: str, **attrs):
+    trace = _trace.get()
+    if trace is None:
+        yield None
+        return
+    rec = {
+        "id": len(trace.spans), "parent": _parent.get(), "name": name,
+        "start_ms": round((time.perf_counter() - trace.start) * 1000, 3),
+        "duration_ms": None, "attrs": attrs or None, "error": None,
+    }
+    trace.spans.append(rec)
+    token = _parent.set(rec["id"])
+    start = time.perf_counter()
+    try:
+        yield rec
+    except BaseException as e:
+        rec["error"] = type(e).__name__
+        raise
+    finally:
+        rec["duration_ms"] = round((time.perf_counter() - start) * 1000, 3)
+        _parent.reset(token)
+
+
+def current_request_id() -> str | None:
+    trace = _trace.get()
+    return trace.request_id if trace else None
+
+
+class TraceRecorder:
+    def __init__(self, buffer_size: int = 500, slow_ms: float = 500, export_path: str = ""):
+        self.slow_ms = slow_ms
+        self.export_path = export_path
+        self.buffer: deque[Trace] = deque(maxlen=buffer_size)
+        self.stats = {"recorded": 0, "slow": 0, "export_errors": 0}
+
+    def record(self, trace: Trace):
+        self.buffer.append(trace)
+        self.stats["recorded"] += 1
+        if trace.duration_ms is not None and trace.duration_ms >= self.slow_ms:
+            self.stats["slow"] += 1
+            if self.export_path:
+                self._export(trace)
+
+    def _export(self, trace: Trace):
+        # one short line per slow request; rare enough to write inline
+        try:
+            os.makedirs(os.path.dirname(self.export_path) or ".", exist_ok=True)
+            with open(self.export_path, "a") as fh:
+                fh.write(json.dumps(trace.to_dict(), default=str) + "\n")
+        except OSError as e:
+            self.stats["export_errors"] += 1
+            print(f"⚠️ Trace export failed: {e}")
+
+    def recent(self, min_ms: float = 0, path: str | None = None, limit: int = 100) -> list[dict]:
+        out = []
+        for trace in reversed(self.buffer):
+            if (trace.duration_ms or 0) < min_ms or (path and path not in (trace.path, trace.route)):
+                continue
+            out.append(trace.summary())
+            if len(out) >= limit:
+                break
+        return out
+
+    def get(self, request_id: str) -> Trace | None:
+        return next((t for t in reversed(self.buffer) if t.request_id == request_id), None)
+
+
+trace_recorder = TraceRecorder(
+    buffer_size=settings.TRACE_BUFFER_SIZE,
+    slow_ms=settings.TRACE_SLOW_MS,
+    export_path=settings.TRACE_EXPORT_PATH,
+)
+
+
+class TracingMiddleware:
+    def __init__(self, app, recorder: TraceRecorder | None = None):
+        self.app = app
+        self.recorder = recorder or trace_recorder
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        incoming = next((v.decode("latin-1") for k, v in scope["headers"] if k == b"x-request-id"), "")
+        trace = Trace(incoming if _REQUEST_ID.match(incoming) else uuid.uuid4().hex, scope["method"], scope["path"])
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                trace.status = message["status"]
+                message = {**message, "headers": [*message.get("headers", []), (b"x-request-id", trace.request_id.encode())]}
+            await send(message)
+
+        token = _trace.set(trace)
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _trace.reset(token)
+            trace.finish()
+            trace.route = getattr(scope.get("route"), "path", None)
+            self.recorder.record(trace)
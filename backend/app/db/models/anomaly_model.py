@@ -1,4 +1,4 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from datetime import datetime
 from typing import Optional, Dict
 
@@ -6,5 +6,6 @@ class AnomalyModel(BaseModel):
     user_id: str
     anomaly_type: str      # "login" or "transaction"
     details: Dict          # entire event stored here
-    detected_at: datetime = datetime.utcnow()
+    anomaly_score: Optional[float] = None
+    detected_at: datetime = Field(default_factory=datetime.utcnow)
     is_confirmed: bool = False  # In case admins review anomalies
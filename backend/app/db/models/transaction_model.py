@@ -18,8 +18,13 @@ class TransactionModel(BaseModel):
     transaction_duration: Optional[float] = None
     previous_transaction_date: Optional[datetime] = None
     description: Optional[str] = None
+    amount_percentile: Optional[float] = None  # vs. user's own history (quantile sketch)
+    ip_reputation: Optional[Dict[str, Any]] = None
+    enrichment: Optional[Dict[str, Any]] = None  # which enrichers degraded, elapsed_ms
 
     is_anomaly: Optional[bool] = False
+    risk_score: int = 0  # 0-100 from the rule engine
+    rule_reasons: Optional[Dict[str, Any]] = None  # rule id -> score contributed
 
     class Config:
         from_attributes = True
@@ -1,28 +1,136 @@
 from motor.motor_asyncio import AsyncIOMotorClient
-from pymongo import ReturnDocument
+from pymongo import ReturnDocument, monitoring
 from fastapi import Depends
 from app.core.config import settings
 
+"""
+Two Mongo clients, each with its own connection pool:
+
+- primary:   hot path (login, transaction writes, per-event lookups), reads
+             from the primary
+- analytics: list / stats / export queries, secondaryPreferred and a smaller
+             pool, so a burst of dashboard or export traffic queues on its own
+             pool instead of taking connections from the login path
+
+Both negotiate wire compression (MONGO_COMPRESSORS) and report pool
+check-out wait times (pool_stats()).
+"""
+
+
+class PoolMetrics(monitoring.ConnectionPoolListener):
+    """Connection check-out wait times and usage for one client."""
+
+    BUCKETS_MS = (1, 5, 10, 50, 100, 500, 1000)
+
+    def __init__(self, name: str):
+        self.name = name
+        self.checkouts = 0
+        self.failed = 0
+        self.in_use = 0
+        self.max_in_use = 0
+        self.wait_ms_total = 0.0
+        self.wait_ms_max = 0.0
+        self.histogram = [0] * (len(self.BUCKETS_MS) + 1)
+
+    def _wait(self, duration: float | None):
+        ms = (duration or 0.0) * 1000
+        self.wait_ms_total += ms
+        self.wait_ms_max = max(self.wait_ms_max, ms)
+        for i, bound in enumerate(self.BUCKETS_MS):
+            if ms <= bound:
+                self.histogram[i] += 1
+                break
+        else:
+            self.histogram[-1] += 1
+
+    def connection_checked_out(self, event):
+        self.checkouts += 1
+        self.in_use += 1
+        self.max_in_use = max(self.max_in_use, self.in_use)
+        self._wait(event.duration)
+
+    def connection_check_out_failed(self, event):
+        self.failed += 1
+        self._wait(event.duration)
+
+    def connection_checked_in(self, event):
+        self.in_use = max(self.in_use - 1, 0)
+
+    # unused pool events
+    def pool_created(self, event): pass
+    def pool_ready(self, event): pass
+    def pool_cleared(self, event): pass
+    def pool_closed(self, event): pass
+    def connection_created(self, event): pass
+    def connection_ready(self, event): pass
+    def connection_closed(self, event): pass
+    def connection_check_out_started(self, event): pass
+
+    def snapshot(self) -> dict:
+        labels = [f"<={b}ms" for b in self.BUCKETS_MS] + [f">{self.BUCKETS_MS[-1]}ms"]
+        return {
+            "checkouts": self.checkouts,
+            "failed": self.failed,
+            "in_use": self.in_use,
+            "max_in_use": self.max_in_use,
+            "wait_ms_avg": round(self.wait_ms_total / self.checkouts, 3) if self.checkouts else None,
+            "wait_ms_max": round(self.wait_ms_max, 3),
+            "wait_histogram": dict(zip(labels, self.histogram)),
+        }
+
+
 class MongoDB:
     client: AsyncIOMotorClient = None
+    analytics_client: AsyncIOMotorClient = None
+    metrics: dict[str, PoolMetrics] = {}
 
 mongodb = MongoDB()
 
 
+def _client(name: str, uri: str, **options) -> AsyncIOMotorClient:
+    metrics = PoolMetrics(name)
+    mongodb.metrics[name] = metrics
+    return AsyncIOMotorClient(
+        uri,
+        compressors=settings.MONGO_COMPRESSORS or None,
+        event_listeners=[metrics],
+        **{k: v for k, v in options.items() if v is not None},
+    )
+
+
 # 🔹 Return database object
 async def get_database():
     return mongodb.client[settings.MONGO_DB_NAME]
 
 
+# 🔹 Database on the analytics pool (list / stats / export reads, secondary preferred)
+async def get_analytics_database():
+    client = mongodb.analytics_client or mongodb.client
+    return client[settings.MONGO_DB_NAME]
+
+
 # 🔹 Connect MongoDB (called on startup)
 async def connect_to_mongo():
-    mongodb.client = AsyncIOMotorClient(settings.MONGO_URI)
+    mongodb.client = _client(
+        "primary", settings.MONGO_URI,
+        maxPoolSize=settings.MONGO_MAX_POOL_SIZE,
+        minPoolSize=settings.MONGO_MIN_POOL_SIZE,
+    )
+    mongodb.analytics_client = _client(
+        "analytics", settings.MONGO_ANALYTICS_URI or settings.MONGO_URI,
+        maxPoolSize=settings.MONGO_ANALYTICS_MAX_POOL_SIZE,
+        minPoolSize=settings.MONGO_ANALYTICS_MIN_POOL_SIZE,
+        readPreference=settings.MONGO_ANALYTICS_READ_PREFERENCE,
+        waitQueueTimeoutMS=settings.MONGO_ANALYTICS_WAIT_QUEUE_TIMEOUT_MS or None,
+    )
     print("📌 Connected to MongoDB")
 
 
 # 🔹 Close connection (shutdown)
 async def close_mongo_connection():
     mongodb.client.close()
+    if mongodb.analytics_client:
+        mongodb.analytics_client.close()
     print("❌ MongoDB Connection Closed")
 
 
@@ -30,3 +138,7 @@ async def close_mongo_connection():
 def get_client():
     """Return raw MongoDB client"""
     return mongodb.client
+
+
+def pool_stats() -> dict:
+    return {name: m.snapshot() for name, m in mongodb.metrics.items()}
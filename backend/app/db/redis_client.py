@@ -2,10 +2,25 @@
 import os
 import redis
 import json
+import zlib
+
+from app.core.config import settings
 
 REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
 rc = redis.from_url(REDIS_URL, decode_responses=True)
 
+# Extra Redis nodes for sharded structures (comma separated URLs).
+# Shard i lives on node i % len(nodes); defaults to the main instance.
+REDIS_SHARD_URLS = [u.strip() for u in settings.REDIS_SHARD_URLS.split(",") if u.strip()]
+shard_nodes = [redis.from_url(u, decode_responses=True) for u in REDIS_SHARD_URLS] or [rc]
+
+def shard_for(key: str, num_shards: int) -> int:
+    # stable across processes (unlike hash())
+    return zlib.crc32(key.encode()) % num_shards
+
+def node_for_shard(shard: int):
+    return shard_nodes[shard % len(shard_nodes)]
+
 # small convenience wrappers
 def r_get(key):
     v = rc.get(key)
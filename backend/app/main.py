@@ -3,15 +3,28 @@
 from fastapi import FastAPI
 from app.db.mongodb import connect_to_mongo, close_mongo_connection, get_client
 from app.core.config import settings
+from app.core.rate_limit import RateLimitMiddleware
+from app.core.profiling import ProfilingMiddleware
+from app.core.tracing import TracingMiddleware
 
 from app.api.v1.routes.auth_route import router as auth_router
 from app.api.v1.routes.transaction_route import router as transaction_router
 from app.api.v1.routes.login_log_route import router as LoginLogRouter
 from app.api.v1.routes.test_dsa_routes import router as DSA_TEST_ROUTER
 from app.api.v1.routes.test_db_route import router as test_db_router
+from app.api.v1.routes.admin_routes import router as admin_router
+from app.api.v1.routes.anomaly_route import router as anomaly_router
 
 from app.core.dsa.mongo_dsa import MongoDSA
 from app.services.anomaly_worker import persist_anomalies_loop
+from app.services.analytics_views import refresh_views_loop
+from app.services.login_audit import login_audit
+from app.services.partitions import user_partitions
+from app.services.change_streams import change_streams
+import app.services.user_activity  # noqa: F401  registers change-stream handlers
+from app.utils.ip_utils import ip_reputation
+from app.core.dsa.redis_dsa import migrate_legacy_anomaly_queue, reencode_legacy_priorities
+from app.core.dsa.entity_graph import init_entity_graph
 
 import asyncio
 from fastapi.middleware.cors import CORSMiddleware
@@ -38,6 +51,25 @@ app.include_router(LoginLogRouter, prefix="/api/v1")
 app.include_router(auth_router, prefix="/api/v1/auth")
 app.include_router(transaction_router, prefix="/api/v1")
 app.include_router(DSA_TEST_ROUTER, prefix="/api/v1")
+app.include_router(admin_router, prefix="/api/v1")
+app.include_router(anomaly_router, prefix="/api/v1")
+
+# ---------------------------------------------------------------------
+# PROFILING (opt-in; not mounted at all unless PROFILING_ENABLED)
+# ---------------------------------------------------------------------
+if settings.PROFILING_ENABLED:
+    app.add_middleware(ProfilingMiddleware)
+
+# ---------------------------------------------------------------------
+# TRACING (request id + per-stage spans, see /admin/traces)
+# ---------------------------------------------------------------------
+if settings.TRACING_ENABLED:
+    app.add_middleware(TracingMiddleware)
+
+# ---------------------------------------------------------------------
+# RATE LIMITING (added before CORS so 429s still carry CORS headers)
+# ---------------------------------------------------------------------
+app.add_middleware(RateLimitMiddleware, enabled=settings.RATE_LIMIT_ENABLED)
 
 # ---------------------------------------------------------------------
 # CORS CONFIG (ADD AFTER ROUTERS - KEY FIX)
@@ -68,10 +100,21 @@ async def startup_event():
     db = client[settings.MONGO_DB_NAME]
 
     mongo_dsa = MongoDSA(db)
-    await mongo_dsa.ensure_indexes()
+    await mongo_dsa.ensure_indexes(
+        storage_mode=settings.EVENT_STORAGE_MODE,
+        retention_days=settings.EVENT_RETENTION_DAYS,
+    )
 
     loop = asyncio.get_event_loop()
     loop.create_task(persist_anomalies_loop(db))
+    loop.create_task(refresh_views_loop(db, settings.ANALYTICS_REFRESH_INTERVAL))
+    login_audit.start(db)
+    loop.run_in_executor(None, ip_reputation.reload)
+    loop.run_in_executor(None, migrate_legacy_anomaly_queue)
+    loop.run_in_executor(None, reencode_legacy_priorities)
+    loop.create_task(init_entity_graph(db))
+    if settings.CHANGE_STREAMS_ENABLED:
+        await change_streams.start(db)
 
 # ---------------------------------------------------------------------
 # SHUTDOWN
@@ -81,6 +124,9 @@ async def startup_event():
 async def shutdown_event():
     """Close database connection on shutdown"""
     logger.info("🛑 Shutting down Fraud Detection API...")
+    await login_audit.stop(settings.LOGIN_AUDIT_DRAIN_TIMEOUT)
+    await change_streams.stop()
+    await user_partitions.stop(settings.LOGIN_AUDIT_DRAIN_TIMEOUT)
     await close_mongo_connection()
     logger.info("✅ Database connection closed")
 
@@ -0,0 +1,174 @@
+# app/services/analytics_views.py
+import os
+import uuid
+import socket
+import asyncio
+from datetime import datetime, timedelta
+from pymongo import DESCENDING
+from pymongo.errors import DuplicateKeyError
+
+"""
+Materialized views for the admin dashboards.
+
+Each view is a pre-aggregated collection maintained by a $merge pipeline that
+only reads source documents newer than the view's watermark (kept in
+"mv_watermarks"), so a refresh costs O(new documents), and dashboard reads are
+a single indexed find on the view.
+
+Refreshes run in every worker and from POST /admin/analytics/refresh, so a
+refresh first claims the view with a compare-and-set lease on its watermark
+(losers skip). The claimed range is stored as "pending" and each refresh
+stamps the view rows it touches with that batch; a retry of the same range
+after a crash between $merge and the watermark update re-uses the batch and
+the whenMatched stage leaves already-stamped rows alone, so nothing is
+counted twice.
+
+    mv_anomalies_hourly   anomalies per hour by type
+    mv_risky_users        anomaly count / score per user
+    mv_category_volume    transaction count / amount per day by category
+"""
+
+# don't read right up to "now": in-flight inserts with an earlier timestamp
+# would land behind the watermark and never be counted
+REFRESH_LAG = timedelta(seconds=5)
+LEASE = timedelta(minutes=5)  # a refresh that runs longer can be taken over (safe: batches are idempotent)
+OWNER = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+
+def _additive_merge(view: str, sum_fields: list[str], max_fields: list[str] = ()):
+    # a row already stamped with this batch was merged by an earlier attempt of the same range
+    applied = {"$eq": ["$batch", "$$new.batch"]}
+    when_matched = {f: {"$cond": [applied, f"${f}", {"$add": [f"${f}", f"$$new.{f}"]}]} for f in sum_fields}
+    when_matched.update({f: {"$max": [f"${f}", f"$$new.{f}"]} for f in max_fields})
+    when_matched["batch"] = "$$new.batch"
+    return {
+        "$merge": {
+            "into": view,
+            "on": "_id",
+            "whenMatched": [{"$set": when_matched}],
+            "whenNotMatched": "insert",
+        }
+    }
+
+
+VIEWS = {
+    "mv_anomalies_hourly": {
+        "source": "anomaly_logs",
+        "time_field": "detected_at",
+        "pipeline": [
+            {"$group": {
+                "_id": {
+                    "hour": {"$dateTrunc": {"date": "$detected_at", "unit": "hour"}},
+                    "type": "$anomaly_type",
+                },
+                "count": {"$sum": 1},
+                "score_sum": {"$sum": {"$ifNull": ["$anomaly_score", 0]}},
+                "max_score": {"$max": "$anomaly_score"},
+            }},
+            {"$set": {"hour": "$_id.hour", "anomaly_type": "$_id.type"}},
+            _additive_merge("mv_anomalies_hourly", ["count", "score_sum"], ["max_score"]),
+        ],
+        "indexes": [[("hour", DESCENDING)], [("anomaly_type", 1), ("hour", DESCENDING)]],
+    },
+    "mv_risky_users": {
+        "source": "anomaly_logs",
+        "time_field": "detected_at",
+        "pipeline": [
+            {"$match": {"user_id": {"$ne": None}}},
+            {"$group": {
+                "_id": "$user_id",
+                "anomaly_count": {"$sum": 1},
+                "score_sum": {"$sum": {"$ifNull": ["$anomaly_score", 0]}},
+                "max_score": {"$max": "$anomaly_score"},
+                "last_detected": {"$max": "$detected_at"},
+            }},
+            _additive_merge("mv_risky_users", ["anomaly_count", "score_sum"], ["max_score", "last_detected"]),
+        ],
+        "indexes": [[("score_sum", DESCENDING)], [("anomaly_count", DESCENDING)]],
+    },
+    "mv_category_volume": {
+        "source": "transactions",
+        "time_field": "transaction_date",
+        "pipeline": [
+            {"$group": {
+                "_id": {
+                    "day": {"$dateTrunc": {"date": "$transaction_date", "unit": "day"}},
+                    "category": "$category",
+                },
+                "txn_count": {"$sum": 1},
+                "amount_sum": {"$sum": {"$ifNull": ["$amount", 0]}},
+                "anomaly_count": {"$sum": {"$cond": [{"$eq": ["$is_anomaly", True]}, 1, 0]}},
+            }},
+            {"$set": {"day": "$_id.day", "category": "$_id.category"}},
+            _additive_merge("mv_category_volume", ["txn_count", "amount_sum", "anomaly_count"]),
+        ],
+        "indexes": [[("day", DESCENDING)], [("category", 1), ("day", DESCENDING)]],
+    },
+}
+
+
+async def ensure_view_indexes(db):
+    for view, spec in VIEWS.items():
+        for keys in spec["indexes"]:
+            await db[view].create_index(keys)
+
+
+async def _claim(db, view: str):
+    """CAS lease on the view's watermark: (lower, upper) to refresh, or None if another refresh holds it."""
+    now = datetime.utcnow()
+    mark = await db.mv_watermarks.find_one({"_id": view})
+    if mark is None:
+        try:
+            await db.mv_watermarks.insert_one({"_id": view, "ts": None})
+        except DuplicateKeyError:
+            pass  # created by a concurrent refresh; the CAS below decides
+        mark = {"ts": None}
+    # an unfinished range (crashed refresh) is retried as-is so its batch stamp matches
+    upper = mark.get("pending") or now - REFRESH_LAG
+    claimed = await db.mv_watermarks.update_one(
+        {"_id": view, "ts": mark.get("ts"),
+         "$or": [{"lease_until": {"$exists": False}}, {"lease_until": {"$lt": now}}]},
+        {"$set": {"pending": upper, "lease_until": now + LEASE, "lease_owner": OWNER}},
+    )
+    return (mark.get("ts"), upper) if claimed.modified_count else None
+
+
+async def refresh_view(db, view: str) -> dict:
+    spec = VIEWS[view]
+    claim = await _claim(db, view)
+    if claim is None:
+        return {"view": view, "skipped": "refresh in progress elsewhere"}
+    lower, upper = claim
+
+    time_range = {"$lte": upper}
+    if lower:
+        time_range["$gt"] = lower
+    pipeline = (
+        [{"$match": {spec["time_field"]: time_range}}]
+        + spec["pipeline"][:-1]
+        + [{"$set": {"batch": upper}}, spec["pipeline"][-1]]
+    )
+
+    # $merge returns no documents; the cursor just has to be exhausted
+    await db[spec["source"]].aggregate(pipeline).to_list(length=None)
+    await db.mv_watermarks.update_one(
+        {"_id": view, "lease_owner": OWNER},
+        {"$set": {"ts": upper, "refreshed_at": datetime.utcnow()},
+         "$unset": {"pending": "", "lease_until": "", "lease_owner": ""}},
+    )
+    return {"view": view, "from": lower, "to": upper}
+
+
+async def refresh_all_views(db) -> list[dict]:
+    return [await refresh_view(db, view) for view in VIEWS]
+
+
+async def refresh_views_loop(db, interval: int = 60):
+    """Run in background: keep the materialized views up to date."""
+    await ensure_view_indexes(db)
+    while True:
+        try:
+            await refresh_all_views(db)
+        except Exception as e:
+            print(f"Analytics refresh error: {e}")
+        await asyncio.sleep(interval)
@@ -0,0 +1,154 @@
+# app/services/anomaly_archiver.py
+import os
+import json
+import uuid
+import asyncio
+import argparse
+from datetime import datetime, timedelta
+import pandas as pd
+from bson import ObjectId
+from motor.motor_asyncio import AsyncIOMotorClient
+
+from app.core.config import settings
+
+"""
+Cold tier for anomaly_logs.
+
+Anomalies older than a cutoff are written to date-partitioned Parquet files
+
+    <ANOMALY_ARCHIVE_DIR>/anomaly_logs/date=YYYY-MM-DD/part-<uuid>.parquet
+
+and then deleted from Mongo in bulk. Files are written before the delete, so a
+crash can at worst leave a document in both tiers; readers dedupe on _id.
+
+    python -m app.services.anomaly_archiver --days 30
+"""
+
+COLUMNS = ["_id", "anomaly_id", "user_id", "anomaly_type", "anomaly_score", "detected_at", "is_confirmed"]
+JSON_COLUMNS = ["details", "raw_payload"]
+
+
+def _root(archive_dir: str | None = None):
+    return os.path.join(archive_dir or settings.ANOMALY_ARCHIVE_DIR, "anomaly_logs")
+
+
+def _to_row(doc: dict) -> dict:
+    row = {c: doc.get(c) for c in COLUMNS}
+    row["_id"] = str(doc["_id"])
+    row["anomaly_score"] = float(doc.get("anomaly_score") or 0.0)
+    for c in JSON_COLUMNS:
+        row[c] = json.dumps(doc.get(c), default=str)
+    extra = {k: v for k, v in doc.items() if k not in COLUMNS and k not in JSON_COLUMNS}
+    row["extra"] = json.dumps(extra, default=str)
+    return row
+
+
+def _from_row(row: dict) -> dict:
+    doc = {c: row.get(c) for c in COLUMNS}
+    # stored as str; give back the ObjectId hot rows have, so both tiers compare and serialize alike
+    if ObjectId.is_valid(doc["_id"]):
+        doc["_id"] = ObjectId(doc["_id"])
+    if isinstance(doc["detected_at"], pd.Timestamp):
+        doc["detected_at"] = doc["detected_at"].to_pydatetime()
+    for c in JSON_COLUMNS:
+        doc[c] = json.loads(row[c]) if row.get(c) else None
+    doc.update(json.loads(row["extra"]) if row.get("extra") else {})
+    doc["archived"] = True
+    return doc
+
+
+def write_partitions(docs: list[dict], archive_dir: str | None = None) -> int:
+    df = pd.DataFrame([_to_row(d) for d in docs])
+    df["detected_at"] = pd.to_datetime(df["detected_at"])
+    root = _root(archive_dir)
+    for day, part in df.groupby(df["detected_at"].dt.strftime("%Y-%m-%d")):
+        path = os.path.join(root, f"date={day}")
+        os.makedirs(path, exist_ok=True)
+        part.to_parquet(os.path.join(path, f"part-{uuid.uuid4().hex}.parquet"), index=False)
+    return len(df)
+
+
+def list_partitions(from_dt: datetime | None = None, to_dt: datetime | None = None, archive_dir: str | None = None):
+    """Partition directories overlapping [from_dt, to_dt], pruned by their date name."""
+    root = _root(archive_dir)
+    if not os.path.isdir(root):
+        return []
+    lo = from_dt.strftime("%Y-%m-%d") if from_dt else None
+    hi = to_dt.strftime("%Y-%m-%d") if to_dt else None
+    parts = []
+    for name in sorted(os.listdir(root)):
+        if not name.startswith("date="):
+            continue
+        day = name[len("date="):]
+        if (lo and day < lo) or (hi and day > hi):
+            continue
+        parts.append(os.path.join(root, name))
+    return parts
+
+
+def read_archived_anomalies(
+    from_dt: datetime | None = None, to_dt: datetime | None = None,
+    limit: int = 100, archive_dir: str | None = None
+) -> list[dict]:
+    """Top `limit` archived anomalies by anomaly_score within the date range."""
+    parts = list_partitions(from_dt, to_dt, archive_dir)
+    if not parts:
+        return []
+
+    top = None
+    for path in parts:
+        df = pd.read_parquet(path)
+        if from_dt:
+            df = df[df["detected_at"] >= pd.Timestamp(from_dt)]
+        if to_dt:
+            df = df[df["detected_at"] <= pd.Timestamp(to_dt)]
+        # keep only a running top-N so memory stays bounded by `limit`
+        top = df if top is None else pd.concat([top, df])
+        top = top.drop_duplicates("_id").nlargest(limit, "anomaly_score")
+
+    return [_from_row(r) for r in top.to_dict("records")]
+
+
+async def fetch_archived_anomalies(
+    from_dt: datetime | None = None, to_dt: datetime | None = None,
+    limit: int = 100, archive_dir: str | None = None
+) -> list[dict]:
+    """Archive reader for MongoDSA(db, archive_reader=fetch_archived_anomalies)."""
+    if not list_partitions(from_dt, to_dt, archive_dir):
+        return []
+    return await asyncio.to_thread(read_archived_anomalies, from_dt, to_dt, limit, archive_dir)
+
+
+async def archive_anomalies(db, cutoff: datetime | None = None, chunk_size: int | None = None, archive_dir: str | None = None):
+    cutoff = cutoff or datetime.utcnow() - timedelta(days=settings.ANOMALY_HOT_DAYS)
+    chunk_size = chunk_size or settings.ARCHIVE_CHUNK_SIZE
+    archived = 0
+
+    while True:
+        docs = await db.anomaly_logs.find(
+            {"detected_at": {"$lt": cutoff}}
+        ).sort("_id", 1).limit(chunk_size).to_list(length=chunk_size)
+        if not docs:
+            break
+
+        await asyncio.to_thread(write_partitions, docs, archive_dir)
+        await db.anomaly_logs.delete_many({"_id": {"$in": [d["_id"] for d in docs]}})
+        archived += len(docs)
+        print(f"🧊 archived {archived} anomalies older than {cutoff.isoformat()}")
+
+    return archived
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Archive old anomaly_logs to Parquet")
+    parser.add_argument("--days", type=int, default=settings.ANOMALY_HOT_DAYS)
+    args = parser.parse_args()
+
+    client = AsyncIOMotorClient(settings.MONGO_URI)
+    db = client[settings.MONGO_DB_NAME]
+    await archive_anomalies(db, cutoff=datetime.utcnow() - timedelta(days=args.days))
+    client.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,146 @@
+# app/services/anomaly_feed.py
+import json
+import asyncio
+import redis.asyncio as aioredis
+
+from app.core.config import settings
+from app.db.redis_client import REDIS_URL
+from app.core.dsa.redis_dsa import ANOMALY_FEED_CHANNEL
+
+"""
+Live anomaly feed for dashboards (server push instead of polling).
+
+Producers PUBLISH anomaly events on one Redis channel
+(redis_dsa.publish_anomaly_event). Each API process holds at most one
+subscription to it and fans every message out to its connected clients:
+
+- the subscription is opened with the first client and closed with the last,
+  so a process with no open dashboards does no Redis work at all
+- every client has a bounded queue; a slow client loses its oldest events
+  (and is told how many) instead of growing memory or stalling the others
+- each client only gets its own user's events (optionally filtered by event
+  type), applied before queueing
+"""
+
+
+class FeedSubscriber:
+    def __init__(self, user_id: str, types: set[str] | None = None, maxsize: int = 100):
+        self.user_id = user_id
+        self.types = types
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=maxsize)
+        self.dropped = 0
+
+    def matches(self, event: dict) -> bool:
+        if event.get("user_id") != self.user_id:
+            return False
+        if self.types and event.get("type") not in self.types and event.get("event") not in self.types:
+            return False
+        return True
+
+    def offer(self, event: dict) -> bool:
+        """Queue without blocking the fan-out; returns False if an older event was dropped."""
+        dropped = False
+        if self.queue.full():
+            self.queue.get_nowait()
+            self.dropped += 1
+            dropped = True
+        self.queue.put_nowait(event)
+        return not dropped
+
+
+class AnomalyFeed:
+    def __init__(self, channel: str = ANOMALY_FEED_CHANNEL, client_queue_size: int = 100):
+        self.channel = channel
+        self.client_queue_size = client_queue_size
+        self.subscribers: set[FeedSubscriber] = set()
+        self._task: asyncio.Task | None = None
+        self.stats = {"received": 0, "delivered": 0, "dropped": 0, "reconnects": 0}
+
+    def subscribe(self, user_id: str, types: set[str] | None = None) -> FeedSubscriber:
+        sub = FeedSubscriber(user_id, types, self.client_queue_size)
+        self.subscribers.add(sub)
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_event_loop().create_task(self._listen())
+        return sub
+
+    def unsubscribe(self, sub: FeedSubscriber):
+        self.subscribers.discard(sub)
+        if not self.subscribers and self._task:
+            self._task.cancel()
+            self._task = None
+
+    def _fan_out(self, event: dict):
+        self.stats["received"] += 1
+        for sub in list(self.subscribers):
+            if not sub.matches(event):
+                continue
+            if sub.offer(event):
+                self.stats["delivered"] += 1
+            else:
+                self.stats["dropped"] += 1
+
+    async def _listen(self):
+        backoff = 1
+        while self.subscribers:
+            client = aioredis.from_url(REDIS_URL, decode_responses=True)
+            pubsub = client.pubsub(ignore_subscribe_messages=True)
+            try:
+                await pubsub.subscribe(self.channel)
+                backoff = 1
+                async for message in pubsub.listen():
+                    try:
+                        self._fan_out(json.loads(message["data"]))
+                    except (TypeError, ValueError):
+                        continue
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.stats["reconnects"] += 1
+                print(f"Anomaly feed subscription error: {e}")
+                await asyncio.sleep(backoff)
+                backoff = min(backoff * 2, 30)
+            finally:
+                await pubsub.aclose()
+                await client.aclose()
+
+    def snapshot(self) -> dict:
+        return {
+            **self.stats,
+            "clients": len(self.subscribers),
+            "subscribed": self._task is not None and not self._task.done(),
+        }
+
+
+anomaly_feed = AnomalyFeed(client_queue_size=settings.ANOMALY_FEED_CLIENT_QUEUE)
+
+
+async def sse_events(request, user_id: str, types: set[str] | None = None, heartbeat: float | None = None):
+    """
+    Server-sent events for one client; heartbeats are local (no Redis traffic).
+
+    The subscription is made here, inside the try, rather than by the route: a
+    response that is never iterated (client gone before the body starts) then
+    never subscribes, and every subscription is released by the finally.
+    """
+    heartbeat = heartbeat or settings.ANOMALY_FEED_HEARTBEAT
+    reported = 0
+    sub = None
+    try:
+        sub = anomaly_feed.subscribe(user_id=user_id, types=types)
+        yield "retry: 3000\n\n"
+        while True:
+            try:
+                event = await asyncio.wait_for(sub.queue.get(), heartbeat)
+            except asyncio.TimeoutError:
+                if await request.is_disconnected():
+                    break
+                yield ": keepalive\n\n"
+                continue
+
+            if sub.dropped > reported:
+                yield f"event: lag\ndata: {json.dumps({'dropped': sub.dropped - reported})}\n\n"
+                reported = sub.dropped
+            yield f"event: {event.get('event', 'anomaly')}\ndata: {json.dumps(event, default=str)}\n\n"
+    finally:
+        if sub is not None:
+            anomaly_feed.unsubscribe(sub)
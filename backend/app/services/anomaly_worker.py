@@ -14,6 +14,9 @@ async def persist_anomalies_loop(mongo_db, poll_interval=3):
         if items:
             docs = []
             for aid, score, payload in items:
+                if payload is None:
+                    # payload TTL expired before we got to it
+                    continue
                 doc = {
                     "anomaly_id": aid,
                     "user_id": payload.get("user_id"),
@@ -0,0 +1,364 @@
+# app/services/change_streams.py
+import os
+import time
+import uuid
+import socket
+import asyncio
+import argparse
+from collections import deque
+from datetime import datetime, timedelta
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo.errors import DuplicateKeyError, OperationFailure, PyMongoError
+
+from app.core.config import settings
+from app.core.dsa.mongo_dsa import MongoDSA
+
+"""
+Change-stream consumers for derived data.
+
+Tails transactions, login_logs and anomaly_logs with Motor change streams
+and hands events, in batches, to incremental handlers registered per
+collection, instead of polling Mongo or updating derived data inline in
+every write path:
+
+    @change_streams.handler("transactions")
+    async def on_transactions(db, events):      # list of change documents
+        ...
+
+- one stream per collection with handlers; events are batched up to
+  CHANGE_STREAM_BATCH_SIZE or CHANGE_STREAM_FLUSH_INTERVAL seconds
+- the resume token is saved in "change_stream_tokens" only after every
+  handler has handled the batch, so delivery is at-least-once across
+  restarts; a handler that raises is retried on its own (the others are not
+  re-run) with backoff, and until it succeeds the stream waits (state
+  "blocked") rather than skipping past the events
+- every process may call start(), but only the holder of a lease in
+  "change_stream_leases" (renewed every CHANGE_STREAM_LEASE_TTL / 3 seconds)
+  runs the streams, so handlers are not applied once per API process; if the
+  holder dies another process takes over once the lease expires
+- if the saved token has fallen off the oplog the stream restarts from now
+- time-series collections (EVENT_STORAGE_MODE=timeseries) cannot be watched
+  and are skipped
+
+Change streams need a replica set. Locally a single node is enough:
+
+    mongod --replSet rs0 --dbpath /tmp/rs0 --port 27017
+    mongosh --eval 'rs.initiate()'
+    MONGO_URI="mongodb://localhost:27017/?replicaSet=rs0" python -m app.services.change_streams
+"""
+
+TOKENS = "change_stream_tokens"
+LEASES = "change_stream_leases"
+OWNER = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+WATCHED = ("transactions", "login_logs", "anomaly_logs")
+HISTORY_LOST = {280, 286}   # ChangeStreamFatalError, ChangeStreamHistoryLost
+NOT_REPLICA_SET = 40573
+
+
+class _Handler:
+    __slots__ = ("name", "fn", "operations", "calls", "errors", "busy_s")
+
+    def __init__(self, name: str, fn, operations: tuple):
+        self.name = name
+        self.fn = fn
+        self.operations = set(operations)
+        self.calls = 0
+        self.errors = 0
+        self.busy_s = 0.0
+
+
+class _StreamStats:
+    def __init__(self):
+        self.state = "stopped"
+        self.events = 0
+        self.batches = 0
+        self.restarts = 0
+        self.last_event_at = None     # wall clock of the last event (server time)
+        self.last_lag_s = None        # now - cluster time of the last event, when it was handled
+        self.recent = deque()         # (monotonic, events) over the last minute, for throughput
+
+    def record(self, n: int, lag_s: float | None, event_at):
+        now = time.monotonic()
+        self.events += n
+        self.batches += 1
+        self.last_lag_s = lag_s
+        self.last_event_at = event_at
+        self.recent.append((now, n))
+        while self.recent and self.recent[0][0] < now - 60:
+            self.recent.popleft()
+
+    def snapshot(self) -> dict:
+        now = time.monotonic()
+        window = [n for t, n in self.recent if t >= now - 60]
+        return {
+            "state": self.state,
+            "events": self.events,
+            "batches": self.batches,
+            "restarts": self.restarts,
+            "events_per_s_1m": round(sum(window) / 60, 2),
+            "lag_s": round(self.last_lag_s, 3) if self.last_lag_s is not None else None,
+            "last_event_at": self.last_event_at,
+        }
+
+
+class ChangeStreamConsumer:
+    def __init__(self, name: str = "derived", batch_size: int = 500,
+                 flush_interval: float = 1.0, max_await_ms: int = 1000, lease_ttl: int = 30):
+        self.name = name
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_await_ms = max_await_ms
+        self.lease_ttl = lease_ttl
+        self.handlers: dict[str, list[_Handler]] = {}
+        self.streams: dict[str, _StreamStats] = {}
+        self.db = None
+        self.leader = False
+        self._tasks: dict[str, asyncio.Task] = {}
+        self._lease_task: asyncio.Task | None = None
+
+    # ---- registry ----
+    def register(self, collection: str, fn, name: str | None = None, operations=("insert",)):
+        if collection not in WATCHED:
+            raise ValueError(f"collection must be one of {WATCHED}")
+        self.handlers.setdefault(collection, []).append(_Handler(name or fn.__name__, fn, tuple(operations)))
+        return fn
+
+    def handler(self, collection: str, name: str | None = None, operations=("insert",)):
+        return lambda fn: self.register(collection, fn, name=name, operations=operations)
+
+    # ---- resume tokens ----
+    def _token_id(self, collection: str) -> str:
+        return f"{self.name}:{collection}"
+
+    async def _load_token(self, collection: str):
+        doc = await self.db[TOKENS].find_one({"_id": self._token_id(collection)})
+        return doc["token"] if doc else None
+
+    async def _save_token(self, collection: str, token):
+        await self.db[TOKENS].update_one(
+            {"_id": self._token_id(collection)},
+            {"$set": {"token": token, "updated_at": datetime.utcnow()}},
+            upsert=True,
+        )
+
+    async def _drop_token(self, collection: str):
+        await self.db[TOKENS].delete_one({"_id": self._token_id(collection)})
+
+    # ---- lease (one consumer per deployment) ----
+    async def _acquire_lease(self) -> bool:
+        """Take or renew the lease; False while another process holds it."""
+        now = datetime.utcnow()
+        try:
+            await self.db[LEASES].update_one(
+                {"_id": self.name, "$or": [{"owner": OWNER}, {"expires_at": {"$lt": now}}]},
+                {"$set": {"owner": OWNER, "expires_at": now + timedelta(seconds=self.lease_ttl)}},
+                upsert=True,
+            )
+        except DuplicateKeyError:
+            return False  # filter missed because someone else holds it; the upsert collided
+        return True
+
+    async def _release_lease(self):
+        await self.db[LEASES].delete_one({"_id": self.name, "owner": OWNER})
+
+    async def _lead(self):
+        while True:
+            try:
+                held = await self._acquire_lease()
+            except PyMongoError as e:
+                # can't tell whether the lease is still ours; stop rather than risk two consumers
+                print(f"⚠️ change stream lease check failed: {e}")
+                held = False
+            if held and not self.leader:
+                self.leader = True
+                print(f"📡 change stream consumer {self.name} acquired the lease ({OWNER})")
+                await self._start_streams()
+            elif not held and self.leader:
+                print(f"⚠️ change stream consumer {self.name} lost the lease, stopping streams")
+                await self._stop_streams()
+                self.leader = False
+            await asyncio.sleep(self.lease_ttl / 3)
+
+    # ---- streaming ----
+    async def _next_batch(self, stream) -> list[dict]:
+        # first event: wait as long as it takes; then fill up to batch_size / flush_interval
+        batch, deadline = [], None
+        while len(batch) < self.batch_size and stream.alive:
+            change = await stream.try_next()
+            if change is not None:
+                batch.append(change)
+                deadline = deadline or time.monotonic() + self.flush_interval
+            elif batch:
+                break
+            if deadline and time.monotonic() >= deadline:
+                break
+        return batch
+
+    async def _dispatch(self, collection: str, batch: list[dict]):
+        """Run every handler on the batch; failed handlers are retried alone until they succeed."""
+        stats = self.streams[collection]
+        pending = [h for h in self.handlers.get(collection, []) if any(e["operationType"] in h.operations for e in batch)]
+        backoff = 1.0
+        while pending:
+            failed = []
+            for h in pending:
+                events = [e for e in batch if e["operationType"] in h.operations]
+                start = time.perf_counter()
+                try:
+                    await h.fn(self.db, events)
+                except Exception as e:
+                    h.errors += 1
+                    failed.append(h)
+                    print(f"⚠️ change stream handler {collection}/{h.name} failed, retrying in {backoff:.0f}s: {e!r}")
+                finally:
+                    h.calls += 1
+                    h.busy_s += time.perf_counter() - start
+            pending = failed
+            if pending:
+                stats.state = "blocked"
+                await asyncio.sleep(backoff)
+                backoff = min(backoff * 2, 30.0)
+        stats.state = "running"
+
+    @staticmethod
+    def _record(stats: _StreamStats, batch: list[dict]):
+        cluster_time = batch[-1].get("clusterTime")  # bson Timestamp, second resolution
+        stats.record(
+            len(batch),
+            time.time() - cluster_time.time if cluster_time else None,
+            batch[-1].get("wallTime") or (cluster_time.as_datetime() if cluster_time else None),
+        )
+
+    async def _watch(self, collection: str):
+        stats = self.streams[collection]
+        operations = sorted({op for h in self.handlers[collection] for op in h.operations} | {"invalidate"})
+        backoff = 1.0
+        while True:
+            try:
+                token = await self._load_token(collection)
+                async with self.db[collection].watch(
+                    [{"$match": {"operationType": {"$in": operations}}}],
+                    full_document="updateLookup",
+                    resume_after=token,
+                    max_await_time_ms=self.max_await_ms,
+                    batch_size=self.batch_size,
+                ) as stream:
+                    stats.state = "running"
+                    backoff = 1.0
+                    while stream.alive:
+                        batch = await self._next_batch(stream)
+                        invalidated = any(e["operationType"] == "invalidate" for e in batch)
+                        batch = [e for e in batch if e["operationType"] != "invalidate"]
+                        if batch:
+                            await self._dispatch(collection, batch)  # returns once every handler succeeded
+                            await self._save_token(collection, stream.resume_token)
+                            self._record(stats, batch)
+                        if invalidated:
+                            # collection dropped / renamed: the old token can't be resumed
+                            print(f"⚠️ change stream on {collection} invalidated, restarting from now")
+                            await self._drop_token(collection)
+                            break
+            except OperationFailure as e:
+                if e.code == NOT_REPLICA_SET:
+                    stats.state = "unsupported"
+                    print(f"❌ change streams need a replica set ({collection}): {e}")
+                    return
+                if e.code in HISTORY_LOST:
+                    print(f"⚠️ resume token for {collection} is gone from the oplog, restarting from now")
+                    await self._drop_token(collection)
+                    stats.restarts += 1
+                    continue
+                stats.state = "retrying"
+                print(f"⚠️ change stream on {collection} failed: {e}")
+            except PyMongoError as e:
+                stats.state = "retrying"
+                print(f"⚠️ change stream on {collection} interrupted: {e}")
+            stats.restarts += 1
+            await asyncio.sleep(backoff)
+            backoff = min(backoff * 2, 30.0)
+
+    # ---- lifecycle ----
+    async def _start_streams(self):
+        dsa = MongoDSA(self.db)
+        for collection in self.handlers:
+            stats = self.streams.setdefault(collection, _StreamStats())
+            if await dsa.is_timeseries(collection):
+                stats.state = "unsupported"
+                print(f"⚠️ {collection} is a time-series collection, change streams are not available")
+                continue
+            self._tasks[collection] = asyncio.create_task(self._watch(collection))
+
+    async def _stop_streams(self):
+        # unsaved batches are re-delivered by the next lease holder (at-least-once)
+        for task in self._tasks.values():
+            task.cancel()
+        await asyncio.gather(*self._tasks.values(), return_exceptions=True)
+        self._tasks = {}
+        for stats in self.streams.values():
+            stats.state = "stopped"
+
+    async def start(self, db):
+        """Compete for the lease; the streams only run while this process holds it."""
+        self.db = db
+        for collection in self.handlers:
+            self.streams.setdefault(collection, _StreamStats()).state = "standby"
+        self._lease_task = asyncio.create_task(self._lead())
+
+    async def stop(self):
+        if self._lease_task:
+            self._lease_task.cancel()
+            await asyncio.gather(self._lease_task, return_exceptions=True)
+            self._lease_task = None
+        await self._stop_streams()
+        if self.leader:
+            self.leader = False
+            try:
+                await self._release_lease()  # lets another process take over without waiting for expiry
+            except PyMongoError as e:
+                print(f"⚠️ change stream lease release failed: {e}")
+
+    def snapshot(self) -> dict:
+        return {
+            "consumer": self.name,
+            "owner": OWNER,
+            "leader": self.leader,
+            "streams": {c: s.snapshot() for c, s in self.streams.items()},
+            "handlers": {
+                c: [{
+                    "name": h.name, "operations": sorted(h.operations), "calls": h.calls, "errors": h.errors,
+                    "avg_ms": round(h.busy_s * 1000 / h.calls, 2) if h.calls else None,
+                } for h in hs]
+                for c, hs in self.handlers.items()
+            },
+        }
+
+
+change_streams = ChangeStreamConsumer(
+    batch_size=settings.CHANGE_STREAM_BATCH_SIZE,
+    flush_interval=settings.CHANGE_STREAM_FLUSH_INTERVAL,
+    max_await_ms=settings.CHANGE_STREAM_MAX_AWAIT_MS,
+    lease_ttl=settings.CHANGE_STREAM_LEASE_TTL,
+)
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Run the change-stream consumers standalone")
+    parser.add_argument("--stats-interval", type=float, default=10.0)
+    args = parser.parse_args()
+
+    import app.services.user_activity  # noqa: F401  registers its handlers
+
+    client = AsyncIOMotorClient(settings.MONGO_URI)
+    await change_streams.start(client[settings.MONGO_DB_NAME])
+    try:
+        while True:
+            await asyncio.sleep(args.stats_interval)
+            for collection, stats in change_streams.snapshot()["streams"].items():
+                print(f"📡 {collection}: {stats}")
+    finally:
+        await change_streams.stop()
+        client.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
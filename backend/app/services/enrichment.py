@@ -0,0 +1,137 @@
+# app/services/enrichment.py
+import time
+import asyncio
+import inspect
+from collections import OrderedDict
+
+from app.core.tracing import span
+
+"""
+Deadline-aware enrichment.
+
+An EnrichmentPipeline runs independent enrichers (geolocation, device parsing,
+history lookups, ...) concurrently under one latency budget. An enricher that
+misses the deadline or raises is replaced by its last good value for the same
+cache key (e.g. the same IP) or by its default, and the result records which
+enrichers degraded and why.
+
+    async def last_txn(ctx):
+        return await ctx["db"].transactions.find_one({"user_id": ctx["user_id"]}, ...)
+
+    pipeline = EnrichmentPipeline([
+        Enricher("location", lambda ctx: lookup_geolocation(ctx["ip"]),
+                 default={}, cache_key=lambda ctx: ctx["ip"]),
+        Enricher("last_txn", last_txn),
+    ], budget_ms=300)
+    result = await pipeline.run({"db": db, "ip": ip, "user_id": user_id})
+    result.values["location"], result.degraded
+
+Sync functions run in a worker thread unless marked inline=True (cheap, CPU
+only); async enrichers must be `async def` and run as tasks on the loop.
+"""
+
+TIMEOUT = "timeout"
+ERROR = "error"
+
+
+class Enricher:
+    def __init__(self, name: str, fn, default=None, cache_key=None, inline: bool = False):
+        self.name = name
+        self.fn = fn
+        self.default = default
+        self.cache_key = cache_key
+        self.inline = inline
+
+
+class EnrichmentResult:
+    __slots__ = ("values", "degraded", "elapsed_ms")
+
+    def __init__(self, values: dict, degraded: dict, elapsed_ms: float):
+        self.values = values
+        self.degraded = degraded  # name -> "timeout:cache" / "error:default" ...
+        self.elapsed_ms = elapsed_ms
+
+    def summary(self) -> dict:
+        return {"degraded": self.degraded or None, "elapsed_ms": round(self.elapsed_ms, 2)}
+
+
+class _FallbackCache:
+    """Last good value per (enricher, key), bounded LRU."""
+
+    def __init__(self, max_entries: int = 10000):
+        self.max_entries = max_entries
+        self._data = OrderedDict()
+
+    def get(self, key):
+        if key in self._data:
+            self._data.move_to_end(key)
+            return True, self._data[key]
+        return False, None
+
+    def put(self, key, value):
+        self._data[key] = value
+        self._data.move_to_end(key)
+        if len(self._data) > self.max_entries:
+            self._data.popitem(last=False)
+
+
+class EnrichmentPipeline:
+    def __init__(self, enrichers: list[Enricher], budget_ms: float = 300, cache_size: int = 10000):
+        self.enrichers = enrichers
+        self.budget_ms = budget_ms
+        self.cache = _FallbackCache(cache_size)
+        self.stats = {e.name: {"ok": 0, TIMEOUT: 0, ERROR: 0} for e in enrichers}
+
+    def _start(self, enricher: Enricher, ctx: dict):
+        if inspect.iscoroutinefunction(enricher.fn):
+            return asyncio.ensure_future(_traced(enricher.name, enricher.fn(ctx)))
+        if enricher.inline:
+            fut = asyncio.get_event_loop().create_future()
+            try:
+                with span(f"enrich.{enricher.name}"):
+                    fut.set_result(enricher.fn(ctx))
+            except Exception as e:
+                fut.set_exception(e)
+            return fut
+        return asyncio.ensure_future(_traced(enricher.name, _call(enricher.fn, ctx)))
+
+    def _fallback(self, enricher: Enricher, ctx: dict, reason: str):
+        self.stats[enricher.name][reason] += 1
+        if enricher.cache_key:
+            hit, value = self.cache.get((enricher.name, enricher.cache_key(ctx)))
+            if hit:
+                return value, f"{reason}:cache"
+        return enricher.default, f"{reason}:default"
+
+    async def run(self, ctx: dict, budget_ms: float | None = None) -> EnrichmentResult:
+        start = time.perf_counter()
+        budget = (budget_ms if budget_ms is not None else self.budget_ms) / 1000
+
+        futures = {self._start(e, ctx): e for e in self.enrichers}
+        done, pending = await asyncio.wait(futures, timeout=budget)
+
+        values, degraded = {}, {}
+        for fut, enricher in futures.items():
+            if fut in pending:
+                fut.cancel()
+                values[enricher.name], degraded[enricher.name] = self._fallback(enricher, ctx, TIMEOUT)
+            elif fut.exception() is not None:
+                values[enricher.name], degraded[enricher.name] = self._fallback(enricher, ctx, ERROR)
+            else:
+                values[enricher.name] = fut.result()
+                self.stats[enricher.name]["ok"] += 1
+                if enricher.cache_key:
+                    self.cache.put((enricher.name, enricher.cache_key(ctx)), values[enricher.name])
+
+        return EnrichmentResult(values, degraded, (time.perf_counter() - start) * 1000)
+
+
+async def _traced(name: str, aw):
+    # a span per enricher; one cut off by the budget ends with error=CancelledError
+    with span(f"enrich.{name}"):
+        return await aw
+
+
+async def _call(fn, ctx):
+    # sync enrichers (blocking I/O) run off the event loop
+    return await asyncio.to_thread(fn, ctx)
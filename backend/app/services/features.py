@@ -0,0 +1,82 @@
+# app/services/features.py
+from datetime import datetime
+
+"""
+Feature dicts fed to the rule engine (services/rule_engine.py).
+
+Kept as pure functions of the event plus the per-user context the caller looked
+up, so the production handlers and offline jobs (replay, training) build
+exactly the same features from the same inputs.
+"""
+
+TRANSACTION_FEATURES = [
+    "amount", "amount_percentile", "transaction_duration", "hour_of_day", "is_new_device",
+    "is_new_ip", "is_new_country", "ring_users", "ring_risk",
+]
+LOGIN_FEATURES = [
+    "attempts_1m", "is_failed", "hour_of_day", "is_new_device", "is_new_ip",
+    "is_new_country", "ring_users", "ring_risk",
+]
+
+
+def _hour(ts) -> int | None:
+    if isinstance(ts, str):
+        ts = datetime.fromisoformat(ts)
+    return ts.hour if isinstance(ts, datetime) else None
+
+
+def _is_new(current, last) -> bool | None:
+    # unknown history -> None (rules treat it as "no signal")
+    if last is None or current is None:
+        return None
+    return current != last
+
+
+def _novelty(seen: dict | None, kind: str, current=None, last=None) -> bool | None:
+    """
+    Prefer the per-user seen filter (any earlier value, see redis_dsa.seen_filters_check);
+    fall back to comparing with the single last value.
+    """
+    flag = (seen or {}).get(kind)
+    if flag is not None:
+        return not flag
+    return _is_new(current, last)
+
+
+def _ring(ring: dict | None) -> dict:
+    ring = ring or {}
+    return {"ring_users": ring.get("users"), "ring_risk": ring.get("risk")}
+
+
+def transaction_features(
+    txn: dict, last_device: str | None = None,
+    ring: dict | None = None, seen: dict | None = None
+) -> dict:
+    return {
+        "amount": txn.get("amount"),
+        "category": txn.get("category"),
+        "amount_percentile": txn.get("amount_percentile"),
+        "transaction_duration": txn.get("transaction_duration"),
+        "hour_of_day": _hour(txn.get("transaction_date")),
+        "is_new_device": _novelty(seen, "device", txn.get("device_id"), last_device),
+        "is_new_ip": _novelty(seen, "ip"),
+        "is_new_country": _novelty(seen, "country"),
+        **_ring(ring),
+    }
+
+
+def login_features(
+    log: dict, attempts_1m: int = 0,
+    last_device: str | None = None, last_ip: str | None = None,
+    ring: dict | None = None, seen: dict | None = None
+) -> dict:
+    return {
+        "attempts_1m": attempts_1m,
+        "is_failed": log.get("status") == "failed",
+        "hour_of_day": _hour(log.get("login_time")),
+        "is_new_device": _novelty(seen, "device", log.get("device_id"), last_device),
+        "is_new_ip": _novelty(seen, "ip", log.get("ip_address"), last_ip),
+        "is_new_country": _novelty(seen, "country"),
+        "country": (log.get("location") or {}).get("country"),
+        **_ring(ring),
+    }
@@ -0,0 +1,314 @@
+# app/services/login_audit.py
+import time
+import asyncio
+from datetime import datetime
+
+from app.core.config import settings
+from app.core.cache import response_cache
+from app.services.partitions import user_partitions
+from app.core.dsa.redis_dsa import (
+    record_login_attempt,
+    set_last_ip,
+    set_last_device,
+    get_last_ip,
+    get_last_device,
+    seen_filters_check,
+    publish_anomaly_event,
+)
+from app.core.dsa.entity_graph import entity_graph
+from app.core.dsa.user_state_cache import user_state
+from app.services.features import login_features
+from app.services.rule_engine import rule_engine
+from app.services.enrichment import Enricher, EnrichmentPipeline
+from app.utils.ip_utils import get_geolocation, check_vpn_tor
+from app.utils.device_utils import parse_device_info, generate_device_fingerprint
+
+"""
+Login audit pipeline.
+
+The login handler only enqueues a compact LoginAuditEvent (no I/O); background
+tasks pull events in batches, enrich them (geolocation, device parsing and
+history lookups run concurrently under LOGIN_ENRICHMENT_BUDGET_MS, then rule
+scoring) and persist each batch with one insert_many.
+
+Overflow policy when the bounded queue is full (LOGIN_AUDIT_OVERFLOW):
+    drop_newest  discard the incoming event
+    drop_oldest  discard the oldest queued event to make room
+    block        make the handler wait for room (puts latency back on login)
+
+stop() stops accepting events and drains what is queued before returning.
+"""
+
+OVERFLOW_POLICIES = ("drop_newest", "drop_oldest", "block")
+
+
+class LoginAuditEvent:
+    __slots__ = ("email", "user_id", "ip_address", "device_data", "status", "login_time")
+
+    def __init__(self, email: str, user_id: str | None, ip_address: str,
+                 device_data: dict | None, status: str = "success"):
+        self.email = email
+        self.user_id = user_id
+        self.ip_address = ip_address
+        self.device_data = device_data
+        self.status = status
+        self.login_time = datetime.utcnow()
+
+
+async def _location(ctx):
+    return await get_geolocation(ctx["ip"])
+
+
+async def _previous_login_time(ctx):
+    if not ctx["user_id"]:
+        return None
+
+    async def load():
+        last = await ctx["db"].login_logs.find_one(
+            {"user_id": ctx["user_id"], "status": "success"},
+            {"login_time": 1},
+            sort=[("login_time", -1)]
+        )
+        return last["login_time"] if last else None
+    return await user_state.aget(ctx["user_id"], "last_login_at", load)
+
+
+async def _total_logins(ctx):
+    if not ctx["user_id"]:
+        return 0
+    return await user_state.aget(
+        ctx["user_id"], "login_count",
+        lambda: ctx["db"].login_logs.count_documents({"user_id": ctx["user_id"]})
+    )
+
+
+login_enrichment = EnrichmentPipeline([
+    Enricher("location", _location, default=None, cache_key=lambda ctx: ctx["ip"]),
+    Enricher("device_info", lambda ctx: parse_device_info(ctx["device_data"] or {}), inline=True),
+    Enricher("previous_login_time", _previous_login_time, default=None),
+    Enricher("total_logins", _total_logins, default=0),
+    Enricher("ip_reputation", lambda ctx: check_vpn_tor(ctx["ip"]),
+             default=None, cache_key=lambda ctx: ctx["ip"], inline=True),
+    Enricher("last_device", lambda ctx: get_last_device(ctx["user_id"]) if ctx["user_id"] else None),
+    Enricher("last_ip", lambda ctx: get_last_ip(ctx["user_id"]) if ctx["user_id"] else None),
+], budget_ms=settings.LOGIN_ENRICHMENT_BUDGET_MS)
+
+
+async def build_login_log(db, event: LoginAuditEvent) -> dict:
+    """Enrich one audit event into a login_logs document."""
+    user_id = event.user_id
+
+    enriched = await login_enrichment.run({
+        "db": db, "user_id": user_id, "ip": event.ip_address, "device_data": event.device_data,
+    })
+    v = enriched.values
+
+    # device parsing is local; if it failed, still record a stable fingerprint
+    device_info = v["device_info"] or {
+        "device_id": generate_device_fingerprint(event.device_data or {}),
+        "device_name": None,
+    }
+    device_id = device_info["device_id"]
+
+    login_log = {
+        "user_id": user_id,
+        "email": event.email,
+        "device_id": device_id,
+        "device_name": device_info["device_name"],
+        "device_info": device_info,
+        "ip_address": event.ip_address,
+        "login_time": event.login_time,
+        "previous_login_time": v["previous_login_time"],
+        "login_attempts": v["total_logins"] + 1,
+        "location": v["location"],
+        "ip_reputation": v["ip_reputation"],
+        "status": event.status,  # success, failed, blocked
+        "is_anomaly": False,
+        "risk_score": 0,
+        "enrichment": enriched.summary(),
+    }
+
+    # shared device / IP ring (only successful logins link entities)
+    ring = None
+    if user_id and event.status == "success":
+        ring = entity_graph.add_event(user_id, device_id, event.ip_address)
+        login_log["entity_ring"] = ring
+
+    # novel device / IP / country (only successful logins are remembered)
+    seen = None
+    if user_id:
+        seen = seen_filters_check(user_id, {
+            "device": device_id,
+            "ip": event.ip_address,
+            "country": (v["location"] or {}).get("country"),
+        }, add=event.status == "success")
+
+    # Rule-based scoring (attempt window keyed by email so unknown users count too)
+    attempts_1m = record_login_attempt(user_id or event.email)
+    result = rule_engine.evaluate("login", login_features(
+        login_log,
+        attempts_1m=attempts_1m,
+        last_device=v["last_device"],
+        last_ip=v["last_ip"],
+        ring=ring,
+        seen=seen,
+    ))
+    login_log["is_anomaly"] = result.is_anomaly
+    login_log["risk_score"] = result.score
+    login_log["rule_based_score"] = result.score
+    login_log["rule_reasons"] = result.reasons or None
+
+    if user_id and result.is_anomaly:
+        entity_graph.flag_user(user_id)
+
+    if user_id and "total_logins" not in enriched.degraded:
+        user_state.put(user_id, "login_count", login_log["login_attempts"])
+    if user_id and event.status == "success":
+        set_last_device(user_id, device_id)
+        set_last_ip(user_id, event.ip_address)
+        user_state.put(user_id, "last_login_at", event.login_time)
+
+    return login_log
+
+
+def _fix_batch_order(logs: list[dict]):
+    """
+    Logs of the same user enriched concurrently in one batch all saw the same
+    persisted history; chain their attempt counters / previous login times.
+    """
+    seen = {}
+    for log in sorted(logs, key=lambda l: l["login_time"]):
+        uid = log["user_id"]
+        if not uid:
+            continue
+        if uid in seen:
+            prev = seen[uid]
+            log["login_attempts"] = prev["login_attempts"] + 1
+            if prev["status"] == "success":
+                log["previous_login_time"] = prev["login_time"]
+            else:
+                log["previous_login_time"] = prev["previous_login_time"]
+        seen[uid] = log
+
+
+class LoginAuditPipeline:
+    def __init__(self, queue_size: int = 10000, batch_size: int = 100,
+                 flush_interval: float = 0.5, overflow: str = "drop_oldest"):
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError(f"overflow must be one of {OVERFLOW_POLICIES}")
+        self.queue_size = queue_size
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.overflow = overflow
+        self.queue: asyncio.Queue | None = None
+        self.db = None
+        self._task = None
+        self._accepting = False
+        self.stats = {"enqueued": 0, "dropped": 0, "persisted": 0, "failed": 0, "batches": 0}
+
+    # ---- producer side (login handler) ----
+    async def submit(self, event: LoginAuditEvent) -> bool:
+        if not self._accepting:
+            self.stats["dropped"] += 1
+            return False
+
+        if self.queue.full():
+            if self.overflow == "drop_newest":
+                self.stats["dropped"] += 1
+                return False
+            if self.overflow == "drop_oldest":
+                self.queue.get_nowait()
+                self.queue.task_done()
+                self.stats["dropped"] += 1
+            else:
+                await self.queue.put(event)
+                self.stats["enqueued"] += 1
+                return True
+
+        self.queue.put_nowait(event)
+        self.stats["enqueued"] += 1
+        return True
+
+    # ---- consumer side ----
+    async def _next_batch(self) -> list[LoginAuditEvent]:
+        batch = [await self.queue.get()]
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _process(self, batch: list[LoginAuditEvent]):
+        # each user's events are scored in order by that user's partition worker
+        futures = [
+            await user_partitions.submit(e.user_id or e.email, lambda e=e: build_login_log(self.db, e))
+            for e in batch
+        ]
+        results = await asyncio.gather(*futures, return_exceptions=True)
+        logs = [r for r in results if isinstance(r, dict)]
+        errors = [r for r in results if isinstance(r, BaseException)]
+        for err in errors[:1]:
+            print(f"Login audit enrichment error: {err}")
+        self.stats["failed"] += len(errors)
+
+        if logs:
+            _fix_batch_order(logs)
+            await self.db.login_logs.insert_many(logs, ordered=False)
+            self.stats["persisted"] += len(logs)
+            self.stats["batches"] += 1
+            response_cache.bump_many(log["user_id"] for log in logs if log.get("user_id"))
+            for log in logs:
+                if log["is_anomaly"]:
+                    publish_anomaly_event({
+                        "event": "anomaly",
+                        "score": log["risk_score"],
+                        "user_id": log.get("user_id"),
+                        "type": "login",
+                        "details": log.get("rule_reasons"),
+                    })
+
+    async def _run(self):
+        while True:
+            batch = await self._next_batch()
+            try:
+                await self._process(batch)
+            except Exception as e:
+                self.stats["failed"] += len(batch)
+                print(f"Login audit persist error: {e}")
+            finally:
+                for _ in batch:
+                    self.queue.task_done()
+
+    def start(self, db):
+        self.db = db
+        self.queue = asyncio.Queue(maxsize=self.queue_size)
+        self._accepting = True
+        self._task = asyncio.get_event_loop().create_task(self._run())
+
+    async def stop(self, timeout: float = 10.0):
+        """Stop accepting events and drain the queue (bounded by `timeout`)."""
+        if not self._task:
+            return
+        self._accepting = False
+        try:
+            await asyncio.wait_for(self.queue.join(), timeout)
+        except asyncio.TimeoutError:
+            print(f"⚠️ Login audit drain timed out, {self.queue.qsize()} events lost")
+        self._task.cancel()
+        self._task = None
+
+    def snapshot(self) -> dict:
+        return {**self.stats, "queued": self.queue.qsize() if self.queue else 0, "overflow": self.overflow}
+
+
+login_audit = LoginAuditPipeline(
+    queue_size=settings.LOGIN_AUDIT_QUEUE_SIZE,
+    batch_size=settings.LOGIN_AUDIT_BATCH_SIZE,
+    flush_interval=settings.LOGIN_AUDIT_FLUSH_INTERVAL,
+    overflow=settings.LOGIN_AUDIT_OVERFLOW,
+)
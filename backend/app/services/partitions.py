@@ -0,0 +1,188 @@
+# app/services/partitions.py
+import time
+import asyncio
+import contextvars
+
+from app.core.config import settings
+from app.db.redis_client import shard_for
+
+"""
+User-partitioned, ordered event processing.
+
+Events are hashed by user key (crc32, same as the Redis shards) onto a fixed
+set of partitions. Each partition is an asyncio.Queue drained by exactly one
+worker task, so all of a user's events run one at a time in submission order
+and per-user read-modify-write state (last device/IP, sketches, seen filters,
+attempt windows) needs no locks. Different users still run in parallel
+across partitions. Work runs in the submitter's contextvars context, so
+request-scoped state (e.g. the current trace) follows it onto the partition.
+
+    result = await user_partitions.call(user_id, lambda: handle(event))
+
+resize(n) rebalances: intake pauses, every queue drains (so nothing submitted
+under the old mapping can overtake or be overtaken), then the workers are
+rebuilt for the new partition count.
+
+The price of ordering is head-of-line blocking: a partition runs one event at
+a time, so one slow event (a slow user, a stuck enrichment) delays every other
+user hashed to the same partition until it finishes. Watch oldest_wait_ms in
+snapshot() and add partitions if a few hot users dominate.
+
+Every submitted future is resolved: with the result, with the handler's
+exception, or cancelled (handler cancelled, or the executor stopped before
+running it), so a waiting request never hangs.
+"""
+
+
+class _Partition:
+    __slots__ = ("queue", "task", "processed", "errors", "busy_s", "last_lag_s", "max_lag_s")
+
+    def __init__(self, queue_size: int):
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self.task: asyncio.Task | None = None
+        self.processed = 0
+        self.errors = 0
+        self.busy_s = 0.0
+        self.last_lag_s = 0.0
+        self.max_lag_s = 0.0
+
+
+class PartitionedExecutor:
+    def __init__(self, name: str, partitions: int = 16, queue_size: int = 1000):
+        self.name = name
+        self.num_partitions = partitions
+        self.queue_size = queue_size
+        self.partitions: list[_Partition] = []
+        self._open = None            # asyncio.Event, cleared while resizing
+        self._resize_lock = None
+
+    # ---- lifecycle ----
+    def _ensure_started(self):
+        if self.partitions:
+            return
+        self._open = asyncio.Event()
+        self._open.set()
+        self._resize_lock = asyncio.Lock()
+        self._spawn(self.num_partitions)
+
+    def _spawn(self, n: int):
+        self.num_partitions = n
+        self.partitions = [_Partition(self.queue_size) for _ in range(n)]
+        loop = asyncio.get_event_loop()
+        for part in self.partitions:
+            part.task = loop.create_task(self._worker(part))
+
+    async def _worker(self, part: _Partition):
+        while True:
+            fn, future, enqueued, ctx = await part.queue.get()
+            start = time.monotonic()
+            part.last_lag_s = start - enqueued
+            part.max_lag_s = max(part.max_lag_s, part.last_lag_s)
+            try:
+                if future.cancelled():
+                    continue  # the submitter gave up before its turn
+                result = await asyncio.get_running_loop().create_task(ctx.run(fn), context=ctx)
+            except asyncio.CancelledError:
+                part.errors += 1
+                if not future.done():
+                    future.cancel()
+                if asyncio.current_task().cancelling():
+                    raise  # the worker itself is being stopped
+                # otherwise only the handler was cancelled; keep serving the partition
+            except BaseException as e:
+                part.errors += 1
+                if not future.done():
+                    future.set_exception(e)
+                if not isinstance(e, Exception):
+                    raise
+            else:
+                if not future.done():
+                    future.set_result(result)
+            finally:
+                part.processed += 1
+                part.busy_s += time.monotonic() - start
+                part.queue.task_done()
+
+    async def drain(self, timeout: float | None = None):
+        if self.partitions:
+            await asyncio.wait_for(asyncio.gather(*(p.queue.join() for p in self.partitions)), timeout)
+
+    async def resize(self, n: int):
+        self._ensure_started()
+        if n < 1:
+            raise ValueError("need at least one partition")
+        async with self._resize_lock:
+            if n == self.num_partitions:
+                return
+            self._open.clear()
+            try:
+                await self.drain()
+                for part in self.partitions:
+                    part.task.cancel()
+                self._spawn(n)
+            finally:
+                self._open.set()
+
+    async def stop(self, timeout: float = 10.0):
+        if not self.partitions:
+            return
+        try:
+            await self.drain(timeout)
+        except asyncio.TimeoutError:
+            print(f"⚠️ {self.name} partitions drain timed out")
+        for part in self.partitions:
+            part.task.cancel()
+        await asyncio.gather(*(p.task for p in self.partitions), return_exceptions=True)
+        for part in self.partitions:
+            # never started: resolve them so their submitters don't wait forever
+            while not part.queue.empty():
+                _, future, _, _ = part.queue.get_nowait()
+                if not future.done():
+                    future.cancel()
+        self.partitions = []
+
+    # ---- producer side ----
+    def partition_for(self, key: str | None) -> int:
+        return shard_for(str(key or ""), self.num_partitions)
+
+    async def submit(self, key: str | None, fn) -> asyncio.Future:
+        """Queue `await fn()` behind earlier work for the same key; blocks while the partition is full."""
+        self._ensure_started()
+        await self._open.wait()
+        future = asyncio.get_event_loop().create_future()
+        part = self.partitions[self.partition_for(key)]
+        await part.queue.put((fn, future, time.monotonic(), contextvars.copy_context()))
+        return future
+
+    async def call(self, key: str | None, fn):
+        return await (await self.submit(key, fn))
+
+    # ---- metrics ----
+    def snapshot(self) -> dict:
+        now = time.monotonic()
+        parts = []
+        for i, p in enumerate(self.partitions):
+            head = p.queue._queue[0] if p.queue.qsize() else None  # oldest waiting item
+            parts.append({
+                "partition": i,
+                "depth": p.queue.qsize(),
+                "oldest_wait_ms": round((now - head[2]) * 1000, 1) if head else 0.0,
+                "last_lag_ms": round(p.last_lag_s * 1000, 1),
+                "max_lag_ms": round(p.max_lag_s * 1000, 1),
+                "processed": p.processed,
+                "errors": p.errors,
+                "avg_handle_ms": round(p.busy_s * 1000 / p.processed, 2) if p.processed else None,
+            })
+        return {
+            "name": self.name,
+            "partitions": self.num_partitions,
+            "resizing": self._open is not None and not self._open.is_set(),
+            "total_depth": sum(p["depth"] for p in parts),
+            "max_oldest_wait_ms": max((p["oldest_wait_ms"] for p in parts), default=0.0),
+            "detail": parts,
+        }
+
+
+user_partitions = PartitionedExecutor(
+    "user", partitions=settings.USER_PARTITIONS, queue_size=settings.USER_PARTITION_QUEUE_SIZE
+)
@@ -0,0 +1,280 @@
+# app/services/redis_warmup.py
+import time
+import asyncio
+import argparse
+from datetime import datetime
+from bson import ObjectId
+from pymongo import ReadPreference
+from motor.motor_asyncio import AsyncIOMotorClient
+
+from app.core.config import settings
+from app.core.dsa.mongo_dsa import EVENT_TIME_FIELDS
+from app.core.dsa.redis_dsa import RECENT_LIMIT, warm_user_state
+
+"""
+Rebuilds per-user Redis state from MongoDB after a flush / failover:
+user:<id>:recent_txn, user:<id>:recent_logins, user:last_device, user:last_ip.
+
+Per partition, one aggregation per collection groups events by user and keeps
+the latest RECENT_LIMIT with $topN (Mongo 5.2+); both results come back
+sorted by user_id and are merge-joined, so every user is written once, in
+pipelined batches (redis_dsa.warm_user_state). last_device is the newer of
+the latest transaction and the latest successful login, last_ip comes from
+the latest successful login, as in the live handlers.
+
+The user_id space is split into --partitions ranges (boundaries from
+$bucketAuto over users._id) and up to --workers partitions run at once.
+Progress (last user written per partition) is checkpointed in Mongo, not
+Redis, so an interrupted run resumes where it stopped:
+
+    python -m app.services.redis_warmup --partitions 16 --workers 4
+    python -m app.services.redis_warmup --restart     # forget checkpoints
+    python -m app.services.redis_warmup --overwrite   # full rebuild, replace live keys
+
+By default keys written by live traffic since the flush are left alone.
+Seen filters are rebuilt separately by services/seen_filter_loader.py.
+"""
+
+CHECKPOINTS = "redis_warmup_checkpoints"
+
+
+def _jsonable(value):
+    # same shape as model_dump(mode="json") for what the live handlers push
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, ObjectId):
+        return str(value)
+    if isinstance(value, dict):
+        return {k: _jsonable(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_jsonable(v) for v in value]
+    return value
+
+
+def _user_match(lo: str | None, hi: str | None) -> dict:
+    cond = {"$ne": None}
+    if lo is not None:
+        cond["$gt"] = lo       # lo is exclusive: a boundary or the last user checkpointed
+    if hi is not None:
+        cond["$lte"] = hi
+    return {"user_id": cond}
+
+
+def _pipeline(collection: str, lo: str | None, hi: str | None, limit: int) -> list:
+    time_field = EVENT_TIME_FIELDS[collection]
+    group = {
+        "_id": "$user_id",
+        "recent": {"$topN": {"n": limit, "sortBy": {time_field: -1, "_id": -1}, "output": "$$ROOT"}},
+    }
+    stages = [{"$match": _user_match(lo, hi)}]
+    if collection == "login_logs":
+        # latest successful login, for last_device / last_ip (may be older than the recent window)
+        stages.append({"$set": {"_ok": {"$eq": ["$status", "success"]}}})
+        group["last_success"] = {"$top": {
+            "sortBy": {"_ok": -1, time_field: -1},
+            "output": {"ok": "$_ok", "device_id": "$device_id", "ip": "$ip_address", "t": f"${time_field}"},
+        }}
+    return stages + [{"$group": group}, {"$sort": {"_id": 1}}]
+
+
+async def _merge_by_user(a, b):
+    """Join two cursors sorted by _id: yields (user_id, doc_a | None, doc_b | None)."""
+    a, b = a.__aiter__(), b.__aiter__()
+    x, y = await anext(a, None), await anext(b, None)
+    while x is not None or y is not None:
+        uid = min(d["_id"] for d in (x, y) if d is not None)
+        dx = x if x is not None and x["_id"] == uid else None
+        dy = y if y is not None and y["_id"] == uid else None
+        yield uid, dx, dy
+        if dx is not None:
+            x = await anext(a, None)
+        if dy is not None:
+            y = await anext(b, None)
+
+
+def _user_entry(uid: str, txns: dict | None, logins: dict | None) -> dict:
+    recent_txn = [_jsonable({k: v for k, v in d.items() if k != "_id"}) for d in (txns or {}).get("recent", [])]
+    recent_logins = [_jsonable({k: v for k, v in d.items() if k not in ("_id", "_ok")}) for d in (logins or {}).get("recent", [])]
+
+    success = (logins or {}).get("last_success") or {}
+    if not success.get("ok"):
+        success = {}
+    # last_device: whichever of the latest transaction / successful login is newer
+    candidates = []
+    if txns and txns.get("recent"):
+        latest = txns["recent"][0]
+        candidates.append((latest.get("transaction_date") or datetime.min, latest.get("device_id")))
+    if success:
+        candidates.append((success.get("t") or datetime.min, success.get("device_id")))
+    last_device = max(candidates, key=lambda c: c[0])[1] if candidates else None
+
+    return {
+        "user_id": uid,
+        "recent_txn": recent_txn,
+        "recent_logins": recent_logins,
+        "last_device": last_device,
+        "last_ip": success.get("ip"),
+    }
+
+
+class RedisWarmup:
+    def __init__(self, db, run_id: str = "default", partitions: int = 8, workers: int = 4,
+                 batch_size: int = 500, overwrite: bool = False):
+        self.db = db
+        self.run_id = run_id
+        self.partitions = partitions
+        self.workers = workers
+        self.batch_size = batch_size
+        self.overwrite = overwrite
+        self.progress = {}
+
+    # ---- plan / checkpoints ----
+    def _checkpoints(self):
+        # the db may be the analytics (secondary-preferred) pool; resume must see the latest checkpoint
+        return self.db.get_collection(CHECKPOINTS, read_preference=ReadPreference.PRIMARY)
+
+    async def _boundaries(self) -> list[str]:
+        # user ids are str(ObjectId): hex order == ObjectId order, so users._id buckets split the id space
+        if self.partitions <= 1:
+            return []
+        buckets = await self.db.users.aggregate([
+            {"$bucketAuto": {"groupBy": "$_id", "buckets": self.partitions}},
+        ]).to_list(length=self.partitions)
+        return [str(b["_id"]["max"]) for b in buckets[:-1]]
+
+    async def plan(self, restart: bool = False) -> list[dict]:
+        """Partition ranges for this run, reused (with their checkpoints) when resuming."""
+        coll = self._checkpoints()
+        if restart:
+            await coll.delete_many({"run_id": self.run_id})
+        parts = await coll.find({"run_id": self.run_id}).sort("partition", 1).to_list(length=None)
+        if parts:
+            return parts
+
+        bounds = await self._boundaries()
+        edges = [None] + bounds + [None]
+        parts = [{
+            "_id": f"{self.run_id}:{i}", "run_id": self.run_id, "partition": i,
+            "lo": edges[i], "hi": edges[i + 1], "last_user_id": None,
+            "users": 0, "done": False, "updated_at": datetime.utcnow(),
+        } for i in range(len(edges) - 1)]
+        await coll.insert_many(parts)
+        return parts
+
+    async def _checkpoint(self, part: dict):
+        await self._checkpoints().update_one({"_id": part["_id"]}, {"$set": {
+            "last_user_id": part["last_user_id"], "users": part["users"],
+            "done": part["done"], "updated_at": datetime.utcnow(),
+        }})
+
+    # ---- work ----
+    async def _flush(self, part: dict, batch: list[dict]):
+        written = await asyncio.to_thread(warm_user_state, batch, self.overwrite)
+        part["last_user_id"] = batch[-1]["user_id"]
+        part["users"] += len(batch)
+        await self._checkpoint(part)  # only after Redis has the batch
+        stats = self.progress[part["partition"]]
+        stats["users"] = part["users"]
+        for field, n in written.items():
+            stats[field] = stats.get(field, 0) + n
+
+    async def _run_partition(self, part: dict):
+        self.progress[part["partition"]] = {"users": part["users"], "done": part["done"]}
+        if part["done"]:
+            return
+        lo = part["last_user_id"] or part["lo"]
+        opts = {"allowDiskUse": True}
+        txns = self.db.transactions.aggregate(_pipeline("transactions", lo, part["hi"], RECENT_LIMIT), **opts)
+        logins = self.db.login_logs.aggregate(_pipeline("login_logs", lo, part["hi"], RECENT_LIMIT), **opts)
+
+        batch = []
+        async for uid, t, l in _merge_by_user(txns, logins):
+            batch.append(_user_entry(uid, t, l))
+            if len(batch) >= self.batch_size:
+                await self._flush(part, batch)
+                batch = []
+        if batch:
+            await self._flush(part, batch)
+        part["done"] = True
+        await self._checkpoint(part)
+        self.progress[part["partition"]]["done"] = True
+        print(f"🔥 warmup {self.run_id} partition {part['partition']}: {part['users']} users")
+
+    async def run(self, restart: bool = False) -> dict:
+        start = time.monotonic()
+        parts = await self.plan(restart)
+        sem = asyncio.Semaphore(self.workers)
+
+        async def worker(part):
+            async with sem:
+                await self._run_partition(part)
+
+        await asyncio.gather(*(worker(p) for p in parts))
+        return {
+            "run_id": self.run_id,
+            "partitions": len(parts),
+            "users": sum(p["users"] for p in parts),
+            "elapsed_s": round(time.monotonic() - start, 1),
+            "detail": self.progress,
+        }
+
+
+# ---- in-process trigger (admin endpoint) ----
+_current: dict = {"warmup": None, "task": None, "result": None, "error": None}
+
+
+def start_warmup(db, restart: bool = False, **kwargs) -> bool:
+    """Run a warmup as a background task; False if one is already running."""
+    if _current["task"] is not None and not _current["task"].done():
+        return False
+    warmup = RedisWarmup(db, **kwargs)
+
+    async def run():
+        try:
+            _current["result"] = await warmup.run(restart=restart)
+        except Exception as e:
+            _current["error"] = repr(e)
+            print(f"❌ Redis warmup failed: {e!r}")
+
+    _current.update(warmup=warmup, result=None, error=None, task=asyncio.create_task(run()))
+    return True
+
+
+def warmup_status() -> dict:
+    warmup, task = _current["warmup"], _current["task"]
+    if warmup is None:
+        return {"state": "idle"}
+    return {
+        "state": "running" if not task.done() else ("failed" if _current["error"] else "done"),
+        "run_id": warmup.run_id,
+        "overwrite": warmup.overwrite,
+        "users": sum(p.get("users", 0) for p in warmup.progress.values()),
+        "partitions_done": sum(1 for p in warmup.progress.values() if p.get("done")),
+        "progress": warmup.progress,
+        "result": _current["result"],
+        "error": _current["error"],
+    }
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Rebuild per-user Redis state from MongoDB")
+    parser.add_argument("--run-id", default="default", help="checkpoint namespace; reuse to resume")
+    parser.add_argument("--partitions", type=int, default=8)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--batch-size", type=int, default=500, help="users per Redis pipeline")
+    parser.add_argument("--restart", action="store_true", help="ignore existing checkpoints")
+    parser.add_argument("--overwrite", action="store_true", help="replace keys live traffic already wrote")
+    args = parser.parse_args()
+
+    client = AsyncIOMotorClient(settings.MONGO_URI)
+    warmup = RedisWarmup(
+        client[settings.MONGO_DB_NAME], run_id=args.run_id, partitions=args.partitions,
+        workers=args.workers, batch_size=args.batch_size, overwrite=args.overwrite,
+    )
+    result = await warmup.run(restart=args.restart)
+    print(f"✅ Redis warmup done: {result['users']} users in {result['elapsed_s']}s")
+    client.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,328 @@
+# app/services/replay.py
+"""
+Historical replay / backtesting of the scoring logic.
+
+Streams login_logs and transactions from Mongo merged in time order,
+partitions them by user onto a pool of worker processes (each user's events
+go to one worker, in order), rebuilds the per-user state production keeps in
+Redis (attempt window, seen values, amount sketches, last device/IP, rings)
+in memory, and runs every event through the same feature builders
+(services/features.py) and rule engine as the live handlers.
+
+Output: confusion matrix per event type against a label field (default the
+stored is_anomaly), per-rule hit counts and the score distribution.
+
+    python -m app.services.replay --from 2025-11-01 --to 2025-12-01 \
+        --rules candidate_rules.json --workers 8
+
+Caveats: population amount sketches and fraud rings are built per partition,
+so they only see that partition's users.
+
+An event that fails to score is counted under "errors" (with a few sample
+messages) instead of stopping its worker. If a worker process dies anyway,
+run_replay raises instead of waiting for its report.
+"""
+import json
+import zlib
+import heapq
+import queue
+import argparse
+import multiprocessing as mp
+from collections import defaultdict
+from datetime import datetime
+from pymongo import MongoClient
+
+from app.core.config import settings
+from app.core.dsa.quantile_sketch import AmountSketch, blended_percentile
+from app.core.dsa.entity_graph import EntityGraph
+from app.services.features import transaction_features, login_features
+from app.services.rule_engine import RuleEngine
+
+CHUNK = 1000  # events per inter-process message
+POLL = 1.0  # seconds between worker liveness checks while blocked on a queue
+ERROR_SAMPLES = 5
+ATTEMPT_WINDOW = 60  # seconds, mirrors redis_dsa.record_login_attempt
+
+
+class PartitionState:
+    """In-memory stand-in for the per-user Redis state of one partition."""
+
+    def __init__(self):
+        self.attempts = {}                  # key -> (count, last_ts)
+        self.seen = defaultdict(set)        # (user, kind) -> values
+        self.last_device = {}
+        self.last_ip = {}
+        self.last_txn = {}
+        self.sketches = defaultdict(AmountSketch)
+        self.graph = EntityGraph(settings.ENTITY_GRAPH_RING_THRESHOLD)
+
+    def record_attempt(self, key: str, ts: float) -> int:
+        # the Redis list TTL is refreshed on every push: the window resets after 60s of quiet
+        count, last = self.attempts.get(key, (0, None))
+        if last is None or ts - last > ATTEMPT_WINDOW:
+            count = 0
+        count += 1
+        self.attempts[key] = (count, ts)
+        return count
+
+    def check_seen(self, user_id: str, values: dict, add: bool) -> dict:
+        result = {}
+        for kind, value in values.items():
+            if value is None:
+                result[kind] = None
+                continue
+            bucket = self.seen[(user_id, kind)]
+            result[kind] = (value in bucket) if bucket else None
+            if add:
+                bucket.add(value)
+        return result
+
+
+def _ts(value):
+    return datetime.fromisoformat(value) if isinstance(value, str) else value
+
+
+def score_transaction(state: PartitionState, engine: RuleEngine, txn: dict):
+    user_id, ts = txn["user_id"], _ts(txn["transaction_date"])
+    category, amount = txn.get("category"), txn.get("amount") or 0.0
+
+    prev = state.last_txn.get(user_id)
+    txn = {
+        **txn,
+        "transaction_date": ts,
+        "transaction_duration": (ts - prev).total_seconds() if prev else None,
+        "amount_percentile": blended_percentile(
+            state.sketches[(user_id, category)], state.sketches[(None, category)], amount
+        ),
+    }
+    ring = state.graph.add_event(user_id, txn.get("device_id"), txn.get("ip"))
+    seen = state.check_seen(user_id, {
+        "device": txn.get("device_id"),
+        "ip": txn.get("ip"),
+        "country": (txn.get("location") or {}).get("country"),
+    }, add=True)
+    result = engine.evaluate("transaction", transaction_features(
+        txn, last_device=state.last_device.get(user_id), ring=ring, seen=seen
+    ))
+
+    if result.is_anomaly:
+        state.graph.flag_user(user_id)
+    state.last_txn[user_id] = ts
+    state.last_device[user_id] = txn.get("device_id")
+    for key in {(user_id, category), (user_id, None), (None, category), (None, None)}:
+        state.sketches[key].add(amount)
+    return result
+
+
+def score_login(state: PartitionState, engine: RuleEngine, log: dict):
+    user_id, ts = log.get("user_id"), _ts(log["login_time"])
+    success = log.get("status") == "success"
+
+    ring = seen = None
+    if user_id and success:
+        ring = state.graph.add_event(user_id, log.get("device_id"), log.get("ip_address"))
+    if user_id:
+        seen = state.check_seen(user_id, {
+            "device": log.get("device_id"),
+            "ip": log.get("ip_address"),
+            "country": (log.get("location") or {}).get("country"),
+        }, add=success)
+
+    attempts = state.record_attempt(user_id or log.get("email"), ts.timestamp())
+    result = engine.evaluate("login", login_features(
+        {**log, "login_time": ts},
+        attempts_1m=attempts,
+        last_device=state.last_device.get(user_id) if user_id else None,
+        last_ip=state.last_ip.get(user_id) if user_id else None,
+        ring=ring,
+        seen=seen,
+    ))
+
+    if user_id and result.is_anomaly:
+        state.graph.flag_user(user_id)
+    if user_id and success:
+        state.last_device[user_id] = log.get("device_id")
+        state.last_ip[user_id] = log.get("ip_address")
+    return result
+
+
+def _new_report():
+    return {
+        event: {"tp": 0, "fp": 0, "tn": 0, "fn": 0, "scores": [0] * 11, "hits": defaultdict(int),
+                "errors": 0, "error_samples": []}
+        for event in ("login", "transaction")
+    }
+
+
+def _partition_worker(rules_path: str, label_field: str, inbox, outbox):
+    engine = RuleEngine(rules_path, reload_interval=float("inf"))
+    state = PartitionState()
+    report = _new_report()
+
+    while True:
+        chunk = inbox.get()
+        if chunk is None:
+            break
+        for event_type, doc in chunk:
+            r = report[event_type]
+            try:
+                if event_type == "transaction":
+                    result = score_transaction(state, engine, doc)
+                else:
+                    result = score_login(state, engine, doc)
+            except Exception as e:
+                # one malformed document must not take the partition (and the run) down
+                r["errors"] += 1
+                if len(r["error_samples"]) < ERROR_SAMPLES:
+                    r["error_samples"].append(f"{type(e).__name__}: {e}")
+                continue
+
+            label = bool(doc.get(label_field))
+            key = ("t" if result.is_anomaly == label else "f") + ("p" if result.is_anomaly else "n")
+            r[key] += 1
+            r["scores"][min(result.score // 10, 10)] += 1
+            for rule_id in result.reasons:
+                r["hits"][rule_id] += 1
+
+    for r in report.values():
+        r["hits"] = dict(r["hits"])
+    outbox.put(report)
+
+
+def _stream(db, from_dt: datetime | None, to_dt: datetime | None, batch_size: int = 5000):
+    """login_logs and transactions merged by event time."""
+    def cursor(collection, time_field, event_type):
+        q = {time_field: {"$type": "date"}}
+        if from_dt:
+            q[time_field]["$gte"] = from_dt
+        if to_dt:
+            q[time_field]["$lt"] = to_dt
+        for doc in db[collection].find(q, {"_id": 0}).sort(time_field, 1).batch_size(batch_size):
+            yield doc[time_field], event_type, doc
+
+    return heapq.merge(
+        cursor("login_logs", "login_time", "login"),
+        cursor("transactions", "transaction_date", "transaction"),
+        key=lambda item: item[0],
+    )
+
+
+def _merge_reports(reports: list) -> dict:
+    total = _new_report()
+    for report in reports:
+        for event, r in report.items():
+            t = total[event]
+            for k in ("tp", "fp", "tn", "fn"):
+                t[k] += r[k]
+            t["scores"] = [a + b for a, b in zip(t["scores"], r["scores"])]
+            for rule_id, n in r["hits"].items():
+                t["hits"][rule_id] += n
+            t["errors"] += r["errors"]
+            t["error_samples"] = (t["error_samples"] + r["error_samples"])[:ERROR_SAMPLES]
+
+    for t in total.values():
+        t["hits"] = dict(t["hits"])
+        tp, fp, fn = t["tp"], t["fp"], t["fn"]
+        t["precision"] = round(tp / (tp + fp), 4) if tp + fp else None
+        t["recall"] = round(tp / (tp + fn), 4) if tp + fn else None
+        t["score_histogram"] = {f"{i * 10}-{i * 10 + 9}" if i < 10 else "100": n for i, n in enumerate(t.pop("scores"))}
+    return total
+
+
+def _check_workers(procs: list):
+    for part, p in enumerate(procs):
+        if p.exitcode not in (None, 0):
+            raise RuntimeError(f"replay worker {part} died (exit code {p.exitcode})")
+
+
+def _send(inbox, chunk, procs: list):
+    # a bounded put on a dead worker's inbox would block forever once it fills up
+    while True:
+        try:
+            inbox.put(chunk, timeout=POLL)
+            return
+        except queue.Full:
+            _check_workers(procs)
+
+
+def _collect(outbox, procs: list) -> list:
+    reports = []
+    while len(reports) < len(procs):
+        try:
+            reports.append(outbox.get(timeout=POLL))
+        except queue.Empty:
+            _check_workers(procs)
+            if not any(p.is_alive() for p in procs):
+                raise RuntimeError(f"replay workers exited with {len(procs) - len(reports)} report(s) missing")
+    return reports
+
+
+def run_replay(db, rules_path: str, workers: int = 4,
+               from_dt: datetime | None = None, to_dt: datetime | None = None,
+               label_field: str = "is_anomaly") -> dict:
+    ctx = mp.get_context("spawn")
+    outbox = ctx.Queue()
+    inboxes = [ctx.Queue(maxsize=16) for _ in range(workers)]  # bounded: backpressure on the reader
+    procs = [
+        ctx.Process(target=_partition_worker, args=(rules_path, label_field, inbox, outbox), daemon=True)
+        for inbox in inboxes
+    ]
+    for p in procs:
+        p.start()
+
+    buffers = [[] for _ in range(workers)]
+    events = 0
+    try:
+        for _, event_type, doc in _stream(db, from_dt, to_dt):
+            key = doc.get("user_id") or doc.get("email") or ""
+            part = zlib.crc32(key.encode()) % workers
+            buffers[part].append((event_type, doc))
+            if len(buffers[part]) >= CHUNK:
+                _send(inboxes[part], buffers[part], procs)
+                buffers[part] = []
+            events += 1
+
+        for part, inbox in enumerate(inboxes):
+            if buffers[part]:
+                _send(inbox, buffers[part], procs)
+            _send(inbox, None, procs)
+
+        reports = _collect(outbox, procs)
+    except BaseException:
+        for p in procs:
+            p.terminate()
+        raise
+    for p in procs:
+        p.join()
+
+    result = _merge_reports(reports)
+    result["events"] = events
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay historical events through the scoring rules")
+    parser.add_argument("--from", dest="from_dt", type=datetime.fromisoformat)
+    parser.add_argument("--to", dest="to_dt", type=datetime.fromisoformat)
+    parser.add_argument("--rules", default=settings.RULES_PATH)
+    parser.add_argument("--workers", type=int, default=mp.cpu_count())
+    parser.add_argument("--label-field", default="is_anomaly")
+    parser.add_argument("--out")
+    args = parser.parse_args()
+
+    client = MongoClient(settings.MONGO_URI)
+    report = run_replay(
+        client[settings.MONGO_DB_NAME], args.rules, workers=args.workers,
+        from_dt=args.from_dt, to_dt=args.to_dt, label_field=args.label_field,
+    )
+    client.close()
+
+    out = json.dumps(report, indent=2, default=str)
+    if args.out:
+        with open(args.out, "w") as fh:
+            fh.write(out)
+    print(out)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,340 @@
+# app/services/rule_engine.py
+import os
+import ast
+import json
+import time
+import threading
+import numpy as np
+from datetime import datetime
+
+from app.core.config import settings
+from app.services.features import transaction_features, login_features
+
+"""
+Declarative fraud rules.
+
+Rules live in a JSON file (settings.RULES_PATH):
+
+    {
+      "threshold": 50,
+      "rules": [
+        {"id": "login_burst", "when": "attempts_1m > 5", "score": 60, "events": ["login"]},
+        ...
+      ]
+    }
+
+`when` is a small expression language over the event's feature dict (see
+services/features.py): comparisons, and/or/not, + - * /, `in [..]` and abs().
+Each expression is parsed once, checked against a whitelist and compiled into
+two Python functions:
+
+- scalar:  f(features: dict) -> bool         (one event, microseconds)
+- vector:  f(columns: dict[str, ndarray])    (batch / replay, NumPy masks)
+
+A missing feature (None / NaN) makes any comparison that uses it False.
+A rule that raises at evaluation time (division by zero, comparing a string
+with a number, ...) counts as not matched and is counted in its `errors`.
+The file is re-read when its mtime changes, checked at most every
+RULES_RELOAD_INTERVAL seconds on the evaluation path; a broken file keeps the
+previous rule set. Every rule is dry-run against SAMPLE_FEATURES on load, and a
+file with a rule that raises there is rejected.
+"""
+
+_CMP_OPS = {
+    ast.Gt: ">", ast.GtE: ">=", ast.Lt: "<", ast.LtE: "<=", ast.Eq: "==", ast.NotEq: "!=",
+}
+_BIN_OPS = {ast.Add: "+", ast.Sub: "-", ast.Mult: "*", ast.Div: "/"}
+_VECTOR_ERRORS = (TypeError, ZeroDivisionError, FloatingPointError)
+
+# representative feature dicts (built by the production feature functions) for the load-time dry run
+SAMPLE_FEATURES = {
+    "transaction": transaction_features(
+        {"amount": 120.0, "category": "shopping", "amount_percentile": 50.0,
+         "transaction_duration": 30, "transaction_date": datetime(2024, 1, 1, 12)},
+        ring={"users": 1, "risk": 0}, seen={"device": True, "ip": True, "country": True},
+    ),
+    "login": login_features(
+        {"status": "success", "login_time": datetime(2024, 1, 1, 12), "location": {"country": "Pakistan"}},
+        attempts_1m=1, ring={"users": 1, "risk": 0}, seen={"device": True, "ip": True, "country": True},
+    ),
+}
+
+
+class RuleSyntaxError(ValueError):
+    pass
+
+
+class _Compiler:
+    """Translate a whitelisted expression AST into Python source (scalar or vector)."""
+
+    def __init__(self, vector: bool):
+        self.vector = vector
+
+    def compile(self, expr: str):
+        try:
+            tree = ast.parse(expr, mode="eval")
+        except SyntaxError as e:
+            raise RuleSyntaxError(f"{expr!r}: {e.msg}")
+        src = self.visit(tree.body, boolean=True)
+        scope = {"np": np, "_truthy": _truthy}
+        return eval(compile(f"lambda f: {src}", "<rule>", "eval"), scope)
+
+    def visit(self, node, boolean: bool = False):
+        if isinstance(node, ast.BoolOp):
+            parts = [self.visit(v, boolean=True) for v in node.values]
+            if self.vector:
+                fn = "np.logical_and" if isinstance(node.op, ast.And) else "np.logical_or"
+                out = parts[0]
+                for p in parts[1:]:
+                    out = f"{fn}({out}, {p})"
+                return out
+            joiner = " and " if isinstance(node.op, ast.And) else " or "
+            return "(" + joiner.join(parts) + ")"
+
+        if isinstance(node, ast.UnaryOp) and isinstance(node.op, ast.Not):
+            inner = self.visit(node.operand, boolean=True)
+            return f"np.logical_not({inner})" if self.vector else f"(not {inner})"
+
+        if isinstance(node, ast.UnaryOp) and isinstance(node.op, ast.USub):
+            return f"(-{self.visit(node.operand)})"
+
+        if isinstance(node, ast.Compare):
+            return self.visit_compare(node)
+
+        if isinstance(node, ast.BinOp) and type(node.op) in _BIN_OPS:
+            return f"({self.visit(node.left)} {_BIN_OPS[type(node.op)]} {self.visit(node.right)})"
+
+        if isinstance(node, ast.Call) and isinstance(node.func, ast.Name) and node.func.id == "abs" and len(node.args) == 1:
+            arg = self.visit(node.args[0])
+            return f"np.abs({arg})" if self.vector else f"abs({arg})"
+
+        if isinstance(node, ast.Name):
+            lookup = f"f[{node.id!r}]" if self.vector else f"f.get({node.id!r})"
+            if boolean and self.vector:
+                return f"_truthy({lookup})"
+            return lookup
+
+        if isinstance(node, ast.Constant) and isinstance(node.value, (int, float, str, bool)):
+            return repr(node.value)
+
+        if isinstance(node, (ast.List, ast.Tuple)):
+            return "(" + ", ".join(self.visit(e) for e in node.elts) + ",)"
+
+        raise RuleSyntaxError(f"unsupported expression: {ast.dump(node)}")
+
+    def visit_compare(self, node: ast.Compare):
+        operands = [node.left] + list(node.comparators)
+        srcs = [self.visit(o) for o in operands]
+        pairs = []
+        for k, op in enumerate(node.ops):
+            left, right = srcs[k], srcs[k + 1]
+            if isinstance(op, (ast.In, ast.NotIn)):
+                if self.vector:
+                    expr = f"np.isin({left}, list({right}))"
+                    pairs.append(f"np.logical_not({expr})" if isinstance(op, ast.NotIn) else expr)
+                else:
+                    pairs.append(f"({left} {'not in' if isinstance(op, ast.NotIn) else 'in'} {right})")
+            elif type(op) in _CMP_OPS:
+                pairs.append(f"({left} {_CMP_OPS[type(op)]} {right})")
+            else:
+                raise RuleSyntaxError(f"unsupported comparison: {type(op).__name__}")
+
+        if self.vector:
+            # NaN compares False on its own, no None guard needed
+            out = pairs[0]
+            for p in pairs[1:]:
+                out = f"np.logical_and({out}, {p})"
+            return out
+
+        # every feature the comparison reads, also inside arithmetic / abs() / lists
+        names = list(dict.fromkeys(n.id for o in operands for n in _feature_names(o)))
+        guard = f"None not in ({', '.join(f'f.get({n!r})' for n in names)},) and " if names else ""
+        return f"({guard}{' and '.join(pairs)})"
+
+
+def _feature_names(node):
+    if isinstance(node, ast.Call):
+        # the callee (abs) is not a feature, its arguments are
+        return [n for a in node.args for n in _feature_names(a)]
+    if isinstance(node, ast.Name):
+        return [node]
+    return [n for child in ast.iter_child_nodes(node) for n in _feature_names(child)]
+
+
+def _truthy(a):
+    a = np.asarray(a)
+    if a.dtype.kind == "f":
+        return np.nan_to_num(a) != 0
+    return a.astype(bool)
+
+
+class Rule:
+    __slots__ = ("id", "when", "score", "events", "predicate", "vector_predicate", "hits", "errors", "last_error")
+
+    def __init__(self, spec: dict):
+        self.id = spec["id"]
+        self.when = spec["when"]
+        if not isinstance(self.when, str):
+            raise RuleSyntaxError(f"rule {self.id!r}: 'when' must be a string")
+        self.score = int(spec.get("score", 0))
+        self.events = set(spec.get("events") or ("login", "transaction"))
+        self.predicate = _Compiler(vector=False).compile(self.when)
+        self.vector_predicate = _Compiler(vector=True).compile(self.when)
+        self.hits = 0
+        self.errors = 0
+        self.last_error = None
+
+    def matches(self, features: dict) -> bool:
+        try:
+            return bool(self.predicate(features))
+        except Exception as e:
+            self._failed(e)
+            return False
+
+    def vector_mask(self, cols: dict, n: int) -> np.ndarray:
+        try:
+            with np.errstate(divide="ignore", invalid="ignore"):
+                return np.broadcast_to(np.asarray(self.vector_predicate(cols), dtype=bool), (n,))
+        except KeyError:
+            # feature not present in this batch
+            return np.zeros(n, dtype=bool)
+        except _VECTOR_ERRORS as e:
+            self._failed(e)
+            return np.zeros(n, dtype=bool)
+
+    def _failed(self, e: Exception):
+        self.errors += 1
+        self.last_error = f"{type(e).__name__}: {e}"
+
+    def dry_run(self):
+        """Evaluate on SAMPLE_FEATURES (scalar and vector); raises RuleSyntaxError if the rule fails."""
+        for event_type in self.events:
+            sample = SAMPLE_FEATURES.get(event_type)
+            if sample is None:
+                continue
+            cols = {k: np.asarray([np.nan if v is None else v]) for k, v in sample.items()}
+            try:
+                self.predicate(sample)
+                with np.errstate(divide="ignore", invalid="ignore"):
+                    self.vector_predicate(cols)
+            except KeyError:
+                continue  # unknown feature: no signal at runtime, same as a missing value
+            except Exception as e:
+                raise RuleSyntaxError(f"rule {self.id!r} fails on sample {event_type} features: {type(e).__name__}: {e}")
+
+
+class RuleResult:
+    __slots__ = ("is_anomaly", "score", "reasons")
+
+    def __init__(self, is_anomaly: bool, score: int, reasons: dict):
+        self.is_anomaly = is_anomaly
+        self.score = score
+        self.reasons = reasons
+
+
+class RuleEngine:
+    def __init__(self, path: str, reload_interval: float = 5.0):
+        self.path = path
+        self.reload_interval = reload_interval
+        self.threshold = 50
+        self.rules: list[Rule] = []
+        self._mtime = None
+        self._next_check = 0.0
+        self._lock = threading.Lock()
+        self.last_error = None
+        self.evaluations = 0
+        self.eval_ns_total = 0
+        self.eval_ns_max = 0
+        self.reload()
+
+    # ---- loading ----
+    def reload(self, force: bool = False) -> bool:
+        try:
+            mtime = os.path.getmtime(self.path)
+        except OSError:
+            return False
+        if not force and mtime == self._mtime:
+            return False
+
+        try:
+            with open(self.path) as fh:
+                config = json.load(fh)
+            rules = [Rule(spec) for spec in config.get("rules", []) if spec.get("enabled", True)]
+            for rule in rules:
+                rule.dry_run()
+        except (ValueError, KeyError, TypeError, RuleSyntaxError) as e:
+            # keep serving the previous rules
+            self.last_error = f"{type(e).__name__}: {e}"
+            self._mtime = mtime
+            print(f"⚠️ Rule reload failed: {self.last_error}")
+            return False
+
+        with self._lock:
+            self.rules = rules
+            self.threshold = int(config.get("threshold", 50))
+            self._mtime = mtime
+            self.last_error = None
+        return True
+
+    def maybe_reload(self):
+        now = time.monotonic()
+        if now >= self._next_check:
+            self._next_check = now + self.reload_interval
+            self.reload()
+
+    # ---- evaluation ----
+    def evaluate(self, event_type: str, features: dict) -> RuleResult:
+        self.maybe_reload()
+        start = time.perf_counter_ns()
+
+        score = 0
+        reasons = {}
+        for rule in self.rules:
+            if event_type in rule.events and rule.matches(features):
+                rule.hits += 1
+                score += rule.score
+                reasons[rule.id] = rule.score
+        score = min(score, 100)
+
+        elapsed = time.perf_counter_ns() - start
+        self.evaluations += 1
+        self.eval_ns_total += elapsed
+        if elapsed > self.eval_ns_max:
+            self.eval_ns_max = elapsed
+        return RuleResult(score >= self.threshold, score, reasons)
+
+    def evaluate_batch(self, event_type: str, columns: dict) -> dict:
+        """
+        Vectorized evaluation over feature columns (equal-length arrays, NaN for missing).
+        Returns per-event scores / is_anomaly arrays and per-rule hit masks.
+        """
+        n = len(next(iter(columns.values()))) if columns else 0
+        cols = {k: np.asarray(v) for k, v in columns.items()}
+        scores = np.zeros(n, dtype=np.int32)
+        masks = {}
+        for rule in self.rules:
+            if event_type not in rule.events:
+                continue
+            mask = rule.vector_mask(cols, n)
+            masks[rule.id] = mask
+            scores += mask * rule.score
+        scores = np.minimum(scores, 100)
+        return {"scores": scores, "is_anomaly": scores >= self.threshold, "hits": masks}
+
+    def stats(self) -> dict:
+        return {
+            "path": self.path,
+            "threshold": self.threshold,
+            "last_error": self.last_error,
+            "evaluations": self.evaluations,
+            "avg_eval_us": round(self.eval_ns_total / self.evaluations / 1000, 3) if self.evaluations else 0,
+            "max_eval_us": round(self.eval_ns_max / 1000, 3),
+            "rules": [
+                {"id": r.id, "when": r.when, "score": r.score, "events": sorted(r.events), "hits": r.hits,
+                 "errors": r.errors, "last_error": r.last_error}
+                for r in self.rules
+            ],
+        }
+
+
+rule_engine = RuleEngine(settings.RULES_PATH, settings.RULES_RELOAD_INTERVAL)
@@ -0,0 +1,66 @@
+# app/services/seen_filter_loader.py
+import asyncio
+import argparse
+from motor.motor_asyncio import AsyncIOMotorClient
+
+from app.core.config import settings
+from app.core.dsa.redis_dsa import seen_filters_add_many
+
+"""
+Bulk loader for the per-user "seen device / IP / country" Bloom filters
+(redis_dsa.seen_filters_check). Streams successful login_logs and
+transactions and writes their values in pipelined batches.
+
+    python -m app.services.seen_filter_loader
+"""
+
+SOURCES = {
+    # collection -> (filter, projection of kind -> field)
+    "login_logs": ({"user_id": {"$ne": None}, "status": "success"},
+                   {"device": "device_id", "ip": "ip_address", "country": "location.country"}),
+    "transactions": ({"user_id": {"$ne": None}},
+                     {"device": "device_id", "ip": "ip", "country": "location.country"}),
+}
+
+
+def _get(doc: dict, path: str):
+    for part in path.split("."):
+        if not isinstance(doc, dict):
+            return None
+        doc = doc.get(part)
+    return doc
+
+
+async def load_seen_filters(db, batch_size: int = 2000) -> int:
+    loaded = 0
+    for collection, (query, fields) in SOURCES.items():
+        projection = {"user_id": 1, **{path: 1 for path in fields.values()}}
+        cursor = db[collection].find(query, projection).batch_size(batch_size)
+
+        entries = []
+        async for doc in cursor:
+            for kind, path in fields.items():
+                entries.append((doc["user_id"], kind, _get(doc, path)))
+            if len(entries) >= batch_size * len(fields):
+                await asyncio.to_thread(seen_filters_add_many, entries)
+                loaded += len(entries)
+                entries = []
+        if entries:
+            await asyncio.to_thread(seen_filters_add_many, entries)
+            loaded += len(entries)
+        print(f"📦 {collection}: {loaded} seen-filter entries loaded")
+    return loaded
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Build per-user seen filters from history")
+    parser.add_argument("--batch-size", type=int, default=2000)
+    args = parser.parse_args()
+
+    client = AsyncIOMotorClient(settings.MONGO_URI)
+    await load_seen_filters(client[settings.MONGO_DB_NAME], batch_size=args.batch_size)
+    client.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
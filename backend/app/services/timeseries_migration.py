@@ -0,0 +1,120 @@
+# app/services/timeseries_migration.py
+import asyncio
+import argparse
+from datetime import datetime
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo.errors import BulkWriteError, CollectionInvalid, OperationFailure
+
+from app.core.config import settings
+from app.core.dsa.mongo_dsa import (
+    MongoDSA, EVENT_TIME_FIELDS, STORAGE_TIMESERIES, coerce_event_time, timeseries_options
+)
+
+"""
+Move login_logs / transactions from plain collections into time-series collections.
+
+Time-series collections cannot be renamed, so the plain collection is renamed
+away first ("<name>_legacy"), the time-series collection is created under the
+original name right after (live writes go straight into it), then history is
+copied over in _id order, one chunk at a time. A live insert landing between
+the rename and the create would auto-create a plain collection instead; the
+migration then stops with an error rather than copying history into it, so
+run it with writers paused if traffic is heavy. Progress is checkpointed in the
+"migrations" collection so an interrupted run resumes where it stopped.
+
+    python -m app.services.timeseries_migration --collection login_logs
+"""
+
+
+async def migrate_collection(db, name: str, chunk_size: int | None = None, retention_days: int | None = None):
+    chunk_size = chunk_size or settings.MIGRATION_CHUNK_SIZE
+    retention_days = settings.EVENT_RETENTION_DAYS if retention_days is None else retention_days
+    legacy = f"{name}_legacy"
+    mongo_dsa = MongoDSA(db)
+
+    existing = set(await db.list_collection_names())
+    if name in existing and not await mongo_dsa.is_timeseries(name):
+        if legacy in existing:
+            raise RuntimeError(f"{legacy} already exists, refusing to overwrite it")
+        await db[name].rename(legacy)
+
+    if not await mongo_dsa.is_timeseries(name):
+        opts = {"timeseries": timeseries_options(name)}
+        if retention_days:
+            opts["expireAfterSeconds"] = retention_days * 86400
+        try:
+            await db.create_collection(name, **opts)
+        except (CollectionInvalid, OperationFailure) as e:
+            if isinstance(e, OperationFailure) and e.code != 48:  # NamespaceExists
+                raise
+            raise RuntimeError(
+                f"{name} was recreated as a plain collection by a live write after the rename; "
+                f"pause writers, move its documents into {legacy}, drop {name} and re-run"
+            ) from e
+
+    # indexes (and retention on an already time-series collection), for this collection only:
+    # the other event collection may still be plain and waiting for its own run
+    await mongo_dsa.ensure_indexes(
+        storage_mode=STORAGE_TIMESERIES, retention_days=retention_days, collections=[name]
+    )
+
+    if legacy not in set(await db.list_collection_names()):
+        print(f"✅ {name}: nothing to migrate")
+        return 0
+
+    checkpoint = await db.migrations.find_one({"_id": f"timeseries:{name}"}) or {}
+    last_id = checkpoint.get("last_id")
+    moved = checkpoint.get("moved", 0)
+    time_field = EVENT_TIME_FIELDS[name]
+
+    while True:
+        q = {"_id": {"$gt": last_id}} if last_id is not None else {}
+        docs = await db[legacy].find(q).sort("_id", 1).limit(chunk_size).to_list(length=chunk_size)
+        if not docs:
+            break
+
+        batch = []
+        for doc in docs:
+            try:
+                coerce_event_time(name, doc)
+            except ValueError:
+                continue
+            if isinstance(doc.get(time_field), datetime):
+                batch.append(doc)
+
+        if batch:
+            try:
+                await db[name].insert_many(batch, ordered=False)
+            except BulkWriteError as e:
+                # duplicate _id after a crash between insert and checkpoint is fine
+                if any(err.get("code") != 11000 for err in e.details.get("writeErrors", [])):
+                    raise
+
+        last_id = docs[-1]["_id"]
+        moved += len(batch)
+        await db.migrations.update_one(
+            {"_id": f"timeseries:{name}"},
+            {"$set": {"last_id": last_id, "moved": moved, "updated_at": datetime.utcnow()}},
+            upsert=True,
+        )
+        print(f"📦 {name}: {moved} documents migrated")
+
+    print(f"✅ {name}: migration complete, drop {legacy} once verified")
+    return moved
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Migrate event collections to time-series storage")
+    parser.add_argument("--collection", choices=list(EVENT_TIME_FIELDS), action="append")
+    parser.add_argument("--chunk-size", type=int, default=settings.MIGRATION_CHUNK_SIZE)
+    args = parser.parse_args()
+
+    client = AsyncIOMotorClient(settings.MONGO_URI)
+    db = client[settings.MONGO_DB_NAME]
+    for name in args.collection or list(EVENT_TIME_FIELDS):
+        await migrate_collection(db, name, chunk_size=args.chunk_size)
+    client.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,206 @@
+# app/services/training.py
+import os
+import json
+import hashlib
+import argparse
+from datetime import datetime
+import numpy as np
+import joblib
+import pyarrow as pa
+import pyarrow.parquet as pq
+from pymongo import MongoClient
+from sklearn.ensemble import IsolationForest
+
+from app.core.config import settings
+from app.services.features import transaction_features, login_features
+
+"""
+Offline training pipeline (out-of-core).
+
+1. extract: chunked cursor reads of transactions / login_logs, run through the
+   same feature builders as production (services/features.py) and written
+   chunk by chunk into a memory-mapped .npy matrix (optionally also a Parquet
+   file for inspection). Only one chunk is ever held in memory.
+2. train: IsolationForest over the memmap with n_jobs parallelism; each tree
+   draws max_samples rows, so fitting never materialises the full matrix.
+3. publish: versioned artifacts
+
+    <MODEL_DIR>/<event_type>/<version>/model.joblib
+    <MODEL_DIR>/<event_type>/<version>/metadata.json
+    <MODEL_DIR>/<event_type>/LATEST          (points at the newest version)
+
+    python -m app.services.training --event transaction --n-jobs 8
+"""
+
+MISSING = -1.0  # unknown feature value (IsolationForest cannot take NaN)
+
+SOURCES = {
+    # event type -> (collection, time field, feature builder, columns)
+    "transaction": ("transactions", "transaction_date", transaction_features, [
+        "amount", "amount_percentile", "transaction_duration", "hour_of_day", "ring_users", "ring_risk",
+    ]),
+    "login": ("login_logs", "login_time", login_features, [
+        "is_failed", "hour_of_day", "ring_users", "ring_risk",
+    ]),
+}
+
+
+def _row(doc: dict, builder, columns: list[str]) -> list[float]:
+    features = builder(doc, ring=doc.get("entity_ring"))
+    return [MISSING if features.get(c) is None else float(features[c]) for c in columns]
+
+
+def extract_features(db, event_type: str, out_dir: str, chunk_size: int | None = None,
+                     from_dt: datetime | None = None, to_dt: datetime | None = None,
+                     parquet: bool = False) -> dict:
+    """Stream `event_type` documents into <out_dir>/features.npy; returns the matrix metadata."""
+    collection, time_field, builder, columns = SOURCES[event_type]
+    chunk_size = chunk_size or settings.TRAINING_CHUNK_SIZE
+    query = {}
+    if from_dt or to_dt:
+        query[time_field] = {k: v for k, v in (("$gte", from_dt), ("$lt", to_dt)) if v}
+
+    # the count is an upper bound for the preallocated memmap; rows is what actually got written
+    capacity = db[collection].count_documents(query)
+    os.makedirs(out_dir, exist_ok=True)
+    path = os.path.join(out_dir, "features.npy")
+    if not capacity:
+        return {"path": path, "rows": 0, "columns": columns}
+    matrix = np.lib.format.open_memmap(path, mode="w+", dtype=np.float32, shape=(capacity, len(columns)))
+
+    writer = None
+    if parquet:
+        schema = pa.schema([(c, pa.float32()) for c in columns])
+        writer = pq.ParquetWriter(os.path.join(out_dir, "features.parquet"), schema)
+
+    rows = 0
+    chunk = []
+
+    def flush():
+        nonlocal rows
+        block = np.asarray(chunk, dtype=np.float32).reshape(-1, len(columns))
+        matrix[rows:rows + len(block)] = block
+        if writer:
+            writer.write_table(pa.Table.from_arrays(list(block.T), names=columns))
+        rows += len(block)
+        chunk.clear()
+
+    cursor = db[collection].find(query, {"_id": 0}).batch_size(chunk_size).limit(capacity)
+    for doc in cursor:
+        chunk.append(_row(doc, builder, columns))
+        if len(chunk) >= chunk_size:
+            flush()
+            print(f"🧮 {event_type}: {rows}/{capacity} rows extracted")
+    if chunk:
+        flush()
+
+    matrix.flush()
+    del matrix
+    if writer:
+        writer.close()
+    return {"path": path, "rows": rows, "columns": columns}
+
+
+def load_matrix(meta: dict) -> np.ndarray:
+    """Read-only memmap view of the extracted rows."""
+    return np.load(meta["path"], mmap_mode="r")[:meta["rows"]]
+
+
+def train_isolation_forest(X: np.ndarray, n_estimators: int = 200, max_samples: int | str = "auto",
+                           contamination="auto", n_jobs: int = -1, random_state: int = 42) -> IsolationForest:
+    model = IsolationForest(
+        n_estimators=n_estimators,
+        max_samples=max_samples,
+        contamination=contamination,
+        n_jobs=n_jobs,
+        random_state=random_state,
+    )
+    return model.fit(X)
+
+
+def _sha256(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as fh:
+        for block in iter(lambda: fh.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def publish_model(model, event_type: str, meta: dict, params: dict, model_dir: str | None = None) -> str:
+    root = os.path.join(model_dir or settings.MODEL_DIR, event_type)
+    version = datetime.utcnow().strftime("%Y%m%dT%H%M%SZ")
+    path = os.path.join(root, version)
+    os.makedirs(path, exist_ok=True)
+
+    artifact = os.path.join(path, "model.joblib")
+    joblib.dump(model, artifact, compress=3)
+    metadata = {
+        "version": version,
+        "event_type": event_type,
+        "features": meta["columns"],
+        "missing_value": MISSING,
+        "rows": meta["rows"],
+        "params": params,
+        "sha256": _sha256(artifact),
+        "created_at": datetime.utcnow().isoformat(),
+    }
+    with open(os.path.join(path, "metadata.json"), "w") as fh:
+        json.dump(metadata, fh, indent=2)
+
+    # swap the LATEST pointer atomically so a loader never sees a half-written file
+    tmp = os.path.join(root, "LATEST.tmp")
+    with open(tmp, "w") as fh:
+        fh.write(version)
+    os.replace(tmp, os.path.join(root, "LATEST"))
+    return path
+
+
+def load_latest_model(event_type: str, model_dir: str | None = None):
+    """(model, metadata) of the newest published version, or (None, None)."""
+    root = os.path.join(model_dir or settings.MODEL_DIR, event_type)
+    try:
+        with open(os.path.join(root, "LATEST")) as fh:
+            version = fh.read().strip()
+        with open(os.path.join(root, version, "metadata.json")) as fh:
+            metadata = json.load(fh)
+    except FileNotFoundError:
+        return None, None
+
+    artifact = os.path.join(root, version, "model.joblib")
+    if _sha256(artifact) != metadata["sha256"]:
+        raise RuntimeError(f"checksum mismatch for {artifact}")
+    return joblib.load(artifact), metadata
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Train and publish an IsolationForest from event history")
+    parser.add_argument("--event", choices=sorted(SOURCES), default="transaction")
+    parser.add_argument("--from", dest="from_dt", type=datetime.fromisoformat)
+    parser.add_argument("--to", dest="to_dt", type=datetime.fromisoformat)
+    parser.add_argument("--chunk-size", type=int, default=settings.TRAINING_CHUNK_SIZE)
+    parser.add_argument("--work-dir", default=os.path.join(settings.MODEL_DIR, "work"))
+    parser.add_argument("--parquet", action="store_true", help="also write the features as Parquet")
+    parser.add_argument("--n-estimators", type=int, default=200)
+    parser.add_argument("--max-samples", type=int, default=256)
+    parser.add_argument("--n-jobs", type=int, default=-1)
+    args = parser.parse_args()
+
+    client = MongoClient(settings.MONGO_URI)
+    meta = extract_features(
+        client[settings.MONGO_DB_NAME], args.event, os.path.join(args.work_dir, args.event),
+        chunk_size=args.chunk_size, from_dt=args.from_dt, to_dt=args.to_dt, parquet=args.parquet,
+    )
+    client.close()
+    if not meta["rows"]:
+        print(f"⚠️ no {args.event} rows to train on")
+        return
+
+    params = {"n_estimators": args.n_estimators, "max_samples": args.max_samples, "n_jobs": args.n_jobs}
+    X = load_matrix(meta)
+    model = train_isolation_forest(X, **{**params, "max_samples": min(args.max_samples, meta["rows"])})
+    path = publish_model(model, args.event, meta, params)
+    print(f"✅ {args.event} model trained on {meta['rows']} rows -> {path}")
+
+
+if __name__ == "__main__":
+    main()
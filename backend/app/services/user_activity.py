@@ -0,0 +1,67 @@
+# app/services/user_activity.py
+from pymongo import UpdateOne
+
+from app.services.change_streams import change_streams
+
+"""
+Per-user activity rollup ("user_activity"), maintained incrementally from the
+change streams (services/change_streams.py) instead of by the write paths:
+
+    {_id: user_id, transactions, amount_total, anomalous_transactions,
+     logins, failed_logins, anomalies, last_txn_at, last_login_at, last_anomaly_at}
+
+Counters are $inc-ed per batch, so a batch re-delivered after a crash
+(at-least-once) is counted twice; rebuild from the source collections if
+exact totals matter.
+"""
+
+COLLECTION = "user_activity"
+
+
+def _rollup(events: list[dict], counters, time_field: str, last_field: str) -> list[UpdateOne]:
+    per_user = {}
+    for e in events:
+        doc = e.get("fullDocument") or {}
+        uid = doc.get("user_id")
+        if not uid:
+            continue
+        inc, last = per_user.setdefault(uid, ({}, None))
+        for field, value in counters(doc).items():
+            inc[field] = inc.get(field, 0) + value
+        t = doc.get(time_field)
+        if t is not None and (last is None or t > last):
+            per_user[uid] = (inc, t)
+    ops = []
+    for uid, (inc, last) in per_user.items():
+        update = {"$inc": inc}
+        if last is not None:
+            update["$max"] = {last_field: last}
+        ops.append(UpdateOne({"_id": uid}, update, upsert=True))
+    return ops
+
+
+async def _apply(db, ops: list[UpdateOne]):
+    if ops:
+        await db[COLLECTION].bulk_write(ops, ordered=False)
+
+
+@change_streams.handler("transactions")
+async def transactions_rollup(db, events):
+    await _apply(db, _rollup(events, lambda d: {
+        "transactions": 1,
+        "amount_total": d.get("amount") or 0,
+        "anomalous_transactions": int(bool(d.get("is_anomaly"))),
+    }, "transaction_date", "last_txn_at"))
+
+
+@change_streams.handler("login_logs")
+async def logins_rollup(db, events):
+    await _apply(db, _rollup(events, lambda d: {
+        "logins": 1,
+        "failed_logins": int(d.get("status") != "success"),
+    }, "login_time", "last_login_at"))
+
+
+@change_streams.handler("anomaly_logs")
+async def anomalies_rollup(db, events):
+    await _apply(db, _rollup(events, lambda d: {"anomalies": 1}, "detected_at", "last_anomaly_at"))
@@ -3,7 +3,7 @@ import requests
 def get_location_from_ip(ip):
     try:
         url = f"https://ipapi.co/{ip}/json/"
-        res = requests.get(url).json()
+        res = requests.get(url, timeout=3).json()
 
         return {
             "country": res.get("country_name"),
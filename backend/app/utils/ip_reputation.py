@@ -0,0 +1,238 @@
+# backend/app/utils/ip_reputation.py
+
+import os
+import time
+import ipaddress
+import threading
+from array import array
+from typing import Dict, Any, Optional
+
+"""
+Local IP reputation engine.
+
+CIDR lists (one network or address per line, '#' comments) are loaded from a
+directory into path-compressed binary radix tries, one trie per list and
+address family. Nodes live in flat typed arrays (network, prefix length,
+two child indexes, flag byte) so a million prefixes cost a few tens of MB
+instead of millions of Python objects.
+
+Lookups walk at most one node per prefix bit (O(prefix length)) and collect
+the flags of every matching prefix on the path, so a Tor exit /32 inside a
+hosting /16 reports both. A list is rebuilt only when its file changes, in a
+background thread, and swapped in atomically.
+"""
+
+TOR = 1
+VPN = 2
+HOSTING = 4
+KNOWN_BAD = 8
+
+# file name -> category flag
+DEFAULT_LISTS = {
+    "tor_exit.txt": TOR,
+    "vpn.txt": VPN,
+    "hosting.txt": HOSTING,
+    "known_bad.txt": KNOWN_BAD,
+}
+
+RISK_WEIGHTS = {TOR: 60, VPN: 30, HOSTING: 20, KNOWN_BAD: 90}
+
+
+class PrefixTrie:
+    """Path-compressed binary trie over `bits`-wide integers (32 for IPv4, 128 for IPv6)."""
+
+    def __init__(self, bits: int):
+        self.bits = bits
+        self._full = (1 << bits) - 1
+        self.lo = array("I" if bits == 32 else "Q")
+        self.hi = array("Q") if bits > 64 else None
+        self.plen = array("B")
+        self.child0 = array("i")
+        self.child1 = array("i")
+        self.flags = array("B")
+        self._add(0, 0, 0)  # root covers everything
+
+    def __len__(self):
+        return len(self.plen)
+
+    def nbytes(self) -> int:
+        arrays = [self.lo, self.plen, self.child0, self.child1, self.flags]
+        if self.hi is not None:
+            arrays.append(self.hi)
+        return sum(a.itemsize * len(a) for a in arrays)
+
+    # ---- node storage ----
+    def _add(self, net: int, length: int, flags: int) -> int:
+        if self.hi is not None:
+            self.hi.append(net >> 64)
+            self.lo.append(net & 0xFFFFFFFFFFFFFFFF)
+        else:
+            self.lo.append(net)
+        self.plen.append(length)
+        self.child0.append(-1)
+        self.child1.append(-1)
+        self.flags.append(flags)
+        return len(self.plen) - 1
+
+    def _key(self, n: int) -> int:
+        if self.hi is not None:
+            return (self.hi[n] << 64) | self.lo[n]
+        return self.lo[n]
+
+    def _mask(self, addr: int, length: int) -> int:
+        return addr & (self._full ^ ((1 << (self.bits - length)) - 1))
+
+    def _bit(self, addr: int, pos: int) -> int:
+        return (addr >> (self.bits - 1 - pos)) & 1
+
+    def _child(self, n: int, b: int) -> int:
+        return self.child1[n] if b else self.child0[n]
+
+    def _set_child(self, n: int, b: int, c: int):
+        if b:
+            self.child1[n] = c
+        else:
+            self.child0[n] = c
+
+    # ---- build ----
+    def insert(self, net: int, length: int, flags: int):
+        net = self._mask(net, length)
+        n = 0
+        while True:
+            if self.plen[n] == length:
+                self.flags[n] |= flags
+                return
+            b = self._bit(net, self.plen[n])
+            c = self._child(n, b)
+            if c == -1:
+                self._set_child(n, b, self._add(net, length, flags))
+                return
+
+            ckey, clen = self._key(c), self.plen[c]
+            common = min(self.bits - (net ^ ckey).bit_length(), length, clen)
+            if common == clen:
+                n = c  # child's prefix contains net, descend
+                continue
+
+            if common == length:
+                # net is a prefix of the child: insert it in between
+                new = self._add(net, length, flags)
+                self._set_child(new, self._bit(ckey, length), c)
+                self._set_child(n, b, new)
+                return
+
+            # diverge below `common`: split with an internal (flagless) node
+            mid = self._add(self._mask(net, common), common, 0)
+            self._set_child(mid, self._bit(ckey, common), c)
+            self._set_child(mid, self._bit(net, common), self._add(net, length, flags))
+            self._set_child(n, b, mid)
+            return
+
+    # ---- query ----
+    def lookup(self, addr: int) -> int:
+        """OR of the flags of all prefixes containing addr (0 if none)."""
+        n = 0
+        found = self.flags[0]
+        while self.plen[n] < self.bits:
+            c = self._child(n, self._bit(addr, self.plen[n]))
+            if c == -1 or self._mask(addr, self.plen[c]) != self._key(c):
+                break
+            n = c
+            found |= self.flags[n]
+        return found
+
+
+def _parse_line(line: str):
+    line = line.split("#", 1)[0].strip()
+    if not line:
+        return None
+    try:
+        net = ipaddress.ip_network(line, strict=False)
+    except ValueError:
+        return None
+    return net.version, int(net.network_address), net.prefixlen
+
+
+def build_tries(path: str, flag: int):
+    v4, v6 = PrefixTrie(32), PrefixTrie(128)
+    with open(path) as fh:
+        for line in fh:
+            parsed = _parse_line(line)
+            if parsed is None:
+                continue
+            version, net, length = parsed
+            (v4 if version == 4 else v6).insert(net, length, flag)
+    return v4, v6
+
+
+class IPReputation:
+    def __init__(self, directory: str, lists: Optional[Dict[str, int]] = None, reload_interval: float = 60):
+        self.directory = directory
+        self.lists = lists or DEFAULT_LISTS
+        self.reload_interval = reload_interval
+        self._tries = {}   # file name -> (v4 trie, v6 trie)
+        self._mtimes = {}
+        self._next_check = 0.0
+        self._reloading = threading.Lock()
+
+    def reload(self) -> list:
+        """Rebuild the tries of lists whose file changed; returns their names."""
+        if not self._reloading.acquire(blocking=False):
+            return []
+        try:
+            changed = []
+            for name, flag in self.lists.items():
+                path = os.path.join(self.directory, name)
+                try:
+                    mtime = os.path.getmtime(path)
+                except OSError:
+                    if self._tries.pop(name, None) is not None:
+                        changed.append(name)
+                    self._mtimes.pop(name, None)
+                    continue
+                if self._mtimes.get(name) == mtime:
+                    continue
+                self._tries[name] = build_tries(path, flag)  # swapped in whole
+                self._mtimes[name] = mtime
+                changed.append(name)
+            return changed
+        finally:
+            self._reloading.release()
+
+    def maybe_reload(self):
+        # never rebuild on the request path: hand it to a background thread
+        now = time.monotonic()
+        if now >= self._next_check:
+            self._next_check = now + self.reload_interval
+            threading.Thread(target=self.reload, daemon=True).start()
+
+    def flags(self, ip: str) -> int:
+        self.maybe_reload()
+        try:
+            addr = ipaddress.ip_address(ip)
+        except ValueError:
+            return 0
+        value = int(addr)
+        found = 0
+        for v4, v6 in list(self._tries.values()):
+            found |= (v4 if addr.version == 4 else v6).lookup(value)
+        return found
+
+    def check(self, ip: str) -> Dict[str, Any]:
+        flags = self.flags(ip)
+        return {
+            "is_tor": bool(flags & TOR),
+            "is_vpn": bool(flags & VPN),
+            "is_hosting": bool(flags & HOSTING),
+            "is_known_bad": bool(flags & KNOWN_BAD),
+            "risk_score": max((w for f, w in RISK_WEIGHTS.items() if flags & f), default=0),
+        }
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            name: {
+                "nodes_v4": len(v4), "nodes_v6": len(v6),
+                "bytes": v4.nbytes() + v6.nbytes(),
+            }
+            for name, (v4, v6) in self._tries.items()
+        }
@@ -21,8 +21,13 @@
 # backend/app/utils/ip_utils.py
 
 from fastapi import Request
+import asyncio
 import requests
 from typing import Optional, Dict, Any
+from app.core.config import settings
+from app.utils.ip_reputation import IPReputation
+
+ip_reputation = IPReputation(settings.IP_REPUTATION_DIR, reload_interval=settings.IP_REPUTATION_RELOAD_INTERVAL)
 
 def get_client_ip(request: Request) -> str:
     """
@@ -44,6 +49,14 @@ def get_client_ip(request: Request) -> str:
 async def get_geolocation(ip_address: str) -> Dict[str, Any]:
     """
     Get geolocation from IP address using free IP-API service
+    (blocking HTTP call runs in a worker thread)
+    """
+    return await asyncio.to_thread(lookup_geolocation, ip_address)
+
+
+def lookup_geolocation(ip_address: str) -> Dict[str, Any]:
+    """
+    Blocking variant of get_geolocation
     """
     if ip_address in ["127.0.0.1", "localhost", "unknown"]:
         return {
@@ -88,19 +101,20 @@ async def get_geolocation(ip_address: str) -> Dict[str, Any]:
     }
 
 
-def check_vpn_tor(ip_address: str) -> Dict[str, bool]:
+def check_vpn_tor(ip_address: str) -> Dict[str, Any]:
     """
-    Check if IP is VPN/Tor (basic check)
-    For production, use services like IPQualityScore or IPHub
+    Check if IP is VPN/Tor/hosting/known-bad using the local CIDR lists
+    (see ip_reputation.py, lists in settings.IP_REPUTATION_DIR)
     """
-    # For now, basic checks
     if ip_address in ["127.0.0.1", "localhost"]:
-        return {"is_vpn": False, "is_tor": False, "is_proxy": False}
-    
-    # TODO: Integrate with VPN detection API in production
+        return {"is_vpn": False, "is_tor": False, "is_proxy": False, "risk_score": 0}
+
+    rep = ip_reputation.check(ip_address)
     return {
-        "is_vpn": False,
-        "is_tor": False,
-        "is_proxy": False,
-        "risk_score": 0,
-    }
\ No newline at end of file
+        "is_vpn": rep["is_vpn"],
+        "is_tor": rep["is_tor"],
+        "is_proxy": rep["is_hosting"],  # datacenter ranges are the usual proxy source
+        "is_hosting": rep["is_hosting"],
+        "is_known_bad": rep["is_known_bad"],
+        "risk_score": rep["risk_score"],
+    }
@@ -0,0 +1,41 @@
+import pytest
+from fastapi import Depends, FastAPI, APIRouter
+from fastapi.testclient import TestClient
+
+from app.core import auth
+from app.core.config import settings
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setattr(settings, "ADMIN_USER_IDS", "aa11")
+    monkeypatch.setattr(settings, "ADMIN_EMAILS", "Ops@Example.com")
+    router = APIRouter(prefix="/admin", dependencies=[Depends(auth.require_admin)])
+
+    @router.get("/ping")
+    def ping():
+        return {"ok": True}
+
+    app = FastAPI()
+    app.include_router(router)
+    return app
+
+
+def call(app, user):
+    app.dependency_overrides[auth.get_current_user] = lambda: user
+    return TestClient(app).get("/admin/ping").status_code
+
+
+def test_regular_user_is_forbidden(client):
+    assert call(client, {"id": "bb22", "email": "user@example.com"}) == 403
+
+
+def test_allow_listed_id_or_email(client):
+    assert call(client, {"id": "AA11"}) == 200
+    assert call(client, {"id": "cc33", "email": "ops@example.com"}) == 200
+
+
+def test_empty_allow_list_admits_nobody(client, monkeypatch):
+    monkeypatch.setattr(settings, "ADMIN_USER_IDS", "")
+    monkeypatch.setattr(settings, "ADMIN_EMAILS", "")
+    assert call(client, {"id": "aa11", "email": "ops@example.com"}) == 403
@@ -0,0 +1,54 @@
+import asyncio
+
+import pytest
+
+from app.services.anomaly_feed import anomaly_feed, sse_events
+
+
+def run(coro):
+    return asyncio.run(asyncio.wait_for(coro, 5))
+
+
+class FakeRequest:
+    async def is_disconnected(self):
+        return True
+
+
+@pytest.fixture(autouse=True)
+def no_redis(monkeypatch):
+    async def listen():
+        await asyncio.Event().wait()
+
+    monkeypatch.setattr(anomaly_feed, "_listen", listen)
+    yield
+    anomaly_feed.subscribers.clear()
+    anomaly_feed._task = None
+
+
+def test_unstarted_stream_never_subscribes():
+    async def scenario():
+        gen = sse_events(FakeRequest(), user_id="u1")
+        await gen.aclose()
+        return len(anomaly_feed.subscribers)
+
+    assert run(scenario()) == 0
+
+
+def test_closed_stream_unsubscribes():
+    async def scenario():
+        gen = sse_events(FakeRequest(), user_id="u1", types={"login"})
+        assert await gen.__anext__() == "retry: 3000\n\n"
+        sub = next(iter(anomaly_feed.subscribers))
+        assert (sub.user_id, sub.types) == ("u1", {"login"})
+        await gen.aclose()
+        return len(anomaly_feed.subscribers), anomaly_feed._task
+
+    assert run(scenario()) == (0, None)
+
+
+def test_disconnect_ends_stream_and_unsubscribes():
+    async def scenario():
+        chunks = [c async for c in sse_events(FakeRequest(), user_id="u1", heartbeat=0.01)]
+        return chunks, len(anomaly_feed.subscribers)
+
+    assert run(scenario()) == (["retry: 3000\n\n"], 0)
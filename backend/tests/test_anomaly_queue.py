@@ -0,0 +1,74 @@
+import math
+
+import fakeredis
+import pytest
+
+import app.db.redis_client as redis_client
+from app.core.dsa import redis_dsa
+from app.core.dsa.redis_dsa import anomaly_priority, DECAY_LANDMARK
+
+
+@pytest.fixture
+def fake_redis(monkeypatch):
+    server = fakeredis.FakeServer()
+    nodes = [fakeredis.FakeRedis(server=server, decode_responses=True)]
+    monkeypatch.setattr(redis_client, "shard_nodes", nodes)
+    monkeypatch.setattr(redis_dsa, "rc", nodes[0])
+    return nodes[0]
+
+
+def decayed(score, ts, now, half_life):
+    return score * 2 ** (-(now - ts) / half_life)
+
+
+def test_priority_order_matches_decayed_score(monkeypatch):
+    half_life = 3600
+    monkeypatch.setattr(redis_dsa, "ANOMALY_DECAY_HALF_LIFE", half_life)
+    now = DECAY_LANDMARK + 10 * 86400
+    entries = [(90, now - 7200), (40, now - 60), (70, now - 1800), (15, now), (99, now - 86400)]
+
+    by_priority = sorted(entries, key=lambda e: anomaly_priority(*e), reverse=True)
+    by_decayed = sorted(entries, key=lambda e: decayed(*e, now, half_life), reverse=True)
+    assert by_priority == by_decayed
+
+    # one half-life later the same score is worth half as much: ln 2 apart
+    assert anomaly_priority(50, now) - anomaly_priority(50, now - half_life) == pytest.approx(math.log(2))
+    assert anomaly_priority(50, now) == pytest.approx(anomaly_priority(100, now - half_life))
+
+
+def test_zero_score_and_disabled_decay(monkeypatch):
+    monkeypatch.setattr(redis_dsa, "ANOMALY_DECAY_HALF_LIFE", 3600)
+    assert math.isfinite(anomaly_priority(0, DECAY_LANDMARK))
+    monkeypatch.setattr(redis_dsa, "ANOMALY_DECAY_HALF_LIFE", 0)
+    assert anomaly_priority(42.5, DECAY_LANDMARK + 1e6) == 42.5
+
+
+def test_queue_is_bounded_and_pops_raw_scores(fake_redis, monkeypatch):
+    monkeypatch.setattr(redis_dsa, "ANOMALY_QUEUE_SHARDS", 2)
+    monkeypatch.setattr(redis_dsa, "ANOMALY_QUEUE_MAX", 4)
+    for i, score in enumerate((10, 80, 30, 95, 5, 60, 70, 20)):
+        redis_dsa.push_anomaly_score(f"a{i}", score, {"user_id": f"u{i}"})
+
+    sizes = [fake_redis.zcard(redis_dsa._queue_key(s)) for s in range(2)]
+    assert all(size <= 2 for size in sizes)
+
+    peeked = redis_dsa.peek_top_anomalies(10)
+    assert [s for _, s in peeked] == sorted((s for _, s in peeked), reverse=True)
+    assert peeked[0] == ("a3", 95.0)
+
+    popped = redis_dsa.pop_top_anomalies(10)
+    assert [(aid, score) for aid, score, _ in popped] == peeked
+    assert popped[0][2] == {"user_id": "u3"}
+    assert redis_dsa.peek_top_anomalies(10) == []
+    for s in range(2):
+        assert fake_redis.hlen(redis_dsa._meta_key(s)) == 0
+
+
+def test_reencode_legacy_entries(fake_redis, monkeypatch):
+    monkeypatch.setattr(redis_dsa, "ANOMALY_QUEUE_SHARDS", 1)
+    redis_dsa.push_anomaly_score("new", 50, {"user_id": "u1"})
+    fake_redis.zadd(redis_dsa._queue_key(0), {"old": 80})  # pre-decay entry: raw score, no meta
+
+    assert redis_dsa.reencode_legacy_priorities() == 1
+    assert redis_dsa.reencode_legacy_priorities() == 0  # shard marked done
+    assert redis_dsa.peek_top_anomalies(2) == [("old", 80.0), ("new", 50.0)]
@@ -0,0 +1,62 @@
+import random
+import ipaddress
+
+from app.utils.ip_reputation import PrefixTrie, IPReputation, TOR, VPN, HOSTING, KNOWN_BAD
+
+
+def brute_force(networks, addr):
+    found = 0
+    for net, flag in networks:
+        if addr in net:
+            found |= flag
+    return found
+
+
+def test_nested_prefixes_report_every_match():
+    trie = PrefixTrie(32)
+    trie.insert(int(ipaddress.ip_address("203.0.0.0")), 16, HOSTING)
+    trie.insert(int(ipaddress.ip_address("203.0.113.7")), 32, TOR)
+
+    def lookup(ip):
+        return trie.lookup(int(ipaddress.ip_address(ip)))
+
+    assert lookup("203.0.113.7") == HOSTING | TOR
+    assert lookup("203.0.113.8") == HOSTING
+    assert lookup("203.1.0.1") == 0
+
+
+def test_matches_brute_force_on_random_prefixes():
+    rng = random.Random(3)
+    for bits, address in ((32, ipaddress.IPv4Address), (128, ipaddress.IPv6Address)):
+        trie = PrefixTrie(bits)
+        networks = []
+        for _ in range(300):
+            length = rng.randint(1 if bits == 32 else 16, bits)
+            net = ipaddress.ip_network((rng.getrandbits(bits), length), strict=False)
+            flag = rng.choice((TOR, VPN, HOSTING, KNOWN_BAD))
+            trie.insert(int(net.network_address), net.prefixlen, flag)
+            networks.append((net, flag))
+
+        probes = [net.network_address for net, _ in networks]
+        probes += [address(rng.getrandbits(bits)) for _ in range(500)]
+        for addr in probes:
+            assert trie.lookup(int(addr)) == brute_force(networks, addr), addr
+
+
+def test_lists_load_and_reload_on_change(tmp_path):
+    (tmp_path / "tor_exit.txt").write_text("# exits\n198.51.100.7\n2001:db8::/32\nnot-an-ip\n")
+    (tmp_path / "hosting.txt").write_text("198.51.100.0/24\n")
+    rep = IPReputation(str(tmp_path))
+    assert sorted(rep.reload()) == ["hosting.txt", "tor_exit.txt"]
+    rep._next_check = float("inf")  # no background reloads during the test
+
+    result = rep.check("198.51.100.7")
+    assert result["is_tor"] and result["is_hosting"] and not result["is_vpn"]
+    assert result["risk_score"] == 60
+    assert rep.check("2001:db8::1")["is_tor"]
+    assert rep.check("garbage")["risk_score"] == 0
+    assert rep.reload() == []  # unchanged files are not rebuilt
+
+    (tmp_path / "hosting.txt").unlink()
+    assert rep.reload() == ["hosting.txt"]
+    assert not rep.check("198.51.100.8")["is_hosting"]
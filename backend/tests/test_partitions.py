@@ -0,0 +1,106 @@
+import asyncio
+
+import pytest
+
+from app.services.partitions import PartitionedExecutor
+
+
+def run(coro):
+    return asyncio.run(asyncio.wait_for(coro, 5))
+
+
+def test_events_for_one_key_run_in_order():
+    async def scenario():
+        ex = PartitionedExecutor("t", partitions=4)
+        seen = []
+
+        def handler(i):
+            async def fn():
+                await asyncio.sleep(0.001 * (5 - i))
+                seen.append(i)
+                return i
+            return fn
+
+        results = await asyncio.gather(*(ex.call("u1", handler(i)) for i in range(5)))
+        await ex.stop()
+        return seen, results
+
+    seen, results = run(scenario())
+    assert seen == [0, 1, 2, 3, 4]
+    assert results == [0, 1, 2, 3, 4]
+
+
+def test_handler_exception_reaches_caller_and_worker_survives():
+    async def scenario():
+        ex = PartitionedExecutor("t", partitions=1)
+
+        async def boom():
+            raise ValueError("bad event")
+
+        async def ok():
+            return "ok"
+
+        with pytest.raises(ValueError):
+            await ex.call("u1", boom)
+        result = await ex.call("u1", ok)
+        errors = ex.snapshot()["detail"][0]["errors"]
+        await ex.stop()
+        return result, errors
+
+    assert run(scenario()) == ("ok", 1)
+
+
+def test_cancelled_handler_resolves_future_and_worker_survives():
+    async def scenario():
+        ex = PartitionedExecutor("t", partitions=1)
+
+        async def cancelled():
+            raise asyncio.CancelledError()
+
+        async def ok():
+            return "ok"
+
+        with pytest.raises(asyncio.CancelledError):
+            await ex.call("u1", cancelled)
+        result = await ex.call("u1", ok)
+        await ex.stop()
+        return result
+
+    assert run(scenario()) == "ok"
+
+
+def test_stop_resolves_running_and_queued_futures():
+    async def scenario():
+        ex = PartitionedExecutor("t", partitions=1)
+        started = asyncio.Event()
+
+        async def slow():
+            started.set()
+            await asyncio.sleep(60)
+
+        running = await ex.submit("u1", slow)
+        queued = await ex.submit("u1", slow)
+        await started.wait()
+        await ex.stop(timeout=0.05)
+        return running, queued
+
+    running, queued = run(scenario())
+    assert running.cancelled()
+    assert queued.cancelled()
+
+
+def test_resize_keeps_serving():
+    async def scenario():
+        ex = PartitionedExecutor("t", partitions=2)
+
+        async def ok():
+            return 1
+
+        await ex.call("a", ok)
+        await ex.resize(5)
+        total = sum(await asyncio.gather(*(ex.call(str(i), ok) for i in range(20))))
+        partitions = ex.snapshot()["partitions"]
+        await ex.stop()
+        return total, partitions
+
+    assert run(scenario()) == (20, 5)
@@ -0,0 +1,71 @@
+import random
+
+import pytest
+
+from app.core.dsa.quantile_sketch import AmountSketch, blended_percentile, COUNT_FIELD, DEFAULT_ALPHA
+
+
+def exact_quantile(values, q):
+    values = sorted(values)
+    return values[int(q * (len(values) - 1))]
+
+
+def test_quantiles_within_relative_error():
+    rng = random.Random(7)
+    values = [rng.lognormvariate(4, 1.5) for _ in range(20_000)]
+    sketch = AmountSketch()
+    for v in values:
+        sketch.add(v)
+
+    for q in (0.01, 0.25, 0.5, 0.9, 0.99):
+        exact = exact_quantile(values, q)
+        assert abs(sketch.quantile(q) - exact) <= DEFAULT_ALPHA * exact * 1.01
+
+
+def test_percentile_rank_and_zero_bucket():
+    sketch = AmountSketch()
+    for v in (0, 0.001, 10, 20, 30, 40):
+        sketch.add(v)
+    assert sketch.percentile(1000) == 100.0
+    assert sketch.percentile(0) == pytest.approx(100 * 1 / 6)  # two zero-bucket values, mid-rank
+    assert sketch.percentile(20) == pytest.approx(100 * 3.5 / 6)
+    assert AmountSketch().percentile(5) is None
+    assert AmountSketch().quantile(0.5) is None
+
+
+def test_merge_equals_sketch_of_union():
+    a, b, both = AmountSketch(), AmountSketch(), AmountSketch()
+    for i in range(1, 200):
+        (a if i % 2 else b).add(i * 1.5)
+        both.add(i * 1.5)
+    assert a.merge(b).buckets == both.buckets
+
+    with pytest.raises(ValueError):
+        a.merge(AmountSketch(alpha=0.05))
+
+
+def test_redis_hash_round_trip():
+    sketch = AmountSketch()
+    for v in (0, 5, 5, 120.5):
+        sketch.add(v)
+    data = {k: str(v) for k, v in sketch.to_hash().items()}  # Redis hands back strings
+    assert data[COUNT_FIELD] == "4"
+    restored = AmountSketch.from_hash(data)
+    assert restored.buckets == sketch.buckets
+    assert AmountSketch.from_hash(None).count == 0
+
+
+def test_blended_percentile_leans_on_population_for_new_users():
+    population, user = AmountSketch(), AmountSketch()
+    for v in range(1, 101):
+        population.add(v)
+    assert blended_percentile(user, population, 50) == population.percentile(50)
+
+    for _ in range(5):
+        user.add(1000)
+    expected = 0.25 * user.percentile(50) + 0.75 * population.percentile(50)
+    assert blended_percentile(user, population, 50) == pytest.approx(expected)
+
+    for _ in range(15):
+        user.add(1000)
+    assert blended_percentile(user, population, 50) == user.percentile(50)
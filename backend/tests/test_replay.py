@@ -0,0 +1,49 @@
+import queue
+from pathlib import Path
+import multiprocessing as mp
+from datetime import datetime
+
+import pytest
+
+from app.services.replay import _partition_worker, _collect, _merge_reports
+
+RULES = str(Path(__file__).resolve().parents[1] / "rules.json")
+
+
+def test_worker_counts_bad_events_and_keeps_going():
+    inbox, outbox = queue.Queue(), queue.Queue()
+    good = {"user_id": "u1", "transaction_date": datetime(2025, 11, 1, 12), "amount": 10.0,
+            "category": "food", "device_id": "d1", "ip": "10.0.0.1", "is_anomaly": False}
+    inbox.put([
+        ("transaction", {"user_id": "u1", "amount": 5.0}),  # no transaction_date
+        ("transaction", good),
+        ("login", {"email": "a@b.c", "login_time": "not a date"}),
+    ])
+    inbox.put(None)
+
+    _partition_worker(RULES, "is_anomaly", inbox, outbox)
+    report = outbox.get_nowait()
+
+    txn = report["transaction"]
+    assert txn["errors"] == 1
+    assert txn["error_samples"][0].startswith("KeyError")
+    assert txn["tn"] + txn["fp"] == 1
+    assert report["login"]["errors"] == 1
+
+    merged = _merge_reports([report, report])
+    assert merged["transaction"]["errors"] == 2
+
+
+def _exit_with(code):
+    raise SystemExit(code)
+
+
+def test_collect_raises_when_a_worker_dies():
+    ctx = mp.get_context("spawn")
+    outbox = ctx.Queue()
+    proc = ctx.Process(target=_exit_with, args=(3,), daemon=True)
+    proc.start()
+    proc.join(10)
+
+    with pytest.raises(RuntimeError, match="exit code 3"):
+        _collect(outbox, [proc])
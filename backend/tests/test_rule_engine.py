@@ -0,0 +1,87 @@
+import json
+
+import numpy as np
+import pytest
+
+from app.services.rule_engine import RuleEngine, Rule, RuleSyntaxError
+
+
+def write_rules(path, rules, threshold=50):
+    path.write_text(json.dumps({"threshold": threshold, "rules": rules}))
+
+
+@pytest.fixture
+def engine(tmp_path):
+    path = tmp_path / "rules.json"
+    write_rules(path, [{"id": "big", "when": "amount > 1000", "score": 60, "events": ["transaction"]}])
+    return RuleEngine(str(path), reload_interval=3600)
+
+
+def test_missing_feature_inside_arithmetic_is_no_hit(engine):
+    rule = Rule({"id": "double", "when": "amount * 2 > 100", "score": 10})
+    assert rule.matches({"amount": None}) is False
+    assert rule.matches({"amount": 60}) is True
+
+
+def test_division_by_zero_is_counted_not_raised():
+    rule = Rule({"id": "rate", "when": "amount / transaction_duration > 100", "score": 10})
+    assert rule.matches({"amount": 500, "transaction_duration": 0}) is False
+    assert rule.errors == 1
+    assert rule.last_error.startswith("ZeroDivisionError")
+
+
+def test_type_error_is_counted_in_scalar_and_vector_paths():
+    rule = Rule({"id": "cmp", "when": "category > 5", "score": 10})
+    assert rule.matches({"category": "shopping"}) is False
+    mask = rule.vector_mask({"category": np.asarray(["shopping", "food"])}, 2)
+    assert not mask.any()
+    assert rule.errors == 2
+
+
+def test_evaluate_keeps_scoring_other_rules(engine):
+    bad = Rule({"id": "rate", "when": "amount / transaction_duration > 1", "score": 30})
+    engine.rules.append(bad)
+    result = engine.evaluate("transaction", {"amount": 5000, "transaction_duration": 0})
+    assert result.reasons == {"big": 60}
+    assert result.is_anomaly
+    stats = {r["id"]: r for r in engine.stats()["rules"]}
+    assert stats["rate"]["errors"] == 1
+
+
+def test_evaluate_batch_survives_vector_errors(engine):
+    engine.rules.append(Rule({"id": "cmp", "when": "category > 5", "score": 30}))
+    out = engine.evaluate_batch("transaction", {
+        "amount": np.asarray([5000.0, 10.0]),
+        "category": np.asarray(["a", "b"]),
+    })
+    assert out["scores"].tolist() == [60, 0]
+    assert not out["hits"]["cmp"].any()
+
+
+def test_reload_rejects_rule_failing_dry_run(engine, tmp_path):
+    write_rules(tmp_path / "rules.json", [{"id": "cmp", "when": "category > 5", "score": 30}])
+    assert engine.reload(force=True) is False
+    assert "cmp" in engine.last_error
+    assert [r.id for r in engine.rules] == ["big"]
+
+
+def test_reload_rejects_non_string_when(engine, tmp_path):
+    write_rules(tmp_path / "rules.json", [{"id": "x", "when": 5}])
+    assert engine.reload(force=True) is False
+    assert [r.id for r in engine.rules] == ["big"]
+
+
+def test_unknown_feature_passes_dry_run():
+    Rule({"id": "later", "when": "not_computed_yet > 1", "score": 5}).dry_run()
+
+
+def test_bad_syntax():
+    with pytest.raises(RuleSyntaxError):
+        Rule({"id": "x", "when": "__import__('os')", "score": 1})
+
+
+def test_repo_rules_file_loads():
+    import os
+    path = os.path.join(os.path.dirname(os.path.dirname(__file__)), "rules.json")
+    engine = RuleEngine(path)
+    assert engine.last_error is None and engine.rules
@@ -0,0 +1,70 @@
+import asyncio
+
+from app.services.timeseries_migration import migrate_collection
+
+
+def run(coro):
+    return asyncio.run(asyncio.wait_for(coro, 5))
+
+
+class FakeCursor:
+    def __init__(self, items):
+        self.items = items
+
+    async def to_list(self, length=None):
+        return self.items[:length] if length else self.items
+
+
+class FakeCollection:
+    def __init__(self, db, name):
+        self.db, self.name = db, name
+
+    async def create_index(self, keys, **kwargs):
+        self.db.calls.append(("create_index", self.name, keys))
+
+    async def index_information(self):
+        return {}
+
+    async def rename(self, new_name):
+        self.db.calls.append(("rename", self.name, new_name))
+        self.db.collections[new_name] = self.db.collections.pop(self.name)
+
+
+class FakeDB:
+    """Just enough of a Motor database for the storage / index setup."""
+
+    def __init__(self, collections: dict):
+        self.collections = dict(collections)  # name -> "collection" | "timeseries"
+        self.calls = []
+
+    def __getitem__(self, name):
+        return FakeCollection(self, name)
+
+    def __getattr__(self, name):
+        return FakeCollection(self, name)
+
+    async def list_collection_names(self):
+        return list(self.collections)
+
+    async def list_collections(self, filter):
+        name = filter["name"]
+        return FakeCursor([{"name": name, "type": self.collections[name]}] if name in self.collections else [])
+
+    async def create_collection(self, name, **opts):
+        self.calls.append(("create_collection", name))
+        self.collections[name] = "timeseries" if "timeseries" in opts else "collection"
+
+    async def command(self, cmd, name, **kwargs):
+        self.calls.append((cmd, name))
+
+
+def test_migration_only_touches_its_collection(capsys):
+    db = FakeDB({"transactions": "collection", "anomaly_logs": "collection"})
+
+    assert run(migrate_collection(db, "login_logs", retention_days=0)) == 0
+
+    touched = {call[1] for call in db.calls}
+    assert touched == {"login_logs"}
+    assert ("create_collection", "login_logs") in db.calls
+    assert db.collections["transactions"] == "collection"
+    assert "transactions is a plain collection" not in capsys.readouterr().out
@@ -0,0 +1,96 @@
+import asyncio
+import threading
+
+from app.core.dsa.user_state_cache import UserStateCache, MISSING
+
+
+def run(coro):
+    return asyncio.run(asyncio.wait_for(coro, 5))
+
+
+def test_get_loads_once_then_hits():
+    cache = UserStateCache()
+    calls = []
+
+    def loader():
+        calls.append(1)
+        return "dev-1"
+
+    assert cache.get("u1", "last_device", loader) == "dev-1"
+    assert cache.get("u1", "last_device", loader) == "dev-1"
+    assert len(calls) == 1
+    assert cache.stats["last_device"] == {"hits": 1, "misses": 1}
+
+
+def test_put_during_load_is_not_overwritten():
+    cache = UserStateCache()
+    loading, release = threading.Event(), threading.Event()
+
+    def slow_loader():
+        loading.set()
+        release.wait(5)
+        return "stale"
+
+    result = {}
+    reader = threading.Thread(target=lambda: result.update(v=cache.get("u1", "last_ip", slow_loader)))
+    reader.start()
+    assert loading.wait(5)
+    cache.put("u1", "last_ip", "fresh")
+    release.set()
+    reader.join(5)
+
+    assert result["v"] == "fresh"
+    assert cache.peek("u1", "last_ip") == "fresh"
+
+
+def test_invalidate_during_load_drops_loaded_value():
+    cache = UserStateCache()
+
+    async def scenario():
+        loading, release = asyncio.Event(), asyncio.Event()
+
+        async def slow_loader():
+            loading.set()
+            await release.wait()
+            return 3
+
+        task = asyncio.create_task(cache.aget("u1", "login_count", slow_loader))
+        await loading.wait()
+        cache.invalidate("u1")
+        release.set()
+        return await task
+
+    # the caller still gets what it loaded; the cache does not keep it
+    assert run(scenario()) == 3
+    assert cache.peek("u1", "login_count") is MISSING
+
+
+def test_unrelated_fields_still_fill():
+    cache = UserStateCache()
+    cache.put("u1", "last_ip", "1.2.3.4")
+    assert cache.get("u1", "last_device", lambda: "dev-1") == "dev-1"
+    assert cache.peek("u1", "last_device") == "dev-1"
+
+
+def test_byte_budget_holds_under_concurrent_writers():
+    cache = UserStateCache(max_bytes=20_000)
+
+    def worker(n):
+        for i in range(500):
+            uid = f"u{(n * 500 + i) % 300}"
+            if i % 3:
+                cache.put(uid, "last_device", f"dev-{i}")
+            else:
+                cache.get(uid, "last_ip", lambda: f"10.0.0.{i % 250}")
+            if i % 50 == 0:
+                cache.invalidate(uid)
+
+    threads = [threading.Thread(target=worker, args=(n,)) for n in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join(10)
+
+    assert cache.bytes <= cache.max_bytes
+    assert cache.bytes == sum(rec.size for rec in cache._data.values())
+    assert cache.evictions > 0